@@ -1,89 +1,171 @@
-from typing import TypedDict, List
+"""Compiled LangGraph workflow over the five agent tools.
+
+`route` classifies the message and names the HCP, then sends it to the
+tool nodes it needs. Nodes in the same step run concurrently: a
+suggestion request fetches the HCP's history and the interaction trends in
+parallel, and suggest_next_actions runs once both are in. `respond`
+formats the reply from whatever the tools returned.
+
+The graph is compiled once, at import. Every node's wall time is recorded
+in crm_agent_node_duration_seconds and returned in the state's `timings`
+(milliseconds per node).
+"""
+from typing import Annotated, Any, Dict, List, TypedDict
+import operator
+import os
+import sys
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langgraph.graph import StateGraph, START, END
+from intent_router import classify_intent, LOG_INTERACTION, VIEW_HISTORY, GET_SUGGESTIONS, ANALYZE_TRENDS
+from metrics import AGENT_NODE_SECONDS
 from tools import (
     log_interaction,
-    edit_interaction, 
+    edit_interaction,
     get_hcp_history,
     analyze_interaction_trends,
     suggest_next_actions
 )
 
-class AgentState(TypedDict):
+TREND_DAYS = 30
+
+def merge_timings(left, right):
+    return {**left, **right}
+
+class AgentState(TypedDict, total=False):
     input: str
+    intent: str
+    hcp_name: str
+    logged: Dict[str, Any]
+    history: Dict[str, Any]
+    trends: Dict[str, Any]
+    suggestions: Dict[str, Any]
     response: str
-    tools_used: List[str]
-
-def simple_agent(user_input: str):
-    """
-    Simple agent that processes user input and returns appropriate response
-    """
-    user_input_lower = user_input.lower()
-    
-    if "log" in user_input_lower or "met with" in user_input_lower:
-        # Extract HCP name (simple approach)
-        words = user_input.split()
-        hcp_name = "Dr. Unknown"
-        for i, word in enumerate(words):
-            if word.lower() in ["dr.", "dr", "doctor"] and i + 1 < len(words):
-                hcp_name = f"Dr. {words[i + 1]}"
-                break
-        
-        result = log_interaction.invoke({
-            "raw_input": user_input,
-            "hcp_name": hcp_name,
-            "interaction_type": "visit"
-        })
-        
+    current_action: str
+    # Written by nodes that run in the same step, so updates are combined rather than overwritten
+    tools_used: Annotated[List[str], operator.add]
+    timings: Annotated[Dict[str, float], merge_timings]
+
+def extract_hcp_name(user_input):
+    """ "Dr. <word after Dr/Doctor>", or "Dr. Unknown" """
+    words = user_input.split()
+    for i, word in enumerate(words):
+        if word.lower() in ["dr.", "dr", "doctor"] and i + 1 < len(words):
+            return f"Dr. {words[i + 1]}"
+    return "Dr. Unknown"
+
+def route(state):
+    intent = classify_intent(state["input"])
+    update = {"intent": intent}
+    if intent in (LOG_INTERACTION, VIEW_HISTORY, GET_SUGGESTIONS):
+        update["hcp_name"] = extract_hcp_name(state["input"])
+    return update
+
+def run_log_interaction(state):
+    result = log_interaction.invoke({
+        "raw_input": state["input"],
+        "hcp_name": state["hcp_name"],
+        "interaction_type": "visit"
+    })
+    return {"logged": result, "tools_used": ["log_interaction"]}
+
+def run_get_hcp_history(state):
+    result = get_hcp_history.invoke({"hcp_name": state["hcp_name"]})
+    return {"history": result, "tools_used": ["get_hcp_history"]}
+
+def run_analyze_interaction_trends(state):
+    result = analyze_interaction_trends.invoke({"days": TREND_DAYS})
+    return {"trends": result, "tools_used": ["analyze_interaction_trends"]}
+
+def run_suggest_next_actions(state):
+    history, trends = state.get("history", {}), state.get("trends", {})
+    result = suggest_next_actions.invoke({
+        "hcp_name": state["hcp_name"],
+        "recent_interactions": history.get("interactions", []),
+        "trend_summary": trends.get("ai_analysis")
+    })
+    return {"suggestions": result, "tools_used": ["suggest_next_actions"]}
+
+def respond(state):
+    intent = state["intent"]
+    hcp_name = state.get("hcp_name")
+    if intent == LOG_INTERACTION:
+        result = state["logged"]
+        if result["status"] != "success":
+            return {"response": f"❌ Could not log the interaction: {result['message']}", "current_action": "log_new"}
         return {
             "response": f"✅ Logged interaction with {hcp_name}. Summary: {result['extracted_data']['summary']}",
-            "tools_used": ["log_interaction"],
             "current_action": "log_new"
         }
-    
-    elif "history" in user_input_lower or "show" in user_input_lower:
-        # Extract HCP name
-        words = user_input.split()
-        hcp_name = "Dr. Unknown"
-        for i, word in enumerate(words):
-            if word.lower() in ["dr.", "dr", "doctor"] and i + 1 < len(words):
-                hcp_name = f"Dr. {words[i + 1]}"
-                break
-        
-        result = get_hcp_history.invoke({"hcp_name": hcp_name})
-        
+    if intent == VIEW_HISTORY:
+        result = state["history"]
+        if result["status"] != "success":
+            return {"response": f"❌ Could not load history for {hcp_name}: {result['message']}",
+                    "current_action": "view_history"}
         return {
             "response": f"📋 History for {hcp_name}: {result['total_interactions']} interactions found. {result['ai_insights']}",
-            "tools_used": ["get_hcp_history"],
             "current_action": "view_history"
         }
-    
-    elif "suggest" in user_input_lower or "next" in user_input_lower:
-        # Extract HCP name
-        words = user_input.split()
-        hcp_name = "Dr. Unknown"
-        for i, word in enumerate(words):
-            if word.lower() in ["dr.", "dr", "doctor"] and i + 1 < len(words):
-                hcp_name = f"Dr. {words[i + 1]}"
-                break
-        
-        result = suggest_next_actions.invoke({"hcp_name": hcp_name})
-        
+    if intent == GET_SUGGESTIONS:
+        result = state["suggestions"]
         return {
-            "response": f"💡 Suggestions for {hcp_name}: {result['ai_suggestions']}",
-            "tools_used": ["suggest_next_actions"],
+            "response": f"💡 Suggestions for {hcp_name}: {result.get('ai_suggestions', result.get('message'))}",
             "current_action": "get_suggestions"
         }
-    
-    else:
+    if intent == ANALYZE_TRENDS:
+        result = state["trends"]
         return {
-            "response": "👋 Hi! I can help you log HCP interactions. Try: 'I met with Dr. Smith today' or 'Show history for Dr. Johnson'",
-            "tools_used": [],
-            "current_action": "general_chat"
+            "response": f"📈 Trends: {result.get('ai_analysis', result.get('message'))}",
+            "current_action": "analyze_trends"
         }
+    return {
+        "response": "👋 Hi! I can help you log HCP interactions. Try: 'I met with Dr. Smith today' or 'Show history for Dr. Johnson'",
+        "current_action": "general_chat"
+    }
+
+def timed(name, fn):
+    """Node that runs `fn` and records its wall time"""
+    def node(state):
+        start = time.perf_counter()
+        update = fn(state)
+        elapsed = time.perf_counter() - start
+        AGENT_NODE_SECONDS.observe(elapsed, name)
+        return dict(update, timings={name: round(elapsed * 1000, 3)})
+    return node
+
+# Tool nodes each intent starts from; more than one run concurrently
+INTENT_NODES = {
+    LOG_INTERACTION: ["log_interaction"],
+    VIEW_HISTORY: ["get_hcp_history"],
+    GET_SUGGESTIONS: ["get_hcp_history", "analyze_interaction_trends"],
+    ANALYZE_TRENDS: ["analyze_interaction_trends"],
+}
+
+def after_route(state):
+    return INTENT_NODES.get(state["intent"], ["respond"])
+
+def after_fetch(state):
+    return "suggest_next_actions" if state["intent"] == GET_SUGGESTIONS else "respond"
 
-# Simple graph simulation
-class InteractionGraph:
-    def invoke(self, state):
-        user_input = state.get("input", "")
-        return simple_agent(user_input)
+def build_graph():
+    graph = StateGraph(AgentState)
+    for name, fn in (("route", route),
+                     ("log_interaction", run_log_interaction),
+                     ("get_hcp_history", run_get_hcp_history),
+                     ("analyze_interaction_trends", run_analyze_interaction_trends),
+                     ("suggest_next_actions", run_suggest_next_actions),
+                     ("respond", respond)):
+        graph.add_node(name, timed(name, fn))
+    graph.add_edge(START, "route")
+    graph.add_conditional_edges("route", after_route,
+                                ["log_interaction", "get_hcp_history", "analyze_interaction_trends", "respond"])
+    # History and trends finish in the same step, so suggest_next_actions runs once with both
+    for name in ("get_hcp_history", "analyze_interaction_trends"):
+        graph.add_conditional_edges(name, after_fetch, ["suggest_next_actions", "respond"])
+    graph.add_edge("log_interaction", "respond")
+    graph.add_edge("suggest_next_actions", "respond")
+    graph.add_edge("respond", END)
+    return graph.compile()
 
-interaction_graph = InteractionGraph()
\ No newline at end of file
+interaction_graph = build_graph()
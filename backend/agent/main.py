@@ -1,7 +1,9 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from pydantic import BaseModel
 from langgraph_agent import interaction_graph
+from metrics import registry
 
 app = FastAPI(title="AI-First CRM HCP Module")
 
@@ -28,7 +30,8 @@ async def root():
 @app.post("/chat")
 async def chat_endpoint(message: ChatMessage):
     try:
-        result = interaction_graph.invoke({"input": message.message})
+        # Tool nodes run in worker threads, so the event loop stays free while they query the database
+        result = await interaction_graph.ainvoke({"input": message.message})
         return {
             "response": result["response"],
             "action_taken": result["current_action"],
@@ -44,7 +47,7 @@ async def chat_endpoint(message: ChatMessage):
 @app.post("/log-interaction")
 async def log_interaction_endpoint(input_data: InteractionInput):
     try:
-        result = interaction_graph.invoke({"input": input_data.input})
+        result = await interaction_graph.ainvoke({"input": input_data.input})
         return {
             "status": "success",
             "response": result["response"],
@@ -57,6 +60,10 @@ async def log_interaction_endpoint(input_data: InteractionInput):
             "tools_used": []
         }
 
+@app.get("/metrics")
+async def metrics_endpoint():
+    return PlainTextResponse(registry.exposition(), media_type="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
     import uvicorn
     print("🚀 Starting AI-First CRM Backend...")
@@ -1,6 +1,24 @@
 from langchain.tools import tool
-from typing import Dict, Any
+from typing import Any, Dict, List, Optional
 import json
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from history_service import fetch_hcp_history
+from analytics_service import TrendAnalytics, trend_insights
+from hcp_resolver import HCPResolver
+
+# Closed days are cached across tool calls
+trend_analytics = TrendAnalytics()
+# Profile names, so "dr smyth" finds Dr. Smith's history
+hcp_resolver = HCPResolver()
+
+
+def canonical_name(hcp_name):
+    """The profile name an HCP name resolves to; new and merged profiles are picked up every refresh_seconds"""
+    hcp_resolver.load_if_due()
+    return hcp_resolver.canonical_name(hcp_name)
 
 @tool
 def log_interaction(raw_input: str, hcp_name: str, interaction_type: str = "visit") -> Dict[str, Any]:
@@ -43,26 +61,28 @@ def edit_interaction(interaction_id: int, updated_notes: str = None, updated_sum
         return {"status": "error", "message": str(e)}
 
 @tool
-def get_hcp_history(hcp_name: str, limit: int = 10) -> Dict[str, Any]:
+def get_hcp_history(hcp_name: str, limit: int = 10, cursor: str = None) -> Dict[str, Any]:
     """
     Fetch comprehensive interaction history for an HCP.
     """
     try:
-        mock_interactions = [{
-            "id": 1,
-            "date": "2024-01-17T10:00:00",
-            "type": "visit",
-            "summary": f"Previous interaction with {hcp_name}",
-            "sentiment": "positive",
-            "priority": "medium"
-        }]
+        hcp_name = canonical_name(hcp_name)
+        history = fetch_hcp_history(hcp_name, limit, cursor)
+        interactions = history["interactions"]
+        
+        if interactions:
+            latest = interactions[0]
+            ai_insights = f"Last interaction with {hcp_name} was {latest['sentiment'] or 'neutral'}. Next action: {latest['next_action'] or 'none recorded'}."
+        else:
+            ai_insights = f"No recorded interactions with {hcp_name} yet."
         
         return {
             "status": "success",
             "hcp_name": hcp_name,
-            "total_interactions": 1,
-            "interactions": mock_interactions,
-            "ai_insights": f"Good relationship with {hcp_name}. Regular engagement recommended."
+            "total_interactions": len(interactions),
+            "interactions": interactions,
+            "next_cursor": history["next_cursor"],
+            "ai_insights": ai_insights
         }
     except Exception as e:
         return {"status": "error", "message": str(e)}
@@ -73,41 +93,51 @@ def analyze_interaction_trends(days: int = 30) -> Dict[str, Any]:
     Analyze interaction trends and patterns using AI for strategic insights.
     """
     try:
-        trend_data = {
-            "total_interactions": 5,
-            "sentiment_distribution": {"positive": 3, "neutral": 2},
-            "interaction_types": {"visit": 3, "call": 2},
-            "priority_levels": {"high": 1, "medium": 3, "low": 1}
-        }
-        
+        trend_data = trend_analytics.report(days)
+
         return {
             "status": "success",
             "period_days": days,
             "raw_data": trend_data,
-            "ai_analysis": "Overall positive trend in interactions. Engagement levels are good."
+            "ai_analysis": trend_insights(trend_data)
         }
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
 @tool
-def suggest_next_actions(hcp_name: str) -> Dict[str, Any]:
+def suggest_next_actions(hcp_name: str, recent_interactions: Optional[List[Dict[str, Any]]] = None,
+                         trend_summary: Optional[str] = None) -> Dict[str, Any]:
     """
     AI-powered suggestions for next actions based on HCP interaction history.
+    recent_interactions (newest first, as get_hcp_history returns them) and
+    trend_summary (from analyze_interaction_trends) are optional.
     """
     try:
-        suggestions = f"""
-        Suggested actions for {hcp_name}:
-        1. Schedule follow-up visit within 2 weeks
-        2. Send product information via email
-        3. Invite to upcoming medical conference
-        4. Arrange product demonstration
-        """
+        hcp_name = canonical_name(hcp_name)
+        recent_interactions = recent_interactions or []
+        actions = []
+        if recent_interactions:
+            latest = recent_interactions[0]
+            if latest.get("sentiment") == "negative":
+                actions.append(f"Address the concerns raised in the last {latest.get('type') or 'interaction'}")
+            if latest.get("next_action"):
+                actions.append(f"Follow up on: {latest['next_action']}")
+        actions += [
+            "Schedule follow-up visit within 2 weeks",
+            "Send product information via email",
+            "Invite to upcoming medical conference",
+            "Arrange product demonstration",
+        ]
+        suggestions = f"Suggested actions for {hcp_name}:\n" + "\n".join(
+            f"{i}. {action}" for i, action in enumerate(actions, 1))
+        if trend_summary:
+            suggestions += f"\nAcross all HCPs: {trend_summary}"
         
         return {
             "status": "success",
             "hcp_name": hcp_name,
             "ai_suggestions": suggestions,
-            "based_on_interactions": 3
+            "based_on_interactions": len(recent_interactions)
         }
     except Exception as e:
         return {"status": "error", "message": str(e)}
\ No newline at end of file
@@ -3,8 +3,9 @@ from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 import uvicorn
 import os
-from groq import Groq
-import json
+from llm_client import LLMClient
+from json_extractor import extract_analysis
+from intent_router import classify_intent, LOG_INTERACTION, VIEW_HISTORY, GET_SUGGESTIONS
 
 app = FastAPI(title="AI-First CRM HCP Module")
 
@@ -16,8 +17,12 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize Groq client
-client = Groq(api_key="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")
+# Initialize shared async Groq client
+client = LLMClient(api_key=os.getenv("GROQ_API_KEY", "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"))
+
+@app.on_event("shutdown")
+async def close_client():
+    await client.aclose()
 
 class ChatMessage(BaseModel):
     message: str
@@ -30,7 +35,7 @@ def extract_hcp_name(text):
             return f"Dr. {words[i + 1]}"
     return "Dr. Unknown"
 
-def analyze_with_ai(user_input, hcp_name):
+async def analyze_with_ai(user_input, hcp_name):
     """Use Groq AI to analyze the interaction"""
     try:
         prompt = f"""
@@ -49,28 +54,30 @@ def analyze_with_ai(user_input, hcp_name):
         Return only valid JSON, no other text.
         """
         
-        response = client.chat.completions.create(
-            messages=[{"role": "user", "content": prompt}],
+        response = await client.complete(
+            prompt,
             model="gemma2-9b-it",
             temperature=0.1,
             max_tokens=500
         )
         
-        ai_response = response.choices[0].message.content.strip()
-        
-        # Try to parse JSON
-        try:
-            return json.loads(ai_response)
-        except:
-            # Fallback if JSON parsing fails
-            return {
-                "summary": f"Interaction with {hcp_name}: {user_input[:100]}...",
-                "key_topics": ["discussion", "follow-up"],
-                "sentiment": "positive",
-                "next_action": "Schedule follow-up meeting",
-                "priority_level": "medium",
-                "specialty": "General Medicine"
-            }
+        # Repair and validate the JSON; anything missing comes from the fallback
+        analysis = extract_analysis(response, {
+            "summary": f"Interaction with {hcp_name}: {user_input[:100]}...",
+            "topics": ["discussion", "follow-up"],
+            "sentiment": "positive",
+            "next_action": "Schedule follow-up meeting",
+            "priority": "medium",
+            "specialty": "General Medicine"
+        })
+        return {
+            "summary": analysis["summary"],
+            "key_topics": analysis["topics"],
+            "sentiment": analysis["sentiment"],
+            "next_action": analysis["next_action"],
+            "priority_level": analysis["priority"],
+            "specialty": analysis["specialty"]
+        }
             
     except Exception as e:
         print(f"AI Error: {e}")
@@ -83,13 +90,13 @@ def analyze_with_ai(user_input, hcp_name):
             "specialty": "General Medicine"
         }
 
-def process_message(user_input):
+async def process_message(user_input):
     """Process user message with AI"""
-    user_input_lower = user_input.lower()
+    intent = classify_intent(user_input)
     
-    if "log" in user_input_lower or "met with" in user_input_lower or "visit" in user_input_lower:
+    if intent == LOG_INTERACTION:
         hcp_name = extract_hcp_name(user_input)
-        ai_analysis = analyze_with_ai(user_input, hcp_name)
+        ai_analysis = await analyze_with_ai(user_input, hcp_name)
         
         return {
             "response": f"✅ Interaction logged with {hcp_name}!\n\n📋 **Summary:** {ai_analysis['summary']}\n🎯 **Sentiment:** {ai_analysis['sentiment']}\n⚡ **Priority:** {ai_analysis['priority_level']}\n🔄 **Next Action:** {ai_analysis['next_action']}\n🏥 **Specialty:** {ai_analysis['specialty']}",
@@ -97,7 +104,7 @@ def process_message(user_input):
             "tools_used": ["log_interaction"]
         }
     
-    elif "history" in user_input_lower or "show" in user_input_lower:
+    elif intent == VIEW_HISTORY:
         hcp_name = extract_hcp_name(user_input)
         
         return {
@@ -106,7 +113,7 @@ def process_message(user_input):
             "tools_used": ["get_hcp_history"]
         }
     
-    elif "suggest" in user_input_lower or "next" in user_input_lower:
+    elif intent == GET_SUGGESTIONS:
         hcp_name = extract_hcp_name(user_input)
         
         return {
@@ -129,7 +136,7 @@ async def root():
 @app.post("/chat")
 async def chat_endpoint(message: ChatMessage):
     try:
-        result = process_message(message.message)
+        result = await process_message(message.message)
         return result
     except Exception as e:
         return {
@@ -141,7 +148,7 @@ async def chat_endpoint(message: ChatMessage):
 @app.post("/log-interaction")
 async def log_interaction_endpoint(message: ChatMessage):
     try:
-        result = process_message(message.message)
+        result = await process_message(message.message)
         return {
             "status": "success",
             "response": result["response"],
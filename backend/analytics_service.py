@@ -0,0 +1,337 @@
+"""Interaction trend analytics over a date window.
+
+A report counts interactions by sentiment, interaction type and priority,
+breaks sentiment down per territory and per specialty, and rolls the
+window up per week. Counts are kept per UTC day. A day that has ended is a
+closed bucket: it is counted once and cached, so a repeated report only
+recomputes today. Closed days are re-read after ANALYTICS_CLOSED_TTL
+seconds, which picks up backfilled or edited rows.
+
+The database path pushes the counting down to the database: per run of
+uncached days, one statement counts each day from the covering
+ix_hcp_interactions_day_rollup index and returns it grouped by
+(territory, specialty, sentiment) and by (type, priority). That is about
+150 rows per day instead of one row per combination of all five
+dimensions.
+
+The columnar path computes the same report from NumPy arrays, for exports
+that are analysed away from the database:
+python analytics_service.py --days 365 --export trends.npz
+python analytics_service.py --days 365 --from-export trends.npz
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from collections import Counter, OrderedDict, defaultdict
+from datetime import date, datetime, timedelta
+import numpy as np
+from sqlalchemy import func, literal, null, select, union_all
+from models import HCPInteraction, SessionLocal
+
+ANALYTICS_MAX_DAYS = int(os.getenv("ANALYTICS_MAX_DAYS", "731"))
+ANALYTICS_CLOSED_TTL = float(os.getenv("ANALYTICS_CLOSED_TTL", "3600"))
+# Closed days kept in memory; one day is a few dozen counters
+ANALYTICS_CACHE_DAYS = int(os.getenv("ANALYTICS_CACHE_DAYS", "2000"))
+
+DIMENSIONS = ("sentiment", "interaction_type", "priority_level", "territory", "hcp_specialty")
+UNKNOWN = "unknown"
+
+
+def window_days(days, end=None):
+    """First and last UTC day of a window of `days` days ending on `end`'s day"""
+    days = int(days)
+    if not 1 <= days <= ANALYTICS_MAX_DAYS:
+        raise ValueError(f"days must be between 1 and {ANALYTICS_MAX_DAYS}")
+    last_day = (end or datetime.utcnow()).date()
+    return last_day - timedelta(days=days - 1), last_day
+
+
+def as_day(value):
+    """func.date() comes back as text on SQLite and MySQL and as a date on PostgreSQL"""
+    return value if isinstance(value, date) else date.fromisoformat(str(value)[:10])
+
+
+def day_rollup(groups):
+    """Fold one day's ("segment", territory, specialty, sentiment, n) and ("kind", type, priority, None, n)
+    groups into its counters"""
+    counts = Counter()
+    for part, first, second, sentiment, n in groups:
+        if part == "segment":
+            sentiment = sentiment or UNKNOWN
+            counts[("sentiment", sentiment)] += n
+            counts[("territory", first or UNKNOWN, sentiment)] += n
+            counts[("hcp_specialty", second or UNKNOWN, sentiment)] += n
+        else:
+            counts[("interaction_type", first or UNKNOWN)] += n
+            counts[("priority_level", second or UNKNOWN)] += n
+    return counts
+
+
+def breakdown(counts):
+    """{name: {"total": n, "sentiment": {...}}} from (name, sentiment) -> n"""
+    result = defaultdict(lambda: {"total": 0, "sentiment": Counter()})
+    for (name, sentiment), n in counts.items():
+        result[name]["total"] += n
+        result[name]["sentiment"][sentiment] += n
+    return {name: {"total": item["total"], "sentiment": dict(item["sentiment"])}
+            for name, item in sorted(result.items(), key=lambda item: -item[1]["total"])}
+
+
+def build_report(day_counts, first_day, last_day):
+    """The trend report for the days in [first_day, last_day] from per-day counters"""
+    sums = {dimension: Counter() for dimension in DIMENSIONS}
+    weekly = defaultdict(Counter)
+    for day, counts in day_counts.items():
+        week_start = day - timedelta(days=day.weekday())
+        for key, n in counts.items():
+            if key[0] in ("territory", "hcp_specialty"):
+                sums[key[0]][key[1:]] += n
+            else:
+                sums[key[0]][key[1]] += n
+                if key[0] == "sentiment":
+                    weekly[week_start][key[1]] += n
+
+    weeks = []
+    week_start = first_day - timedelta(days=first_day.weekday())
+    while week_start <= last_day:
+        sentiment = weekly.get(week_start, Counter())
+        weeks.append({"week_start": week_start.isoformat(), "total": sum(sentiment.values()),
+                      "sentiment": dict(sentiment)})
+        week_start += timedelta(days=7)
+
+    return {
+        "period_days": (last_day - first_day).days + 1,
+        "start": first_day.isoformat(),
+        "end": last_day.isoformat(),
+        "total_interactions": sum(sums["sentiment"].values()),
+        "sentiment_distribution": dict(sums["sentiment"].most_common()),
+        "interaction_types": dict(sums["interaction_type"].most_common()),
+        "priority_levels": dict(sums["priority_level"].most_common()),
+        "territories": breakdown(sums["territory"]),
+        "specialties": breakdown(sums["hcp_specialty"]),
+        "weekly": weeks,
+    }
+
+
+def share(part, total):
+    return f"{100 * part / total:.0f}%" if total else "0%"
+
+
+def trend_insights(report):
+    """A short plain-text reading of a trend report"""
+    total = report["total_interactions"]
+    if not total:
+        return f"No interactions recorded in the last {report['period_days']} days."
+    sentiment = report["sentiment_distribution"]
+    lines = [f"{total:,} interactions in the last {report['period_days']} days: "
+             f"{share(sentiment.get('positive', 0), total)} positive, "
+             f"{share(sentiment.get('neutral', 0), total)} neutral, "
+             f"{share(sentiment.get('negative', 0), total)} negative."]
+    territories = [(name, item) for name, item in report["territories"].items() if name != UNKNOWN]
+    if territories:
+        name, item = territories[0]
+        lines.append(f"Most active territory: {name} ({item['total']:,}, "
+                     f"{share(item['sentiment'].get('positive', 0), item['total'])} positive).")
+    weeks = [week for week in report["weekly"] if week["total"]]
+    if len(weeks) >= 2:
+        previous, latest = weeks[-2]["total"], weeks[-1]["total"]
+        lines.append(f"Week of {weeks[-1]['week_start']}: {latest:,} interactions "
+                     f"({(latest - previous) / previous:+.0%} on the week before).")
+    return " ".join(lines)
+
+
+def _day():
+    # Same expression as ix_hcp_interactions_day_rollup, so filters and groups use that index
+    return func.date(HCPInteraction.interaction_date)
+
+
+def _group_statement(first_day, last_day):
+    day = _day()
+    # Every combination per day first, read in index order without a sort; the two
+    # result groupings then re-group those cells rather than every interaction
+    cells = (
+        select(day.label("day"), HCPInteraction.territory, HCPInteraction.hcp_specialty, HCPInteraction.sentiment,
+               HCPInteraction.interaction_type, HCPInteraction.priority_level, func.count().label("n"))
+        .where(day >= first_day, day <= last_day)
+        .group_by(day, HCPInteraction.territory, HCPInteraction.hcp_specialty, HCPInteraction.sentiment,
+                  HCPInteraction.interaction_type, HCPInteraction.priority_level)
+        .cte("cells")
+    )
+    segments = (
+        select(cells.c.day, literal("segment"), cells.c.territory, cells.c.hcp_specialty, cells.c.sentiment,
+               func.sum(cells.c.n))
+        .group_by(cells.c.day, cells.c.territory, cells.c.hcp_specialty, cells.c.sentiment)
+    )
+    kinds = (
+        select(cells.c.day, literal("kind"), cells.c.interaction_type, cells.c.priority_level, null(),
+               func.sum(cells.c.n))
+        .group_by(cells.c.day, cells.c.interaction_type, cells.c.priority_level)
+    )
+    return union_all(segments, kinds)
+
+
+class TrendAnalytics:
+    """Trend reports from the database with closed days cached"""
+
+    def __init__(self, session_factory=SessionLocal, closed_ttl=ANALYTICS_CLOSED_TTL,
+                 cache_days=ANALYTICS_CACHE_DAYS):
+        self.session_factory = session_factory
+        self.closed_ttl = closed_ttl
+        self.cache_days = cache_days
+        self._closed = OrderedDict()  # day -> (expires_at, counters)
+        self._lock = threading.Lock()
+        self.cached_days = 0
+        self.computed_days = 0
+        self.queries = 0
+
+    def _cached(self, day, now):
+        with self._lock:
+            entry = self._closed.get(day)
+            if entry is None or entry[0] <= now:
+                return None
+            self._closed.move_to_end(day)
+            return entry[1]
+
+    def _store(self, day, counts, now):
+        with self._lock:
+            self._closed[day] = (now + self.closed_ttl, counts)
+            self._closed.move_to_end(day)
+            while len(self._closed) > self.cache_days:
+                self._closed.popitem(last=False)
+
+    def _count_days(self, session, first_day, last_day):
+        """Per-day counters for [first_day, last_day] from one grouped statement"""
+        self.queries += 1
+        groups = defaultdict(list)
+        # Plain rows from the connection; ORM result processing costs more than the rollup itself
+        for day, *values in session.connection().execute(_group_statement(first_day, last_day)):
+            groups[as_day(day)].append(values)
+        return {day: day_rollup(groups.get(day, ()))
+                for day in (first_day + timedelta(days=i) for i in range((last_day - first_day).days + 1))}
+
+    def report(self, days=30, end=None):
+        first_day, last_day = window_days(days, end)
+        today = datetime.utcnow().date()
+        now = time.monotonic()
+        day_counts, missing = {}, []
+        day = first_day
+        while day <= last_day:
+            counts = self._cached(day, now) if day < today else None
+            if counts is None:
+                missing.append(day)
+            else:
+                day_counts[day] = counts
+            day += timedelta(days=1)
+        self.cached_days += len(day_counts)
+        self.computed_days += len(missing)
+
+        if missing:
+            with self.session_factory() as session:
+                # One query per run of consecutive missing days
+                run_start = previous = missing[0]
+                for day in missing[1:] + [None]:
+                    if day is not None and day == previous + timedelta(days=1):
+                        previous = day
+                        continue
+                    for counted_day, counts in self._count_days(session, run_start, previous).items():
+                        day_counts[counted_day] = counts
+                        if counted_day < today:
+                            self._store(counted_day, counts, now)
+                    run_start = previous = day
+
+        report = build_report(day_counts, first_day, last_day)
+        report["buckets"] = {"cached": len(day_counts) - len(missing), "computed": len(missing)}
+        return report
+
+    def clear(self):
+        with self._lock:
+            self._closed.clear()
+
+    def stats(self):
+        return {
+            "closed_days_cached": len(self._closed),
+            "cached_day_reads": self.cached_days,
+            "computed_day_reads": self.computed_days,
+            "queries": self.queries,
+            "closed_ttl_seconds": self.closed_ttl,
+        }
+
+
+def load_columns(session, first_day, last_day, batch_size=100000):
+    """Columns for every interaction in a window: "day" as datetime64[D], and each dimension
+    dictionary-encoded as int32 codes in `<dimension>` with its values in `<dimension>_names`"""
+    day = _day()
+    stream = session.connection().execution_options(yield_per=batch_size).execute(
+        select(day, *[getattr(HCPInteraction, name) for name in DIMENSIONS])
+        .where(day >= first_day, day <= last_day)
+    )
+    lookups = {name: {} for name in DIMENSIONS}
+    chunks = {name: [] for name in ("day",) + DIMENSIONS}
+    for partition in stream.partitions():
+        rows = list(zip(*partition))
+        chunks["day"].append(np.array([str(value)[:10] for value in rows[0]], dtype="datetime64[D]"))
+        for name, values in zip(DIMENSIONS, rows[1:]):
+            lookup = lookups[name]
+            chunks[name].append(np.array([lookup.setdefault(value or UNKNOWN, len(lookup)) for value in values],
+                                         dtype=np.int32))
+    columns = {"day": np.concatenate(chunks["day"]) if chunks["day"] else np.array([], dtype="datetime64[D]")}
+    for name in DIMENSIONS:
+        columns[name] = np.concatenate(chunks[name]) if chunks[name] else np.array([], dtype=np.int32)
+        columns[f"{name}_names"] = np.array(list(lookups[name]) or [UNKNOWN], dtype=str)
+    return columns
+
+
+def report_from_columns(columns, days=30, end=None):
+    """The same report as TrendAnalytics.report, computed from load_columns() arrays with no database"""
+    first_day, last_day = window_days(days, end)
+    span = (last_day - first_day).days + 1
+    day_index = (columns["day"] - np.datetime64(first_day)).astype(np.int64)
+    mask = (day_index >= 0) & (day_index < span)
+    day_index = day_index[mask]
+    codes = {name: columns[name][mask].astype(np.int64) for name in DIMENSIONS}
+    names = {name: columns[f"{name}_names"].tolist() for name in DIMENSIONS}
+
+    day_counts = {first_day + timedelta(days=i): Counter() for i in range(span)}
+    days_of = list(day_counts)
+
+    def count(key_codes, labels):
+        # One bincount over (day, key) pairs, then only the non-zero cells go back to Python
+        totals = np.bincount(day_index * len(labels) + key_codes, minlength=span * len(labels))
+        cells = np.flatnonzero(totals)
+        for cell, n in zip(cells.tolist(), totals[cells].tolist()):
+            day_counts[days_of[cell // len(labels)]][labels[cell % len(labels)]] += n
+
+    for name in ("sentiment", "interaction_type", "priority_level"):
+        count(codes[name], [(name, value) for value in names[name]])
+    sentiments = len(names["sentiment"])
+    for name in ("territory", "hcp_specialty"):
+        count(codes[name] * sentiments + codes["sentiment"],
+              [(name, value, sentiment) for value in names[name] for sentiment in names["sentiment"]])
+    return build_report(day_counts, first_day, last_day)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--export", help="write the window's columns to this .npz file")
+    parser.add_argument("--from-export", help="report from a .npz export instead of the database")
+    args = parser.parse_args()
+
+    if args.from_export:
+        with np.load(args.from_export) as data:
+            columns = {name: data[name] for name in data.files}
+        print(json.dumps(report_from_columns(columns, args.days), indent=2))
+        return
+    if args.export:
+        with SessionLocal() as session:
+            columns = load_columns(session, *window_days(args.days))
+        np.savez(args.export, **columns)
+        print(f"Exported {len(columns['day']):,} interactions to {args.export}")
+        return
+    print(json.dumps(TrendAnalytics().report(args.days), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""End-to-end agent latency: compiled tool graph against the old sequential keyword agent.
+
+Per message kind, times:
+- old agent: simple_agent as langgraph_agent had it, one tool per intent
+- sequential: the graph's node functions called one after another, doing the
+  same work as the graph (history, then trends, then suggestions)
+- graph: the compiled graph, through invoke() and ainvoke()
+and prints the graph's mean time per node. --tool-latency-ms adds a fixed
+delay to the history and trends tools, as a remote database would; only
+there can the parallel fetch save more than the graph's own overhead.
+
+Run: python benchmarks/synthetic_data.py --rows 1000000 --database-url sqlite:////tmp/crm_bench.db
+     DATABASE_URL=sqlite:////tmp/crm_bench.db python benchmarks/bench_agent_graph.py --tool-latency-ms 0 20
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BACKEND)
+sys.path.append(os.path.join(BACKEND, "agent"))
+
+import langgraph_agent
+from langgraph_agent import interaction_graph
+from intent_router import classify_intent, LOG_INTERACTION, VIEW_HISTORY, GET_SUGGESTIONS, ANALYZE_TRENDS
+from models import init_db
+from bench_history import report, timed
+
+MESSAGES = {
+    "suggestions": "What should I do next with Dr. Smith?",
+    "history": "Show history for Dr. Smith",
+    "trends": "Analyze trends for the last 30 days",
+    "log": "I met with Dr. Smith today, he was interested in CardioMax",
+}
+
+
+def old_agent(user_input):
+    """simple_agent as langgraph_agent had it, without the response formatting"""
+    intent = classify_intent(user_input)
+    hcp_name = langgraph_agent.extract_hcp_name(user_input)
+    if intent == LOG_INTERACTION:
+        return langgraph_agent.log_interaction.invoke({"raw_input": user_input, "hcp_name": hcp_name,
+                                                       "interaction_type": "visit"})
+    if intent == VIEW_HISTORY:
+        return langgraph_agent.get_hcp_history.invoke({"hcp_name": hcp_name})
+    if intent == GET_SUGGESTIONS:
+        return langgraph_agent.suggest_next_actions.invoke({"hcp_name": hcp_name})
+    if intent == ANALYZE_TRENDS:
+        return langgraph_agent.analyze_interaction_trends.invoke({"days": 30})
+
+
+def sequential(user_input):
+    """The graph's nodes in order on one thread"""
+    state = {"input": user_input}
+    state.update(langgraph_agent.route(state))
+    for name in langgraph_agent.INTENT_NODES.get(state["intent"], []):
+        node = {"log_interaction": langgraph_agent.run_log_interaction,
+                "get_hcp_history": langgraph_agent.run_get_hcp_history,
+                "analyze_interaction_trends": langgraph_agent.run_analyze_interaction_trends}[name]
+        state.update(node(state))
+    if state["intent"] == GET_SUGGESTIONS:
+        state.update(langgraph_agent.run_suggest_next_actions(state))
+    state.update(langgraph_agent.respond(state))
+    return state
+
+
+class Delayed:
+    """A tool whose every call first waits `seconds`, like a round trip to a remote database"""
+
+    def __init__(self, tool, seconds):
+        self.tool = tool
+        self.seconds = seconds
+
+    def invoke(self, arguments):
+        time.sleep(self.seconds)
+        return self.tool.invoke(arguments)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--tool-latency-ms", type=float, nargs="+", default=[0, 20])
+    args = parser.parse_args()
+
+    init_db()
+    loop = asyncio.new_event_loop()
+    tools = {name: getattr(langgraph_agent, name) for name in ("get_hcp_history", "analyze_interaction_trends")}
+    for latency in args.tool_latency_ms:
+        for name, tool in tools.items():
+            setattr(langgraph_agent, name, Delayed(tool, latency / 1000) if latency else tool)
+        print(f"\ntool latency +{latency:g} ms (history and trends)")
+        for kind, message in MESSAGES.items():
+            # Warm caches (closed trend days, SQLite pages) the way a running server would have them
+            old_agent(message)
+            interaction_graph.invoke({"input": message})
+            print(kind)
+            report("  old agent", timed(lambda: old_agent(message), args.iterations))
+            report("  sequential (same work)", timed(lambda: sequential(message), args.iterations))
+            report("  graph invoke", timed(lambda: interaction_graph.invoke({"input": message}), args.iterations))
+            report("  graph ainvoke", timed(lambda: loop.run_until_complete(
+                interaction_graph.ainvoke({"input": message})), args.iterations))
+            timings = [interaction_graph.invoke({"input": message})["timings"] for _ in range(args.iterations)]
+            print("  graph nodes: " + ", ".join(f"{node} {statistics.mean(t[node] for t in timings):.2f} ms"
+                                                for node in timings[0]))
+
+
+if __name__ == "__main__":
+    main()
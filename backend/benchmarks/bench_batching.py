@@ -0,0 +1,105 @@
+"""Upstream round-trips and wall time for bulk analysis, one prompt per note vs multi-note batching.
+
+Starts the mock Groq server, then analyses --notes notes with --concurrency
+callers, first one completion per note (analyze_interaction's prompt), then
+through AnalysisBatcher. --batch-drop-rate makes the mock leave items out of
+multi-note answers so the re-submission path is exercised.
+
+Run: python benchmarks/bench_batching.py --notes 1000 --concurrency 50 --latency-ms 300
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from llm_client import LLMClient, estimate_tokens
+from llm_batcher import AnalysisBatcher
+from load_test import start_process, wait_until_up
+
+SINGLE_PROMPT = """
+    Analyze this healthcare professional interaction:
+
+    Input: {note}
+    HCP: {hcp}
+
+    Return JSON only:
+    {{
+        "summary": "brief summary",
+        "sentiment": "positive/neutral/negative",
+        "specialty": "medical specialty",
+        "next_action": "suggested action",
+        "priority": "high/medium/low",
+        "topics": ["topic1", "topic2"]
+    }}
+    """
+
+
+def make_notes(count):
+    return [(f"Met with Dr. Smith{i % 300} about cardiac device outcomes, follow-up #{i}", f"Dr. Smith{i % 300}")
+            for i in range(count)]
+
+
+async def run_pool(notes, concurrency, analyze):
+    queue = iter(notes)
+    results = []
+
+    async def worker():
+        for note, hcp in queue:
+            results.append(await analyze(note, hcp))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return time.perf_counter() - start, results
+
+
+async def bench(url, notes, concurrency):
+    client = LLMClient("mock-key", url, max_concurrency=concurrency)
+    prompt_tokens = [0]
+    calls = [0]
+
+    async def complete(prompt, max_tokens=500):
+        calls[0] += 1
+        prompt_tokens[0] += estimate_tokens(prompt)
+        return await client.complete(prompt, max_tokens=max_tokens)
+
+    async def single(note, hcp):
+        return await complete(SINGLE_PROMPT.format(note=note, hcp=hcp))
+
+    elapsed, _ = await run_pool(notes, concurrency, single)
+    print(f"{'mode':<10}{'calls':>8}{'prompt tok':>12}{'seconds':>10}{'notes/s':>10}{'failed':>8}")
+    print(f"{'single':<10}{calls[0]:>8}{prompt_tokens[0]:>12}{elapsed:>10.2f}{len(notes) / elapsed:>10.0f}{0:>8}")
+
+    calls[0] = prompt_tokens[0] = 0
+    batcher = AnalysisBatcher(complete)
+    elapsed, results = await run_pool(notes, concurrency, batcher.analyze)
+    failed = sum(1 for result in results if result is None)
+    print(f"{'batched':<10}{calls[0]:>8}{prompt_tokens[0]:>12}{elapsed:>10.2f}{len(notes) / elapsed:>10.0f}{failed:>8}")
+    print(f"batcher: {batcher.stats()}")
+    await client.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--notes", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency-ms", type=float, default=300.0)
+    parser.add_argument("--batch-drop-rate", type=float, default=0.05)
+    parser.add_argument("--mock-port", type=int, default=9100)
+    args = parser.parse_args()
+
+    mock = start_process(["benchmarks/mock_groq.py", "--port", str(args.mock_port),
+                          "--latency-ms", str(args.latency_ms),
+                          "--batch-drop-rate", str(args.batch_drop_rate)])
+    try:
+        base = f"http://127.0.0.1:{args.mock_port}/openai/v1"
+        wait_until_up(f"{base}/models")
+        asyncio.run(bench(f"{base}/chat/completions", make_notes(args.notes), args.concurrency))
+    finally:
+        mock.terminate()
+        mock.wait()
+
+
+if __name__ == "__main__":
+    main()
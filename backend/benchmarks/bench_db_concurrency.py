@@ -0,0 +1,169 @@
+"""History reads while the write-behind writer is inserting, for three engine setups.
+
+Seeds a SQLite database. For each mode it runs --readers concurrent
+history queries for --seconds while a writer thread commits batches of
+interactions (with profile rollups) at --write-rate rows/second, the way
+the write-behind queue does under load.
+
+- before: the previous setup, the default create_engine (rollback journal,
+  default pool) with each query in the asyncio threadpool
+- threadpool: the same threadpool reads on an engine built with
+  models.engine_options/configure_engine (explicit pool, WAL pragmas)
+- async: the request handlers' path, aiosqlite through create_async_engine
+  with the same options
+
+Run: python benchmarks/bench_db_concurrency.py --readers 50 --seconds 10 --write-rate 1000
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from models import Base, HCPInteraction, async_url, engine_options, configure_engine
+from history_service import get_hcp_history, get_hcp_history_async
+from interaction_writer import InteractionWriter
+from load_test import percentile
+
+
+def hcp_name(i):
+    return f"Dr. Bench{i:04d}"
+
+
+def make_rows(count, hcps, rng):
+    return [{
+        "hcp_name": hcp_name(rng.randrange(hcps)),
+        "interaction_type": "visit",
+        "raw_notes": "Discussed cardiac device outcomes and follow-up",
+        "ai_summary": "Discussed treatment options",
+        "key_topics": "[]",
+        "sentiment": rng.choice(["positive", "neutral", "negative"]),
+        "next_action": "Schedule follow-up",
+        "priority_level": "medium",
+    } for _ in range(count)]
+
+
+def seed(url, rows, hcps):
+    engine = create_engine(url)
+    Base.metadata.create_all(engine)
+    rng = random.Random(1)
+    with engine.begin() as conn:
+        for start in range(0, rows, 5000):
+            conn.execute(insert(HCPInteraction), make_rows(min(5000, rows - start), hcps, rng))
+    engine.dispose()
+
+
+def write_loop(session_factory, hcps, batch_size, write_rate, stop, counters):
+    """Commit batches at write_rate rows/second (0 = back to back)"""
+    writer = InteractionWriter(session_factory=session_factory, mode="sync")
+    rng = random.Random(2)
+    interval = batch_size / write_rate if write_rate else 0
+    next_write = time.monotonic()
+    while not stop.is_set():
+        try:
+            writer.write_batch(make_rows(batch_size, hcps, rng))
+            counters["rows"] += batch_size
+        except Exception as e:
+            counters["errors"] += 1
+            counters["last_error"] = str(e)
+        next_write += interval
+        stop.wait(max(0.0, next_write - time.monotonic()))
+
+
+async def read_loop(read_one, hcps, deadline, latencies, errors, seed_value):
+    rng = random.Random(seed_value)
+    while time.monotonic() < deadline:
+        start = time.perf_counter()
+        try:
+            await read_one(hcp_name(rng.randrange(hcps)))
+            latencies.append((time.perf_counter() - start) * 1000)
+        except Exception:
+            errors.append(1)
+
+
+async def run_mode(mode, url, args):
+    if mode in ("before", "threadpool"):
+        if mode == "before":
+            write_engine = create_engine(url, connect_args={"check_same_thread": False})
+            read_engine = create_engine(url, connect_args={"check_same_thread": False})
+        else:
+            write_engine = create_engine(url, **engine_options(url))
+            read_engine = create_engine(url, **engine_options(url))
+            configure_engine(write_engine)
+            configure_engine(read_engine)
+        ReadSession = sessionmaker(bind=read_engine)
+        loop = asyncio.get_running_loop()
+
+        def read_sync(name):
+            with ReadSession() as session:
+                return get_hcp_history(session, name, 10)
+
+        async def read_one(name):
+            return await loop.run_in_executor(None, read_sync, name)
+    else:
+        write_engine = create_engine(url, **engine_options(url))
+        configure_engine(write_engine)
+        read_engine = create_async_engine(async_url(url), **engine_options(url, async_driver=True))
+        configure_engine(read_engine)
+        ReadSession = async_sessionmaker(read_engine, expire_on_commit=False)
+
+        async def read_one(name):
+            async with ReadSession() as session:
+                return await get_hcp_history_async(session, name, 10)
+
+    stop = threading.Event()
+    counters = {"rows": 0, "errors": 0, "last_error": None}
+    writer = threading.Thread(target=write_loop, args=(sessionmaker(bind=write_engine), args.hcps,
+                                                       args.batch_size, args.write_rate, stop, counters))
+    latencies, errors = [], []
+    writer.start()
+    started = time.perf_counter()
+    deadline = time.monotonic() + args.seconds
+    try:
+        await asyncio.gather(*(read_loop(read_one, args.hcps, deadline, latencies, errors, i)
+                               for i in range(args.readers)))
+    finally:
+        elapsed = time.perf_counter() - started
+        stop.set()
+        writer.join()
+    if mode == "async":
+        await read_engine.dispose()
+    else:
+        read_engine.dispose()
+    write_engine.dispose()
+
+    p50 = percentile(latencies, 50) if latencies else 0
+    p99 = percentile(latencies, 99) if latencies else 0
+    print(f"{mode:<8}{len(latencies) / elapsed:>9.0f}{p50:>9.1f}{p99:>9.1f}{len(errors):>8}"
+          f"{counters['rows'] / elapsed:>11.0f}{counters['errors']:>9}")
+    if counters["last_error"]:
+        print(f"         last write error: {counters['last_error'][:120]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100000, help="interactions seeded before each run")
+    parser.add_argument("--hcps", type=int, default=2000)
+    parser.add_argument("--readers", type=int, default=50)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--batch-size", type=int, default=200, help="rows per write-behind transaction")
+    parser.add_argument("--write-rate", type=float, default=1000, help="rows/second written (0 = as fast as possible)")
+    args = parser.parse_args()
+
+    print(f"{'mode':<8}{'reads/s':>9}{'p50 ms':>9}{'p99 ms':>9}{'errors':>8}{'rows/s w':>11}{'w errors':>9}")
+    for mode in ("before", "threadpool", "async"):
+        path = os.path.join(tempfile.mkdtemp(prefix="crm_dbconc_"), "crm.db")
+        url = f"sqlite:///{path}"
+        seed(url, args.rows, args.hcps)
+        asyncio.run(run_mode(mode, url, args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+"""HCP name resolution latency, accuracy and memory at --profiles profiles, and the dedup job on a seeded database.
+
+Lookups are timed for names that are already exact (title and case
+variants), sound-alike spellings, one-typo surnames and unknown HCPs, with
+one-typo matching on unless --no-typos.
+"wrong" counts names resolved to another profile; for unknown names any
+match is wrong. The dedup part loads --dedup-profiles profiles plus
+duplicates of each kind with interactions, merges them with and without
+--typos, and checks that duplicates went to their original and every
+interaction was relinked.
+
+Run: python benchmarks/bench_entity_resolution.py --profiles 500000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import func, insert, select
+from sqlalchemy.orm import sessionmaker
+from models import HCPInteraction, HCPProfile, init_db
+from hcp_resolver import HCPResolver, dedup_profiles
+from note_extractor import name_key
+from synthetic_data import full_hcp_names, make_engine
+from bench_history import report
+
+# Spelling changes that keep the sound of a name
+SOUND_ALIKES = [("y", "i"), ("i", "y"), ("ph", "f"), ("f", "ph"), ("ck", "k"), ("k", "ck"), ("s", "z"),
+                ("z", "s"), ("ll", "l"), ("l", "ll"), ("nn", "n"), ("n", "nn"), ("th", "t")]
+LETTERS = "abcdefghijklmnopqrstuvwxyz"
+
+
+def rss_mb():
+    """Resident set size of this process (Linux /proc only)"""
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+
+
+def title_variant(rng, name):
+    first, surname = name.split()[1:]
+    return rng.choice([f"dr {first.lower()} {surname.lower()}", f"Doctor {first} {surname}",
+                       f"DR. {first.upper()} {surname.upper()}", f"Dr {first} {surname}"])
+
+
+def sound_alike(rng, name):
+    title, first, surname = name.split()
+    rules = [(old, new) for old, new in SOUND_ALIKES if old in surname.lower()[1:]]
+    if not rules:
+        return None
+    old, new = rng.choice(rules)
+    position = surname.lower().index(old, 1)
+    return f"{title} {first} {surname[:position]}{new}{surname[position + len(old):]}"
+
+
+def typo(rng, name):
+    title, first, surname = name.split()
+    position = rng.randrange(1, len(surname) - 1)
+    kind = rng.choice(["delete", "insert", "replace", "swap"])
+    if kind == "delete":
+        surname = surname[:position] + surname[position + 1:]
+    elif kind == "insert":
+        surname = surname[:position] + rng.choice(LETTERS) + surname[position:]
+    elif kind == "replace":
+        surname = surname[:position] + rng.choice(LETTERS) + surname[position + 1:]
+    else:
+        surname = surname[:position] + surname[position + 1] + surname[position] + surname[position + 2:]
+    return f"{title} {first} {surname}"
+
+
+def variants(rng, names, known_keys, make, count):
+    """(variant, index of the original) pairs; variants that are another profile's name are skipped"""
+    pairs = []
+    while len(pairs) < count:
+        index = rng.randrange(len(names))
+        variant = make(rng, names[index])
+        if variant and variant != names[index]:
+            key = " ".join(name_key(variant))
+            if key == " ".join(name_key(names[index])) or key not in known_keys:
+                pairs.append((variant, index))
+    return pairs
+
+
+def bench_lookups(args):
+    names = full_hcp_names(args.profiles)
+    rss_before = rss_mb()
+    start = time.perf_counter()
+    resolver = HCPResolver(typos=args.typos)
+    for profile_id, name in enumerate(names, 1):
+        resolver.add(profile_id, name)
+    elapsed = time.perf_counter() - start
+    print(f"index: {len(resolver):,} profiles in {elapsed:.1f}s, RSS +{rss_mb() - rss_before:.0f} MB")
+
+    rng = random.Random(3)
+    known_keys = {" ".join(name_key(name)) for name in names}
+    unknown = [name for name in full_hcp_names(args.profiles + args.queries, seed=12)
+               if " ".join(name_key(name)) not in known_keys]
+    cases = {
+        "exact (title/case variants)": [(title_variant(rng, names[i]), i)
+                                        for i in rng.sample(range(len(names)), args.queries)],
+        "sound-alike spelling": variants(rng, names, known_keys, sound_alike, args.queries),
+        "one typo in surname": variants(rng, names, known_keys, typo, args.queries),
+        "unknown HCP": [(name, None) for name in rng.sample(unknown, min(args.queries, len(unknown)))],
+    }
+    for label, pairs in cases.items():
+        outcomes = {"right": 0, "wrong": 0, "unresolved": 0}
+        latencies = []
+        for variant, index in pairs:
+            start = time.perf_counter()
+            found = resolver.match(variant)
+            latencies.append((time.perf_counter() - start) * 1000)
+            if found is None:
+                outcomes["unresolved"] += 1
+            else:
+                outcomes["right" if found[0] == (index + 1 if index is not None else None) else "wrong"] += 1
+        report(label, latencies)
+        print(f"  {outcomes}")
+
+
+def bench_dedup(args, typos):
+    names = full_hcp_names(args.dedup_profiles, seed=21)
+    rng = random.Random(5)
+    known_keys = {" ".join(name_key(name)) for name in names}
+    kinds = {"title/case": title_variant, "sound-alike": sound_alike, "typo": typo}
+    # One duplicate per original, none that collide with each other
+    seen, planted = set(), []
+    for kind, make in kinds.items():
+        for variant, index in variants(rng, names, known_keys, make, args.dedup_profiles // 30):
+            key = " ".join(name_key(variant))
+            if index not in seen and (kind == "title/case" or key not in seen):
+                seen.update((index, key))
+                planted.append((kind, variant, index))
+
+    path = os.path.join(tempfile.mkdtemp(prefix="crm_dedup_"), "crm.db")
+    engine = make_engine(f"sqlite:///{path}")
+    init_db(engine)
+    Session = sessionmaker(bind=engine)
+    now = datetime.utcnow()
+    profiles = [{"name": name, "total_interactions": args.interactions_per_hcp, "last_interaction_date": now,
+                 "relationship_strength": 1.0} for name in names + [variant for _, variant, _ in planted]]
+    rows = [{"hcp_name": profile["name"], "interaction_date": now - timedelta(days=day), "sentiment": "neutral",
+             "raw_notes": "Synthetic visit"}
+            for profile in profiles for day in range(args.interactions_per_hcp)]
+    with engine.begin() as conn:
+        conn.execute(insert(HCPProfile), profiles)
+        conn.execute(insert(HCPInteraction), rows)
+    print(f"dedup{' --typos' if typos else ''}: {len(names):,} profiles + {len(planted):,} duplicates, "
+          f"{len(rows):,} interactions")
+
+    start = time.perf_counter()
+    merged = dedup_profiles(session_factory=Session, typos=typos)
+    elapsed = time.perf_counter() - start
+    with Session() as session:
+        remaining = set(session.scalars(select(HCPProfile.name)))
+        unlinked = session.scalar(select(func.count()).select_from(HCPInteraction)
+                                  .where(HCPInteraction.hcp_profile_id.is_(None)))
+        orphaned = session.scalar(select(func.count()).select_from(HCPInteraction)
+                                  .where(HCPInteraction.hcp_name.not_in(select(HCPProfile.name))))
+        totals = dict(session.execute(select(HCPProfile.name, HCPProfile.total_interactions)).all())
+    for kind in kinds:
+        caught = [(variant, index) for planted_kind, variant, index in planted
+                  if planted_kind == kind and variant not in remaining]
+        combined = sum(totals.get(names[index]) == 2 * args.interactions_per_hcp for _, index in caught)
+        total = sum(planted_kind == kind for planted_kind, _, _ in planted)
+        print(f"  {kind:<12} {len(caught):,}/{total:,} merged, {combined:,} into their original")
+    print(f"  {merged:,} merged in {elapsed:.1f}s; {sum(name not in remaining for name in names):,} originals "
+          f"wrongly merged; interactions without hcp_profile_id: {unlinked:,}, naming a deleted profile: {orphaned:,}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--profiles", type=int, default=500000)
+    parser.add_argument("--queries", type=int, default=5000, help="lookups per case")
+    parser.add_argument("--dedup-profiles", type=int, default=50000)
+    parser.add_argument("--interactions-per-hcp", type=int, default=4)
+    parser.add_argument("--no-typos", dest="typos", action="store_false",
+                        help="time lookups without the one-typo index (the HCP_RESOLVE_TYPOS default)")
+    args = parser.parse_args()
+
+    bench_lookups(args)
+    bench_dedup(args, typos=False)
+    bench_dedup(args, typos=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Accuracy and throughput of local note extraction on the labelled corpus, against the old regex/keyword path.
+
+The gazetteer holds the corpus profiles plus --profiles synthetic HCP names,
+so matching cost is measured at a realistic gazetteer size. "Answered
+locally" is the share of notes whose sentiment, specialty and priority all
+reach the confidence threshold, i.e. the LLM calls saved.
+
+Run: python benchmarks/bench_extraction.py --profiles 50000
+"""
+import argparse
+import os
+import re
+import sys
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from note_extractor import NameGazetteer, NoteExtractor, LOCAL_ANALYSIS_MIN_CONFIDENCE
+from extraction_corpus import EXTRACTION_CORPUS, KNOWN_PROFILES
+from synthetic_data import LAST_NAMES, SPECIALTIES, hcp_names
+
+FIELDS = ("hcp_name", "sentiment", "specialty", "priority")
+
+
+def legacy_extract(text):
+    """extract_hcp_name and keyword_analysis as final_app had them"""
+    hcp_name = "Dr. Unknown"
+    for pattern in (r"Dr\.?\s+([A-Z][a-z]+)", r"Doctor\s+([A-Z][a-z]+)", r"with\s+([A-Z][a-z]+)"):
+        match = re.search(pattern, text, re.IGNORECASE)
+        if match:
+            hcp_name = f"Dr. {match.group(1)}"
+            break
+    lowered = text.lower()
+    sentiment = "positive" if any(word in lowered for word in ["good", "great", "excellent", "positive", "interested"]) else "neutral"
+    specialty = "Cardiology" if "cardiac" in lowered else "General Medicine"
+    return {"hcp_name": hcp_name, "sentiment": sentiment, "specialty": specialty, "priority": "medium"}
+
+
+def local_extract(extractor, text):
+    hcp_name, _ = extractor.extract_name(text)
+    analysis, confidences = extractor.analyze(text, hcp_name)
+    return dict(analysis, hcp_name=hcp_name), confidences
+
+
+def correct(field, expected, got):
+    return expected[field] is None or expected[field] == got[field]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--profiles", type=int, default=50000, help="synthetic HCP names added to the gazetteer")
+    parser.add_argument("--threshold", type=float, default=LOCAL_ANALYSIS_MIN_CONFIDENCE)
+    parser.add_argument("--seconds", type=float, default=2.0)
+    parser.add_argument("--verbose", action="store_true", help="print every field the local path got wrong")
+    args = parser.parse_args()
+
+    gazetteer = NameGazetteer()
+    start = time.perf_counter()
+    # Only the "Dr. Lastname-N" names, so no synthetic profile shadows a corpus HCP
+    for i, name in enumerate(hcp_names(args.profiles)[len(LAST_NAMES):]):
+        gazetteer.add(name, SPECIALTIES[i % len(SPECIALTIES)])
+    for name, specialty in KNOWN_PROFILES:
+        gazetteer.add(name, specialty)
+    print(f"gazetteer: {len(gazetteer):,} names loaded in {time.perf_counter() - start:.2f}s")
+    extractor = NoteExtractor(gazetteer, min_confidence=args.threshold)
+
+    total = len(EXTRACTION_CORPUS)
+    local_hits = {field: 0 for field in FIELDS}
+    legacy_hits = {field: 0 for field in FIELDS}
+    answered_locally = answered_right = 0
+    for text, expected in EXTRACTION_CORPUS:
+        got, confidences = local_extract(extractor, text)
+        legacy = legacy_extract(text)
+        for field in FIELDS:
+            local_hits[field] += correct(field, expected, got)
+            legacy_hits[field] += correct(field, expected, legacy)
+            if args.verbose and not correct(field, expected, got):
+                print(f"  WRONG {field}: {text!r} expected {expected[field]!r}, got {got[field]!r}")
+        if extractor.confident(confidences):
+            answered_locally += 1
+            answered_right += all(correct(field, expected, got) for field in FIELDS[1:])
+
+    print(f"accuracy on {total} labelled notes (specialty scored where the note determines it):")
+    for field in FIELDS:
+        print(f"  {field:<10} local {local_hits[field]:>2}/{total}   legacy {legacy_hits[field]:>2}/{total}")
+    print(f"answered locally at confidence >= {args.threshold}: {answered_locally}/{total} notes "
+          f"({answered_right} with sentiment, specialty and priority all correct); "
+          f"{total - answered_locally} would call the LLM")
+    print(f"  fields below threshold: {dict(extractor.low_confidence)}")
+
+    messages = [text for text, _ in EXTRACTION_CORPUS]
+    for name, extract in (("local", lambda text: local_extract(extractor, text)), ("legacy", legacy_extract)):
+        count = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < args.seconds:
+            for text in messages:
+                extract(text)
+            count += len(messages)
+        rate = count / (time.perf_counter() - start)
+        print(f"{name:<7} throughput={rate:,.0f} notes/s/core ({1e6 / rate:.1f} us/note, name + analysis)")
+
+
+if __name__ == "__main__":
+    main()
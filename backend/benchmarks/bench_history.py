@@ -0,0 +1,83 @@
+"""Latency of the indexed, keyset-paginated HCP history query.
+
+Run: python benchmarks/synthetic_data.py --rows 10000000 --database-url sqlite:////tmp/crm_bench.db
+     python benchmarks/bench_history.py --database-url sqlite:////tmp/crm_bench.db
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import sessionmaker
+from models import HCPInteraction
+from history_service import get_hcp_history, get_interactions_by_sentiment
+from synthetic_data import hcp_names, make_engine
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))]
+
+
+def timed(fn, iterations):
+    latencies = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def report(label, latencies):
+    print(f"{label:<34} n={len(latencies):<6} p50={statistics.median(latencies):7.3f} ms  "
+          f"p99={percentile(latencies, 99):7.3f} ms  max={max(latencies):7.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", default="sqlite:////tmp/crm_bench.db")
+    parser.add_argument("--hcps", type=int, default=50000, help="must match the generator's --hcps")
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args()
+
+    engine = make_engine(args.database_url)
+    Session = sessionmaker(bind=engine)
+    names = hcp_names(args.hcps)
+    rng = random.Random(1)
+
+    with Session() as session:
+        total = session.scalar(select(func.count()).select_from(HCPInteraction))
+        print(f"{total:,} interactions in {args.database_url}")
+
+        # Warm the connection and page cache the way a running server would be
+        for name in names[:50]:
+            get_hcp_history(session, name, args.limit)
+
+        report("first page (one HCP)", timed(
+            lambda: get_hcp_history(session, rng.choice(names), args.limit), args.iterations))
+
+        cursors = {}
+        for name in names[:200]:
+            page = get_hcp_history(session, name, args.limit)
+            if page["next_cursor"]:
+                cursors[name] = page["next_cursor"]
+        items = list(cursors.items())
+
+        def next_page():
+            name, cursor = rng.choice(items)
+            get_hcp_history(session, name, args.limit, cursor)
+
+        report("next page via cursor", timed(next_page, args.iterations))
+
+        report("sentiment timeline first page", timed(
+            lambda: get_interactions_by_sentiment(session, rng.choice(["positive", "neutral", "negative"]),
+                                                  args.limit), args.iterations))
+
+
+if __name__ == "__main__":
+    main()
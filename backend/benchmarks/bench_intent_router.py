@@ -0,0 +1,64 @@
+"""Intent router accuracy on the labelled corpus and single-core classification throughput.
+
+Run: python benchmarks/bench_intent_router.py
+Exits non-zero if any corpus message is misclassified.
+"""
+import argparse
+import os
+import sys
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from intent_router import classify_intent
+from intent_corpus import INTENT_CORPUS
+
+
+def legacy_classify(user_input):
+    """The chained substring scans chat_endpoint used before the shared router"""
+    user_input = user_input.lower()
+    if any(word in user_input for word in ["met", "visit", "meeting", "log", "interaction"]):
+        return "log_interaction"
+    elif any(word in user_input for word in ["history", "show", "past"]):
+        return "view_history"
+    elif any(word in user_input for word in ["suggest", "next", "recommend", "action"]):
+        return "get_suggestions"
+    return "general_chat"
+
+
+def accuracy(classify):
+    failures = [(text, expected, classify(text)) for text, expected in INTENT_CORPUS
+                if classify(text) != expected]
+    return len(INTENT_CORPUS) - len(failures), failures
+
+
+def throughput(classify, messages, seconds):
+    count = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        for text in messages:
+            classify(text)
+        count += len(messages)
+    return count / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=2.0)
+    args = parser.parse_args()
+
+    messages = [text for text, _ in INTENT_CORPUS]
+    for name, classify in (("router", classify_intent), ("legacy", legacy_classify)):
+        correct, failures = accuracy(classify)
+        rate = throughput(classify, messages, args.seconds)
+        print(f"{name:<7} accuracy={correct}/{len(INTENT_CORPUS)}  throughput={rate:,.0f} msgs/s/core "
+              f"({1e6 / rate:.2f} us/msg)")
+        if name == "router":
+            for text, expected, got in failures:
+                print(f"  MISCLASSIFIED {text!r}: expected {expected}, got {got}")
+            router_failures = failures
+
+    sys.exit(1 if router_failures else 0)
+
+
+if __name__ == "__main__":
+    main()
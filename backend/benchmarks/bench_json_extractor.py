@@ -0,0 +1,85 @@
+"""How many malformed LLM analysis answers are recovered, legacy strip-and-json.loads vs json_extractor.
+
+Each sample is a real-world style defect: prose preambles, fences, single
+quotes, Python literals, trailing commas and answers cut off at max_tokens.
+
+Run: python benchmarks/bench_json_extractor.py
+"""
+import json
+import os
+import sys
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from json_extractor import extract_analysis, ExtractionStats
+import json_extractor
+
+ANALYSIS = {
+    "summary": "Discussed Phase III efficacy data for OncoBoost",
+    "sentiment": "positive",
+    "specialty": "Oncology",
+    "next_action": "Send trial PDF and schedule follow-up",
+    "priority": "high",
+    "topics": ["efficacy", "trial data"],
+}
+CLEAN = json.dumps(ANALYSIS, indent=2)
+
+SAMPLES = {
+    "clean": CLEAN,
+    "fenced": f"```json\n{CLEAN}\n```",
+    "preamble": f"Here is the analysis of the interaction:\n{CLEAN}",
+    "trailing_fence": f"{CLEAN}\n```",
+    "prose_after": f"{CLEAN}\n\nLet me know if you need anything else.",
+    "single_quotes": str(ANALYSIS),
+    "python_literals": str(dict(ANALYSIS, follow_up=True)),
+    "trailing_comma": CLEAN[:-2] + ",\n}",
+    "truncated_value": CLEAN[:CLEAN.index('"trial data"') + 4],
+    "truncated_key": CLEAN[:CLEAN.index('"topics"') + 5],
+    "unquoted_keys": "{" + ", ".join(f"{key}: {json.dumps(value)}" for key, value in ANALYSIS.items()) + "}",
+    "aliased_fields": json.dumps({"summary": ANALYSIS["summary"], "sentiment": "Positive",
+                                  "specialty": "Oncology", "next_action": "Follow up",
+                                  "priority_level": "HIGH", "key_topics": "efficacy, trial data"}),
+    "no_json": "I'm sorry, I can't analyse this interaction.",
+}
+
+FALLBACK = {"summary": "fallback", "sentiment": "neutral", "specialty": "General Medicine",
+            "next_action": "Schedule follow-up meeting", "priority": "medium", "topics": ["discussion"]}
+
+
+def legacy_parse(ai_response):
+    """final_app.parse_analysis before json_extractor"""
+    try:
+        cleaned = ai_response.strip()
+        if cleaned.startswith("```json"):
+            cleaned = cleaned.replace("```json", "").replace("```", "")
+        return json.loads(cleaned)
+    except:
+        return None
+
+
+def main():
+    print(f"{'sample':<18}{'legacy':>8}{'extractor':>12}")
+    legacy_ok = extractor_ok = 0
+    for name, text in SAMPLES.items():
+        json_extractor.extraction_stats = ExtractionStats()
+        legacy = legacy_parse(text) is not None
+        extracted = extract_analysis(text, FALLBACK)
+        recovered = json_extractor.extraction_stats.fallbacks == 0
+        legacy_ok += legacy
+        extractor_ok += recovered
+        repairs = ",".join(sorted(json_extractor.extraction_stats.repairs)) or "-"
+        print(f"{name:<18}{'ok' if legacy else 'FALLBACK':>8}{'ok' if recovered else 'FALLBACK':>12}  {repairs}")
+        if recovered and extracted["summary"] == FALLBACK["summary"]:
+            print(f"  unexpected fallback summary for {name}")
+    print(f"\nrecovered: legacy {legacy_ok}/{len(SAMPLES)}, extractor {extractor_ok}/{len(SAMPLES)}")
+
+    rounds = 2000
+    for name in ("clean", "preamble", "truncated_value"):
+        start = time.perf_counter()
+        for _ in range(rounds):
+            extract_analysis(SAMPLES[name], FALLBACK)
+        print(f"{name}: {(time.perf_counter() - start) / rounds * 1e6:.0f} us per answer")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Recording overhead of the metrics module, per call and per HTTP request.
+
+Measures Counter.inc and Histogram.observe from one thread and from several
+threads at once (each records into its own shard), then the per-request
+cost of PrometheusMiddleware on an in-process FastAPI app.
+
+Run: python benchmarks/bench_metrics.py
+"""
+import argparse
+import asyncio
+import os
+import sys
+import threading
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+from fastapi import FastAPI
+from metrics import Registry, PrometheusMiddleware
+
+
+def per_call_ns(fn, calls):
+    start = time.perf_counter()
+    for _ in range(calls):
+        fn()
+    return (time.perf_counter() - start) / calls * 1e9
+
+
+def threaded_ns(fn, calls, threads):
+    """Wall time per call with `threads` threads recording at once"""
+    barrier = threading.Barrier(threads + 1)
+
+    def run():
+        barrier.wait()
+        for _ in range(calls):
+            fn()
+
+    workers = [threading.Thread(target=run) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for worker in workers:
+        worker.join()
+    return (time.perf_counter() - start) / (calls * threads) * 1e9
+
+
+def make_app(instrumented):
+    registry = Registry()
+    app = FastAPI()
+    if instrumented:
+        histogram = registry.histogram("http_seconds", "latency", ("method", "path", "status"))
+        app.add_middleware(PrometheusMiddleware, histogram=histogram)
+
+    @app.get("/ping")
+    async def ping():
+        return {"ok": True}
+
+    return app
+
+
+async def per_request_us(app, requests):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for _ in range(200):
+            await client.get("/ping")
+        start = time.perf_counter()
+        for _ in range(requests):
+            await client.get("/ping")
+        return (time.perf_counter() - start) / requests * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=500000)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=3000)
+    args = parser.parse_args()
+
+    registry = Registry()
+    counter = registry.counter("bench_total", "bench", ("status",))
+    histogram = registry.histogram("bench_seconds", "bench", ("path",))
+    baseline = per_call_ns(lambda: None, args.calls)
+    inc = lambda: counter.inc(1, "200")
+    observe = lambda: histogram.observe(0.0123, "/chat")
+
+    print(f"{'operation':<22}{'1 thread ns':>13}{f'{args.threads} threads ns':>16}")
+    for name, fn in (("counter.inc", inc), ("histogram.observe", observe)):
+        single = per_call_ns(fn, args.calls) - baseline
+        threaded = threaded_ns(fn, args.calls // args.threads, args.threads) - baseline
+        print(f"{name:<22}{single:>13.0f}{threaded:>16.0f}")
+
+    start = time.perf_counter()
+    registry.exposition()
+    print(f"exposition: {(time.perf_counter() - start) * 1000:.2f} ms")
+
+    plain = asyncio.run(per_request_us(make_app(False), args.requests))
+    instrumented = asyncio.run(per_request_us(make_app(True), args.requests))
+    print(f"\nGET /ping in-process: {plain:.0f} us plain, {instrumented:.0f} us with PrometheusMiddleware "
+          f"(+{instrumented - plain:.1f} us, {(instrumented - plain) / plain * 100:.1f}%)")
+
+
+if __name__ == "__main__":
+    main()
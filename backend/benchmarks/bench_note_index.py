@@ -0,0 +1,93 @@
+"""Build rate, size and top-k search latency of the note retrieval index.
+
+Indexes --rows synthetic interaction notes (no database involved) into a
+temporary NOTE_INDEX_PATH in NOTE_INDEX_BATCH_SIZE appends, then times:
+- per-HCP search: top-k of one HCP's notes, the suggestion path
+- global search: top-k over every note
+Relevance check: for sampled HCPs, a query made of one detail clause from
+their notes should return a note containing that clause first.
+
+Run: python benchmarks/bench_note_index.py --rows 1000000
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from note_index import NoteIndex, NOTE_INDEX_BATCH_SIZE, NOTE_INDEX_DIM, note_text
+from synthetic_data import DETAILS, TOPICS, generate_rows, hcp_names
+from bench_history import report, timed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--hcps", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=NOTE_INDEX_DIM)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--iterations", type=int, default=300)
+    parser.add_argument("--sample-hcps", type=int, default=200, help="HCPs whose notes are kept for the relevance check")
+    args = parser.parse_args()
+
+    path = tempfile.mkdtemp(prefix="crm_note_index_")
+    try:
+        index = NoteIndex(path, dim=args.dim)
+        sampled = set(random.Random(2).sample(hcp_names(args.hcps), args.sample_hcps))
+        notes_of = {}
+        batch, embed_seconds = [], 0.0
+        start = time.perf_counter()
+        for interaction_id, row in enumerate(generate_rows(args.rows, hcp_count=args.hcps), start=1):
+            text = note_text(row["raw_notes"], row["ai_summary"])
+            batch.append((interaction_id, row["hcp_name"], text))
+            if row["hcp_name"] in sampled:
+                notes_of.setdefault(row["hcp_name"], {})[interaction_id] = text
+            if len(batch) == NOTE_INDEX_BATCH_SIZE:
+                t = time.perf_counter()
+                index.add(batch)
+                embed_seconds += time.perf_counter() - t
+                batch = []
+                print(f"\r  indexed {interaction_id:,} notes", end="", flush=True)
+        if batch:
+            t = time.perf_counter()
+            index.add(batch)
+            embed_seconds += time.perf_counter() - t
+        elapsed = time.perf_counter() - start
+        stats = index.stats()
+        print(f"\r  indexed {stats['notes']:,} notes in {elapsed:.1f}s "
+              f"(embedding + append {stats['notes'] / embed_seconds:,.0f} notes/s), {args.dim} dims, "
+              f"{stats['size_mb']:,.0f} MB of vectors and ids")
+
+        rng = random.Random(1)
+        names = sorted(notes_of)
+        queries = DETAILS + TOPICS
+
+        # Touch the mapped pages the way a warmed-up server would have
+        for _ in range(20):
+            index.search(rng.choice(queries), k=args.k)
+
+        report(f"per-HCP top-{args.k}", timed(
+            lambda: index.search(rng.choice(queries), rng.choice(names), args.k), args.iterations))
+        report(f"global top-{args.k} ({stats['notes']:,} notes)", timed(
+            lambda: index.search(rng.choice(queries), k=args.k), max(20, args.iterations // 10)))
+
+        hits = checked = 0
+        for name in names:
+            with_detail = [(i, text) for i, text in notes_of[name].items() if any(d in text for d in DETAILS)]
+            if not with_detail:
+                continue
+            _, text = rng.choice(with_detail)
+            clause = rng.choice([d for d in DETAILS if d in text])
+            results = index.search(clause, name, args.k)
+            checked += 1
+            hits += bool(results) and clause in notes_of[name][results[0][0]]
+        print(f"relevance: a note containing the queried clause ranked first for {hits}/{checked} HCPs")
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""Prompt size and render cost of the registry templates against the old f-string prompts, and long-note budgeting.
+
+Sizes are counted with prompt_registry.count_tokens, the same local
+approximation the budgets use, so they compare the two prompt texts with
+each other rather than reproduce the upstream's exact bill. Prompts are
+built for every note in the extraction corpus; the long-note part pads notes
+with synthetic detail sentences up to --long-tokens and shows what is sent.
+
+Run: python benchmarks/bench_prompts.py
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import final_app
+from llm_batcher import build_batch_prompt
+from prompt_registry import count_tokens, PROMPT_CONTEXT_TOKENS, PROMPT_NOTES_TOKEN_BUDGET
+from extraction_corpus import EXTRACTION_CORPUS
+from synthetic_data import DETAILS
+
+CONTEXT = [
+    "- 2024-03-02 (positive): Efficacy discussion about CardioMax (positive). Notes: Met with Dr. Smith to discuss "
+    "efficacy for CardioMax. Asked for renal impairment data.",
+    "- 2024-02-11 (neutral): Samples discussion about CardioMax (neutral). Notes: Dropped off CardioMax samples, "
+    "Dr. Smith asked about samples. Prefers email follow-up.",
+    "- 2024-01-20 (negative): Pricing discussion about CardioMax (negative). Notes: Dr. Smith raised concerns about "
+    "pricing with CardioMax. Raised cost concerns for uninsured patients.",
+]
+
+
+def legacy_analysis_prompt(user_input, hcp_name):
+    """build_analysis_prompt as final_app had it"""
+    return f"""
+    Analyze this healthcare professional interaction:
+    
+    Input: {user_input}
+    HCP: {hcp_name}
+    
+    Return JSON only:
+    {{
+        "summary": "brief summary",
+        "sentiment": "positive/neutral/negative", 
+        "specialty": "medical specialty",
+        "next_action": "suggested action",
+        "priority": "high/medium/low",
+        "topics": ["topic1", "topic2"]
+    }}
+    """
+
+
+def legacy_suggestions_prompt(hcp_name, context=()):
+    """build_suggestions_prompt as final_app had it"""
+    history = ""
+    if context:
+        notes = "\n".join(context)
+        history = f"""
+    Past interactions with {hcp_name}, most relevant first:
+{notes}
+    
+    Base the actions on these interactions.
+    """
+    return f"""
+    Suggest 3-5 next actions for healthcare professional {hcp_name}.
+    {history}
+    Return as numbered list:
+    1. Action with timing
+    2. Action with timing
+    etc.
+    """
+
+
+LEGACY_BATCH_HEADER = """
+    Analyze each healthcare professional interaction below. Each line is one
+    interaction as JSON with an "id", the "hcp" and the rep's "input" notes.
+
+"""
+
+LEGACY_BATCH_FOOTER = """
+    Return a JSON array only, with one object per interaction, in any order:
+    [
+        {
+            "id": <id of the interaction>,
+            "summary": "brief summary",
+            "sentiment": "positive/neutral/negative",
+            "specialty": "medical specialty",
+            "next_action": "suggested action",
+            "priority": "high/medium/low",
+            "topics": ["topic1", "topic2"]
+        }
+    ]
+    """
+
+
+def legacy_batch_prompt(items):
+    lines = "\n".join(json.dumps({"id": i, "hcp": hcp_name, "input": note}) for i, (note, hcp_name) in enumerate(items))
+    return LEGACY_BATCH_HEADER + lines + "\n" + LEGACY_BATCH_FOOTER
+
+
+def render_us(build, cases, seconds):
+    """Mean microseconds per prompt over repeated passes through the cases"""
+    calls, start = 0, time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        for case in cases:
+            build(*case)
+        calls += len(cases)
+    return (time.perf_counter() - start) / calls * 1e6
+
+
+def compare(label, legacy, current, cases, seconds):
+    old = [count_tokens(legacy(*case)) for case in cases]
+    new = [count_tokens(current(*case)) for case in cases]
+    saved = 1 - sum(new) / sum(old)
+    print(f"{label:<28} tokens {statistics.mean(old):6.1f} -> {statistics.mean(new):6.1f} ({saved:5.1%} fewer)  "
+          f"render {render_us(legacy, cases, seconds):5.1f} -> {render_us(current, cases, seconds):5.1f} us")
+
+
+def long_note(rng, tokens):
+    sentences = ["Met with Dr. Smith to discuss dosing for CardioMax."]
+    while count_tokens(" ".join(sentences)) < tokens:
+        sentences.append(rng.choice(DETAILS))
+    sentences.append("Agreed to send the phase III summary and follow up next Tuesday.")
+    return " ".join(sentences)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=0.5, help="time spent rendering each prompt kind")
+    parser.add_argument("--long-tokens", type=int, nargs="+", default=[500, 2000, 10000, 50000])
+    args = parser.parse_args()
+
+    notes = [(message, expected["hcp_name"]) for message, expected in EXTRACTION_CORPUS]
+    print(f"{len(notes)} corpus notes, local token counts per prompt")
+    compare("analyze_interaction", legacy_analysis_prompt, final_app.build_analysis_prompt, notes, args.seconds)
+    hcps = [(hcp_name,) for _, hcp_name in notes]
+    compare("get_ai_suggestions", legacy_suggestions_prompt, final_app.build_suggestions_prompt, hcps, args.seconds)
+    with_context = [(hcp_name, CONTEXT) for _, hcp_name in notes]
+    compare("  with 3 past notes", legacy_suggestions_prompt, final_app.build_suggestions_prompt, with_context,
+            args.seconds)
+    batches = [(notes[i:i + 10],) for i in range(0, len(notes), 10)]
+    compare("analyze_interaction_batch", legacy_batch_prompt, build_batch_prompt, batches, args.seconds)
+
+    print(f"\nlong notes (PROMPT_NOTES_TOKEN_BUDGET={PROMPT_NOTES_TOKEN_BUDGET}, "
+          f"PROMPT_CONTEXT_TOKENS={PROMPT_CONTEXT_TOKENS})")
+    rng = random.Random(1)
+    for tokens in args.long_tokens:
+        note = long_note(rng, tokens)
+        old = count_tokens(legacy_analysis_prompt(note, "Dr. Smith"))
+        start = time.perf_counter()
+        prompt = final_app.build_analysis_prompt(note, "Dr. Smith")
+        elapsed = (time.perf_counter() - start) * 1000
+        fits = "fits" if old + final_app.ANALYSIS_PROMPT.answer_tokens <= PROMPT_CONTEXT_TOKENS else "over context"
+        print(f"  {tokens:>6,}-token note: old prompt {old:>6,} tokens ({fits}), sent {count_tokens(prompt):>5,} "
+              f"tokens in {elapsed:6.2f} ms; keeps the follow-up: {'next Tuesday' in prompt}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Interactive vs batch outcomes against a throttling upstream, with and without the client-side limiter.
+
+Starts the mock Groq server with a requests-per-second limit (429 +
+Retry-After beyond it). Batch workers keep the upstream saturated while
+interactive workers send chat-sized requests. "none" behaves like the
+client before rate limiting: no retries and no header handling, so every
+429 becomes a fallback answer. "limiter" paces requests to the known limit,
+serves interactive callers first and retries with jittered backoff.
+
+Run: python benchmarks/bench_rate_limiter.py --rate-limit-rps 20 --seconds 10
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from llm_client import LLMClient, LLMError
+from rate_limiter import RateLimiter, INTERACTIVE, BATCH, PRIORITY_NAMES
+from load_test import start_process, wait_until_up, percentile
+
+
+class NoLimiter(RateLimiter):
+    """Admits everything immediately and ignores the provider's headers"""
+
+    def __init__(self):
+        super().__init__(0, 0)
+
+    async def observe(self, status_code, headers):
+        pass
+
+
+async def worker(client, priority, seconds, think_time, results):
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        start = time.perf_counter()
+        try:
+            await client.complete("Say OK", max_tokens=5, priority=priority, timeout=30)
+            ok = True
+        except LLMError:
+            ok = False
+        results[priority].append((ok, time.perf_counter() - start))
+        if think_time:
+            await asyncio.sleep(think_time)
+
+
+async def run(url, mode, args):
+    if mode == "none":
+        client = LLMClient("mock-key", url, rate_limiter=NoLimiter(), max_retries=0)
+    else:
+        limiter = RateLimiter(requests_per_minute=args.rate_limit_rps * 60, burst_seconds=1)
+        client = LLMClient("mock-key", url, rate_limiter=limiter)
+    results = {INTERACTIVE: [], BATCH: []}
+    await asyncio.gather(
+        *(worker(client, BATCH, args.seconds, 0, results) for _ in range(args.batch_workers)),
+        *(worker(client, INTERACTIVE, args.seconds, args.think_ms / 1000, results)
+          for _ in range(args.interactive_workers)),
+    )
+    for priority, samples in results.items():
+        latencies = [latency for ok, latency in samples if ok]
+        failed = sum(1 for ok, _ in samples if not ok)
+        p50 = percentile(latencies, 50) * 1000 if latencies else 0
+        p99 = percentile(latencies, 99) * 1000 if latencies else 0
+        print(f"{mode:<9}{PRIORITY_NAMES[priority]:<13}{len(samples):>7}{failed:>8}{p50:>10.0f}{p99:>10.0f}")
+    if mode != "none":
+        print(f"         limiter: {client.rate_limiter.stats()} retries={client.retries}")
+    await client.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rate-limit-rps", type=float, default=20)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--latency-ms", type=float, default=100)
+    parser.add_argument("--batch-workers", type=int, default=20)
+    parser.add_argument("--interactive-workers", type=int, default=4)
+    parser.add_argument("--think-ms", type=float, default=250)
+    parser.add_argument("--mock-port", type=int, default=9100)
+    args = parser.parse_args()
+
+    mock = start_process(["benchmarks/mock_groq.py", "--port", str(args.mock_port),
+                          "--latency-ms", str(args.latency_ms), "--rate-limit-rps", str(args.rate_limit_rps)])
+    try:
+        base = f"http://127.0.0.1:{args.mock_port}/openai/v1"
+        wait_until_up(f"{base}/models")
+        print(f"{'mode':<9}{'priority':<13}{'calls':>7}{'failed':>8}{'p50 ms':>10}{'p99 ms':>10}")
+        for mode in ("none", "limiter"):
+            asyncio.run(run(f"{base}/chat/completions", mode, args))
+    finally:
+        mock.terminate()
+        mock.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Throughput of serve.py at 1, 2, 4 and 8 worker processes under the bench_suite traffic mix.
+
+Starts the mock Groq server once, then for each worker count launches
+serve.py (shared state and cache files in a temp directory, throwaway
+SQLite database) and drives the mixed /chat, /log-interaction and /health
+load for a fixed time. Reports requests/second, scaling relative to one
+worker, p50/p99 latency and total RSS. Throughput can only scale while
+there are idle cores: on a box with fewer cores than workers, the extra
+workers compete for the same CPU. RSS is summed over the supervisor and
+workers, so copy-on-write pages shared after the fork count in each.
+
+Run: python benchmarks/bench_scaling.py --workers 1 2 4 8 --concurrency 64 --seconds 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from load_test import BENCH_DIR, start_process, wait_until_up
+from bench_suite import MemorySampler, drive, parse_mix
+
+
+def run_workers(workers, args, mock_url, weights):
+    state_dir = tempfile.mkdtemp(prefix=f"crm_scaling_{workers}_")
+    env = dict(os.environ,
+               GROQ_API_KEY="mock-key",
+               GROQ_URL=mock_url,
+               DATABASE_URL=f"sqlite:///{os.path.join(state_dir, 'crm.db')}",
+               SHARED_STATE_PATH=os.path.join(state_dir, "shared_state.db"),
+               LLM_CACHE_PATH=os.path.join(state_dir, "llm_cache.db"),
+               LLM_REQUESTS_PER_MINUTE="0",
+               LLM_TOKENS_PER_MINUTE="0")
+    server = start_process(["serve.py", "--workers", str(workers), "--port", str(args.port),
+                            "--host", "127.0.0.1", "--graceful-timeout", "5"], env=env)
+    sampler = MemorySampler(server.pid)
+    try:
+        wait_until_up(f"http://127.0.0.1:{args.port}/", timeout=60.0)
+        sampler.start()
+        results = asyncio.run(drive(f"http://127.0.0.1:{args.port}", weights, args.concurrency, args.seconds, args.seed))
+        sampler.stopped.set()
+        results["memory"] = sampler.report()
+    finally:
+        sampler.stopped.set()
+        server.terminate()
+        server.wait()
+    results["workers"] = workers
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--profile", default="fast", help="mock upstream profile (see mock_groq.PROFILES)")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--seconds", type=float, default=20.0)
+    parser.add_argument("--mix", help='scenario weights, e.g. "chat_log=50,health=50"')
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--port", type=int, default=8170)
+    parser.add_argument("--mock-port", type=int, default=9100)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    weights = parse_mix(args.mix)
+    mock = start_process([os.path.join(BENCH_DIR, "mock_groq.py"), "--port", str(args.mock_port),
+                          "--profile", args.profile])
+    runs = []
+    try:
+        wait_until_up(f"http://127.0.0.1:{args.mock_port}/openai/v1/models")
+        mock_url = f"http://127.0.0.1:{args.mock_port}/openai/v1/chat/completions"
+        print(f"{os.cpu_count()} CPUs, {args.concurrency} clients, {args.profile} upstream")
+        print(f"{'workers':>7}{'rps':>9}{'scaling':>9}{'p50 ms':>9}{'p99 ms':>9}{'errors':>8}{'RSS MB':>9}")
+        for workers in args.workers:
+            results = run_workers(workers, args, mock_url, weights)
+            runs.append(results)
+            overall = results["overall"]
+            scaling = overall["throughput_rps"] / runs[0]["overall"]["throughput_rps"]
+            rss = sum(process["peak_rss_mb"] for process in results["memory"])
+            print(f"{workers:>7}{overall['throughput_rps']:>9}{scaling:>8.2f}x{overall['p50_ms']:>9.0f}"
+                  f"{overall['p99_ms']:>9.0f}{overall['errors']:>8}{rss:>9.0f}")
+    finally:
+        mock.terminate()
+        mock.wait()
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"cpus": os.cpu_count(), "profile": args.profile, "concurrency": args.concurrency,
+                       "mix": weights, "runs": runs}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Latency of /search queries (selective, common, filtered, next page) on a large interactions table.
+
+Run: python benchmarks/synthetic_data.py --rows 3000000 --database-url sqlite:////tmp/crm_bench.db
+     python benchmarks/bench_search.py --database-url sqlite:////tmp/crm_bench.db
+The first run builds the full-text index over the loaded rows.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import timedelta
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import sessionmaker
+from models import HCPInteraction
+import search_service
+from search_service import init_search, search_interactions
+from synthetic_data import DETAILS, hcp_names, make_engine
+from bench_history import report, timed
+
+# Terms that appear in about 1 in 100 to 1 in 30 notes
+SELECTIVE_QUERIES = ["renal impairment", "warfarin", "QT prolongation", "pediatric formulation",
+                     "copay card", "home infusion", "biosimilar", "refrigeration"]
+# Terms that appear in one note in several
+COMMON_QUERIES = ["dosing", "samples", "efficacy", "side effects", "OncoBoost", "patients"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", default="sqlite:////tmp/crm_bench.db")
+    parser.add_argument("--hcps", type=int, default=50000, help="must match the generator's --hcps")
+    parser.add_argument("--iterations", type=int, default=300)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--window", type=int, default=search_service.SEARCH_RANK_WINDOW,
+                        help="most recent matches ranked per query (0 ranks every match)")
+    args = parser.parse_args()
+    search_service.SEARCH_RANK_WINDOW = args.window
+
+    engine = make_engine(args.database_url)
+    start = time.perf_counter()
+    init_search(engine)
+    print(f"search index ready in {time.perf_counter() - start:.1f}s")
+    Session = sessionmaker(bind=engine)
+    names = hcp_names(args.hcps)
+    rng = random.Random(1)
+
+    def search(session, query, **filters):
+        return search_interactions(session, query, limit=args.limit, **filters)
+
+    with Session() as session:
+        total = session.scalar(select(func.count()).select_from(HCPInteraction))
+        newest = session.scalar(select(func.max(HCPInteraction.interaction_date)))
+        print(f"{total:,} interactions in {args.database_url}, rank window {args.window or 'off'}")
+
+        # Warm the connection and page cache the way a running server would be
+        for query in SELECTIVE_QUERIES + COMMON_QUERIES:
+            search(session, query)
+
+        report("selective term", timed(lambda: search(session, rng.choice(SELECTIVE_QUERIES)), args.iterations))
+        report("detail clause (2-5 words)", timed(
+            lambda: search(session, rng.choice(DETAILS).rstrip(".")), args.iterations))
+        report("common term", timed(lambda: search(session, rng.choice(COMMON_QUERIES)), args.iterations))
+        report("common term + HCP", timed(
+            lambda: search(session, rng.choice(COMMON_QUERIES), hcp_name=rng.choice(names)), args.iterations))
+        report("common term + sentiment", timed(
+            lambda: search(session, rng.choice(COMMON_QUERIES), sentiment="negative"), args.iterations))
+        report("selective term + sentiment + 90d", timed(
+            lambda: search(session, rng.choice(SELECTIVE_QUERIES), sentiment="negative",
+                           date_from=newest - timedelta(days=90)), args.iterations))
+        report("common term + sentiment + 90d", timed(
+            lambda: search(session, rng.choice(COMMON_QUERIES), sentiment="negative",
+                           date_from=newest - timedelta(days=90)), args.iterations))
+
+        cursors = []
+        for query in SELECTIVE_QUERIES + COMMON_QUERIES:
+            page = search(session, query)
+            if page["next_cursor"]:
+                cursors.append((query, page["next_cursor"]))
+
+        def next_page():
+            query, cursor = rng.choice(cursors)
+            search_interactions(session, query, limit=args.limit, cursor=cursor)
+
+        report("next page via cursor", timed(next_page, args.iterations))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""Chat session memory at 10k concurrent sessions, suggestion prompt size per turn, and session store latency.
+
+Every session is fed the same kind of conversation the chat endpoint sees:
+notes about a handful of HCPs, "log that", "what next for him?" and
+history requests. Memory is measured with tracemalloc (bytes allocated by
+the sessions) against keeping each session's full transcript, messages and
+replies, which is what a naive implementation would hold and send back to
+the LLM. Prompt sizes are counted with prompt_registry.count_tokens.
+
+Run: python benchmarks/bench_sessions.py --sessions 10000 --turns 50
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import final_app
+from conversation_sessions import Session, SessionStore, SESSION_MAX_BYTES, SESSION_CONTEXT_TOKENS
+from intent_router import LOG_INTERACTION, VIEW_HISTORY, GET_SUGGESTIONS, GENERAL_CHAT
+from prompt_registry import count_tokens
+from synthetic_data import PHRASES, DETAILS, TOPICS, PRODUCTS, hcp_names
+from bench_history import report, timed
+
+ANALYSIS = {"summary": "Discussed efficacy data", "sentiment": "positive", "specialty": "Cardiology",
+            "next_action": "Send the phase III summary and follow up next week", "priority": "medium",
+            "topics": ["efficacy", "CardioMax"]}
+
+
+def conversation(rng, names):
+    """Endless (intent, message, hcp_name, outcome, reply) turns of one rep's chat about a few HCPs"""
+    book = rng.sample(names, 8)
+    while True:
+        hcp = rng.choice(book)
+        note = rng.choice(PHRASES).format(hcp=hcp, topic=rng.choice(TOPICS), product=rng.choice(PRODUCTS))
+        note += " " + " ".join(rng.sample(DETAILS, rng.randint(1, 3)))
+        outcome = final_app.log_outcome(ANALYSIS)
+        yield GENERAL_CHAT, note, hcp, "", final_app.GENERAL_CHAT_RESPONSE
+        yield LOG_INTERACTION, note, hcp, outcome, final_app.format_log_response(hcp, ANALYSIS)
+        yield GET_SUGGESTIONS, "and what next for him?", hcp, "", \
+            final_app.format_suggestions_response(hcp, final_app.FALLBACK_SUGGESTIONS)
+        if rng.random() < 0.3:
+            yield VIEW_HISTORY, "show his history", hcp, "", final_app.format_history_response(hcp, [])
+
+
+def feed(session, turns, count, transcript=None):
+    for _ in range(count):
+        intent, message, hcp, outcome, reply = next(turns)
+        session.record(intent, message, hcp, outcome)
+        if transcript is not None:
+            transcript.append((message, reply))
+
+
+def traced(build):
+    """(result of build(), bytes it left allocated)"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, after - before
+
+
+def memory(sessions, turns, names):
+    def sessions_only():
+        store, rng = SessionStore(max_sessions=sessions), random.Random(1)
+        for _ in range(sessions):
+            feed(store.open(), conversation(rng, names), turns)
+        return store
+
+    def transcripts():
+        kept, rng = {}, random.Random(1)
+        for i in range(sessions):
+            transcript = kept[f"session-{i}"] = []
+            feed(Session("", 0), conversation(rng, names), turns, transcript)
+        return kept
+
+    store, used = traced(sessions_only)
+    stats = store.stats()
+    _, naive = traced(transcripts)
+    print(f"{sessions:,} sessions x {turns} turns (SESSION_MAX_BYTES={SESSION_MAX_BYTES})")
+    print(f"  sessions:         {used / 2**20:7.1f} MiB, {used / sessions:7,.0f} B per session; "
+          f"largest measured {stats['largest_session_bytes']:,} B, {stats['items_dropped_for_size']:,} items dropped")
+    print(f"  full transcripts: {naive / 2**20:7.1f} MiB, {naive / sessions:7,.0f} B per session "
+          f"({naive / used:.0f}x)")
+
+
+def prompt_growth(checkpoints, names):
+    rng = random.Random(2)
+    turns, session, transcript = conversation(rng, names), Session("", 0), []
+    print(f"\nsuggestion prompt tokens by turn (SESSION_CONTEXT_TOKENS={SESSION_CONTEXT_TOKENS})")
+    done = 0
+    for checkpoint in checkpoints:
+        feed(session, turns, checkpoint - done, transcript)
+        done = checkpoint
+        hcp = session.hcp_name
+        summary = count_tokens(final_app.build_suggestions_prompt(hcp, (), session.summary()))
+        full = count_tokens(final_app.build_suggestions_prompt(
+            hcp, (), " ".join(f"{message} {reply}" for message, reply in transcript)))
+        print(f"  turn {checkpoint:>4}: rolling summary {summary:>5,}  full transcript {full:>7,}")
+
+
+def latency(sessions, iterations, names):
+    store, rng = SessionStore(max_sessions=sessions), random.Random(3)
+    ids = [store.open().id for _ in range(sessions)]
+    turns = conversation(rng, names)
+    print(f"\nstore operations at {sessions:,} live sessions")
+
+    def resume_and_record():
+        intent, message, hcp, outcome, _ = next(turns)
+        store.open(rng.choice(ids)).record(intent, message, hcp, outcome)
+    report("  resume + record turn", timed(resume_and_record, iterations))
+    report("  summary for prompt", timed(lambda: store.open(rng.choice(ids)).summary(), iterations))
+    report("  new session, LRU eviction", timed(store.open, iterations))
+
+    store.idle_ttl = 0.5
+    time.sleep(0.5)
+    start = time.perf_counter()
+    store.open()
+    print(f"  expiring {sessions:,} idle sessions in one sweep: {(time.perf_counter() - start) * 1000:.1f} ms; "
+          f"{store.stats()['active']} active, {store.counters['evicted']:,} evicted, "
+          f"{store.counters['expired']:,} expired")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=10000)
+    parser.add_argument("--turns", type=int, default=50)
+    parser.add_argument("--checkpoints", type=int, nargs="+", default=[1, 5, 20, 50, 200])
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+
+    names = hcp_names(5000)
+    memory(args.sessions, args.turns, names)
+    prompt_growth(args.checkpoints, names)
+    latency(args.sessions, args.iterations, names)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Upstream requests for a burst of identical prompts, with and without single-flight.
+
+Starts the mock Groq server and fires --callers concurrent identical
+"suggest next actions" completions, then repeats the burst with the first
+caller cancelled shortly after it starts, to check the shared call still
+answers everyone else.
+
+Run: python benchmarks/bench_single_flight.py --callers 50 --latency-ms 300
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from llm_client import LLMClient
+from load_test import start_process, wait_until_up
+
+PROMPT = "Suggest 3 specific next actions for pharmaceutical rep with Dr. Smith"
+
+
+async def burst(url, callers, single_flight, cancel_leader=False):
+    client = LLMClient("mock-key", url, single_flight=single_flight)
+    tasks = [asyncio.ensure_future(client.complete(PROMPT)) for _ in range(callers)]
+    start = time.perf_counter()
+    if cancel_leader:
+        await asyncio.sleep(0.05)
+        tasks[0].cancel()
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    elapsed = time.perf_counter() - start
+    answered = sum(1 for result in results if isinstance(result, str))
+    cancelled = sum(1 for result in results if isinstance(result, asyncio.CancelledError))
+    stats = client.stats()
+    await client.aclose()
+    return stats["upstream_requests"], answered, cancelled, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--callers", type=int, default=50)
+    parser.add_argument("--latency-ms", type=float, default=300.0)
+    parser.add_argument("--mock-port", type=int, default=9100)
+    args = parser.parse_args()
+
+    mock = start_process(["benchmarks/mock_groq.py", "--port", str(args.mock_port),
+                          "--latency-ms", str(args.latency_ms)])
+    try:
+        base = f"http://127.0.0.1:{args.mock_port}/openai/v1"
+        wait_until_up(f"{base}/models")
+        url = f"{base}/chat/completions"
+        print(f"{'mode':<28}{'upstream':>10}{'answered':>10}{'cancelled':>11}{'seconds':>9}")
+        for label, single_flight, cancel_leader in (("independent", False, False),
+                                                    ("single-flight", True, False),
+                                                    ("single-flight, leader gone", True, True)):
+            upstream, answered, cancelled, elapsed = asyncio.run(burst(url, args.callers, single_flight, cancel_leader))
+            print(f"{label:<28}{upstream:>10}{answered:>10}{cancelled:>11}{elapsed:>9.2f}")
+    finally:
+        mock.terminate()
+        mock.wait()
+
+
+if __name__ == "__main__":
+    main()
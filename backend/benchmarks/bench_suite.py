@@ -0,0 +1,310 @@
+"""End-to-end load test of final_app against the mock Groq server, with JSON results per commit.
+
+Starts mock_groq.py with an upstream profile (fast, normal, slow, flaky,
+throttled) and final_app under uvicorn with a throwaway SQLite database,
+then drives a weighted mix of /chat (log, history, suggest, general
+messages), /log-interaction and /health for a fixed time. Reports
+throughput, p50/p95/p99 latency and errors per scenario, and the peak
+RSS of every server process (the supervisor plus each worker). Failed
+upstream calls are answered from the fallback path, so the LLM fallback
+counts from /metrics are recorded alongside.
+
+Results go to benchmarks/results/<commit>-<profile>.json; --compare prints
+the change against an earlier results file.
+
+Run: python benchmarks/bench_suite.py --profile normal --concurrency 20 --seconds 30
+     python benchmarks/bench_suite.py --profile normal --compare benchmarks/results/abc1234-normal.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import httpx
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from load_test import BACKEND_DIR, BENCH_DIR, start_process, wait_until_up, percentile
+
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+
+HCPS = ["Smith", "Johnson", "Patel", "Chen", "Garcia", "Wilson", "Brown", "Lee", "Gupta", "Young"]
+TOPICS = ["cardiac devices", "OncoBoost trial data", "dosing schedule", "side effects", "formulary access",
+          "patient outcomes", "samples", "the new inhaler"]
+MOODS = ["very interested", "had concerns", "asked for data", "was neutral", "wants a follow-up"]
+
+# Scenario -> (method, path, weight). Weights are a rough picture of rep traffic.
+SCENARIOS = {
+    "chat_log": ("POST", "/chat", 35),
+    "chat_history": ("POST", "/chat", 15),
+    "chat_suggest": ("POST", "/chat", 15),
+    "chat_general": ("POST", "/chat", 10),
+    "log_interaction": ("POST", "/log-interaction", 10),
+    "health": ("GET", "/health", 15),
+}
+
+
+def make_body(scenario, rng, seq):
+    """A request body for one scenario; the sequence number keeps notes from hitting the LLM cache"""
+    hcp = f"Dr. {rng.choice(HCPS)}"
+    if scenario in ("chat_log", "log_interaction"):
+        return {"message": f"Met with {hcp} about {rng.choice(TOPICS)}, {rng.choice(MOODS)} (visit {seq})"}
+    if scenario == "chat_history":
+        return {"message": f"Show history for {hcp}"}
+    if scenario == "chat_suggest":
+        return {"message": f"Suggest next actions for {hcp} on {rng.choice(TOPICS)} ({seq})"}
+    if scenario == "chat_general":
+        return {"message": rng.choice(["Hello", "What can you do?", "How do I log a visit?"])}
+    return None
+
+
+def parse_mix(text):
+    """Weights from "chat_log=50,health=50"; scenarios not named keep their default weight"""
+    weights = {name: weight for name, (_, _, weight) in SCENARIOS.items()}
+    for part in filter(None, (text or "").split(",")):
+        name, _, weight = part.partition("=")
+        if name not in SCENARIOS:
+            raise SystemExit(f"Unknown scenario {name!r}; choose from {', '.join(SCENARIOS)}")
+        weights[name] = float(weight)
+    return weights
+
+
+def process_tree(pid):
+    """pid and all of its descendants (uvicorn --workers forks one child per worker)"""
+    pids = [pid]
+    for current in pids:
+        try:
+            with open(f"/proc/{current}/task/{current}/children") as f:
+                pids.extend(int(child) for child in f.read().split())
+        except OSError:
+            pass
+    return pids
+
+
+def rss_mb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+class MemorySampler(threading.Thread):
+    """Peak RSS per server process, sampled while the load runs (Linux /proc only)"""
+
+    def __init__(self, pid, interval=0.25):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.peaks = {}
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            self.sample()
+            self.stopped.wait(self.interval)
+
+    def sample(self):
+        for pid in process_tree(self.pid):
+            rss = rss_mb(pid)
+            if rss is not None:
+                self.peaks[pid] = max(self.peaks.get(pid, 0.0), rss)
+
+    def role(self, pid):
+        if pid == self.pid:
+            return "supervisor" if len(self.peaks) > 1 else "worker"
+        try:
+            with open(f"/proc/{pid}/cmdline", "rb") as f:
+                # multiprocessing's resource tracker, started alongside spawned workers
+                return "helper" if b"resource_tracker" in f.read() else "worker"
+        except OSError:
+            return "worker"
+
+    def report(self):
+        self.sample()
+        return [{"pid": pid, "role": self.role(pid), "peak_rss_mb": round(rss, 1)}
+                for pid, rss in sorted(self.peaks.items())]
+
+
+async def drive(base_url, weights, concurrency, seconds, seed):
+    rng = random.Random(seed)
+    names = list(weights)
+    scenario_weights = [weights[name] for name in names]
+    samples = {name: [] for name in names}
+    errors = {name: 0 for name in names}
+    seq = iter(range(10 ** 9))
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=120.0) as client:
+        async def worker():
+            while time.monotonic() < deadline:
+                scenario = rng.choices(names, scenario_weights)[0]
+                method, path, _ = SCENARIOS[scenario]
+                body = make_body(scenario, rng, next(seq))
+                start = time.perf_counter()
+                try:
+                    response = await client.request(method, path, json=body)
+                    ok = response.status_code < 400
+                except httpx.HTTPError:
+                    ok = False
+                elapsed = (time.perf_counter() - start) * 1000
+                if ok:
+                    samples[scenario].append(elapsed)
+                else:
+                    errors[scenario] += 1
+
+        deadline = time.monotonic() + seconds
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return summarize(samples, errors, elapsed)
+
+
+def latency_stats(latencies, errors, elapsed):
+    stats = {"requests": len(latencies) + errors, "errors": errors,
+             "throughput_rps": round(len(latencies) / elapsed, 1)}
+    for pct in (50, 95, 99):
+        stats[f"p{pct}_ms"] = round(percentile(latencies, pct), 1) if latencies else None
+    return stats
+
+
+def summarize(samples, errors, elapsed):
+    scenarios = {name: latency_stats(samples[name], errors[name], elapsed) for name in samples if samples[name] or errors[name]}
+    everything = [latency for latencies in samples.values() for latency in latencies]
+    return {"duration_s": round(elapsed, 2), "overall": latency_stats(everything, sum(errors.values()), elapsed),
+            "scenarios": scenarios}
+
+
+def fallback_counts(base_url):
+    """crm_llm_fallbacks_total by reason from /metrics (one worker's view when --workers > 1)"""
+    counts = {}
+    try:
+        text = httpx.get(f"{base_url}/metrics", timeout=5.0).text
+    except httpx.HTTPError:
+        return counts
+    for line in text.splitlines():
+        if line.startswith("crm_llm_fallbacks_total{"):
+            labels, value = line.rsplit(" ", 1)
+            counts[labels.split('"')[1]] = int(float(value))
+    return counts
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=BACKEND_DIR,
+                               capture_output=True, text=True).stdout.strip()
+        return commit + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def print_results(results):
+    print(f"{'scenario':<17}{'requests':>9}{'errors':>8}{'rps':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    rows = list(results["scenarios"].items()) + [("overall", results["overall"])]
+    for name, stats in rows:
+        p50, p95, p99 = (f"{stats[key]:.0f}" if stats[key] is not None else "-" for key in ("p50_ms", "p95_ms", "p99_ms"))
+        print(f"{name:<17}{stats['requests']:>9}{stats['errors']:>8}{stats['throughput_rps']:>8}{p50:>9}{p95:>9}{p99:>9}")
+    for process in results["memory"]:
+        print(f"{process['role']} pid {process['pid']}: peak RSS {process['peak_rss_mb']} MB")
+    if results["llm_fallbacks"]:
+        print("LLM fallbacks: " + ", ".join(f"{reason}={count}" for reason, count in results["llm_fallbacks"].items()))
+
+
+def change(new, old):
+    if new is None or not old:
+        return "-"
+    return f"{(new - old) / old * 100:+.1f}%"
+
+
+def print_comparison(results, baseline):
+    print(f"\nvs {baseline['commit']} ({baseline['profile']} profile)")
+    print(f"{'scenario':<17}{'rps':>10}{'p50':>10}{'p95':>10}{'p99':>10}")
+    names = [name for name in results["scenarios"] if name in baseline["scenarios"]] + ["overall"]
+    for name in names:
+        new = results["overall"] if name == "overall" else results["scenarios"][name]
+        old = baseline["overall"] if name == "overall" else baseline["scenarios"][name]
+        print(f"{name:<17}" + "".join(f"{change(new[key], old[key]):>10}"
+                                      for key in ("throughput_rps", "p50_ms", "p95_ms", "p99_ms")))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--profile", default="normal", help="mock upstream profile (see mock_groq.PROFILES)")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--seconds", type=float, default=30.0)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--mix", help='scenario weights, e.g. "chat_log=50,health=50"')
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--port", type=int, default=8150)
+    parser.add_argument("--mock-port", type=int, default=9100)
+    parser.add_argument("--output", help="results file (default benchmarks/results/<commit>-<profile>.json)")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    args = parser.parse_args()
+
+    weights = parse_mix(args.mix)
+    db_dir = tempfile.mkdtemp(prefix="crm_bench_")
+    env = dict(os.environ,
+               GROQ_API_KEY="mock-key",
+               GROQ_URL=f"http://127.0.0.1:{args.mock_port}/openai/v1/chat/completions",
+               DATABASE_URL=f"sqlite:///{os.path.join(db_dir, 'crm.db')}",
+               LLM_CACHE_PATH="",
+               LLM_REQUESTS_PER_MINUTE="0",
+               LLM_TOKENS_PER_MINUTE="0")
+
+    mock = start_process([os.path.join(BENCH_DIR, "mock_groq.py"), "--port", str(args.mock_port),
+                          "--profile", args.profile])
+    server = start_process(["-m", "uvicorn", "final_app:app", "--port", str(args.port), "--log-level", "warning",
+                            "--workers", str(args.workers)], env=env)
+    sampler = MemorySampler(server.pid)
+    try:
+        wait_until_up(f"http://127.0.0.1:{args.mock_port}/openai/v1/models")
+        wait_until_up(f"http://127.0.0.1:{args.port}/", timeout=60.0)
+        sampler.start()
+        results = asyncio.run(drive(f"http://127.0.0.1:{args.port}", weights, args.concurrency, args.seconds, args.seed))
+        sampler.stopped.set()
+        results["memory"] = sampler.report()
+        results["llm_fallbacks"] = fallback_counts(f"http://127.0.0.1:{args.port}")
+    finally:
+        sampler.stopped.set()
+        server.terminate()
+        server.wait()
+        mock.terminate()
+        mock.wait()
+
+    results.update({
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "profile": args.profile,
+        "concurrency": args.concurrency,
+        "workers": args.workers,
+        "mix": weights,
+        "seed": args.seed,
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+    })
+    print_results(results)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{results['commit']}-{args.profile}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""Latency of trend reports over a large interactions table.
+
+Times, for --days and a 365-day window:
+- cold: every day counted with the GROUP BY pushdown
+- warm: closed days served from the cache, only today recounted
+- columnar: the same report from NumPy arrays already exported
+and checks that the columnar report matches the database one.
+
+Run: python benchmarks/synthetic_data.py --rows 10000000 --database-url sqlite:////tmp/crm_bench.db
+     python benchmarks/bench_trends.py --database-url sqlite:////tmp/crm_bench.db
+"""
+import argparse
+import os
+import sys
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import sessionmaker
+from models import HCPInteraction, init_db
+from analytics_service import TrendAnalytics, load_columns, report_from_columns, window_days
+from synthetic_data import make_engine
+from bench_history import report, timed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", default="sqlite:////tmp/crm_bench.db")
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--iterations", type=int, default=20)
+    args = parser.parse_args()
+
+    engine = make_engine(args.database_url)
+    start = time.perf_counter()
+    init_db(engine)
+    print(f"schema and indexes ready in {time.perf_counter() - start:.1f}s")
+    Session = sessionmaker(bind=engine)
+    with Session() as session:
+        total = session.scalar(select(func.count()).select_from(HCPInteraction))
+    print(f"{total:,} interactions in {args.database_url}")
+
+    for days in (args.days, 365):
+        analytics = TrendAnalytics(session_factory=Session)
+        # Warm the page cache the way a running server would be, then drop the report cache
+        analytics.report(days)
+
+        def cold():
+            analytics.clear()
+            return analytics.report(days)
+
+        cold_report = cold()
+        print(f"{days}-day window: {cold_report['total_interactions']:,} interactions")
+        report(f"{days}d cold (every day counted)", timed(cold, args.iterations))
+        analytics.report(days)
+        report(f"{days}d warm (only today counted)", timed(lambda: analytics.report(days), args.iterations))
+
+        with Session() as session:
+            start = time.perf_counter()
+            columns = load_columns(session, *window_days(days))
+        print(f"  exported {len(columns['day']):,} rows to columns in "
+              f"{time.perf_counter() - start:.1f}s")
+        report(f"{days}d columnar", timed(lambda: report_from_columns(columns, days), args.iterations))
+
+        columnar = report_from_columns(columns, days)
+        database = {key: value for key, value in cold_report.items() if key != "buckets"}
+        print(f"  columnar report matches database report: {columnar == database}")
+
+
+if __name__ == "__main__":
+    main()
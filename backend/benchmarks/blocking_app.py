@@ -0,0 +1,45 @@
+"""final_app with the original blocking requests.post Groq call, for "before" load-test numbers.
+
+Run: python benchmarks/blocking_app.py --port 8001
+"""
+import argparse
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+import uvicorn
+import final_app
+
+
+async def blocking_call_groq_api(prompt):
+    """The pre-LLMClient implementation: a synchronous HTTP call inside the event loop"""
+    try:
+        headers = {
+            "Authorization": f"Bearer {final_app.GROQ_API_KEY}",
+            "Content-Type": "application/json"
+        }
+        data = {
+            "model": "gemma2-9b-it",
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": 0.1,
+            "max_tokens": 500
+        }
+        response = requests.post(final_app.GROQ_URL, headers=headers, json=data, timeout=30)
+        if response.status_code == 200:
+            return response.json()["choices"][0]["message"]["content"]
+        print(f"Groq API Error: {response.status_code} - {response.text}")
+        return final_app.generate_fallback_response(prompt)
+    except Exception as e:
+        print(f"Groq API Exception: {e}")
+        return final_app.generate_fallback_response(prompt)
+
+
+final_app.call_groq_api = blocking_call_groq_api
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    args = parser.parse_args()
+    uvicorn.run(final_app.app, host=args.host, port=args.port, log_level="warning")
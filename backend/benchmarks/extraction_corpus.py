@@ -0,0 +1,99 @@
+"""Labelled chat notes for local extraction: known HCP profiles and (message, expected fields).
+
+Expected fields are hcp_name, sentiment, specialty and priority; specialty is
+None where the note gives no way to tell.
+"""
+
+# (name, specialty) rows as they would be in hcp_profiles
+KNOWN_PROFILES = [
+    ("Dr. Smith", "Cardiology"),
+    ("Dr. Sarah Lee", "Oncology"),
+    ("Dr. Patel", "Endocrinology"),
+    ("Dr. Johnson", "Neurology"),
+    ("Dr. Maria Garcia", "Pediatrics"),
+    ("Dr. Chen", "Dermatology"),
+    ("Dr. Brown", "Rheumatology"),
+    ("Dr. Wilson", None),
+]
+
+EXTRACTION_CORPUS = [
+    # Known HCPs: specialty comes from the profile
+    ("I met with Dr. Smith about cardiac devices, he was very interested",
+     {"hcp_name": "Dr. Smith", "sentiment": "positive", "specialty": "Cardiology", "priority": "medium"}),
+    ("Met Dr. Smith, discussed Product X efficacy, positive sentiment, shared brochure",
+     {"hcp_name": "Dr. Smith", "sentiment": "positive", "specialty": "Cardiology", "priority": "medium"}),
+    ("Visited Dr. Sarah Lee at the cancer center; she was skeptical about the trial data",
+     {"hcp_name": "Dr. Sarah Lee", "sentiment": "negative", "specialty": "Oncology", "priority": "medium"}),
+    ("Quick call with Dr. Lee, not interested in samples right now",
+     {"hcp_name": "Dr. Sarah Lee", "sentiment": "negative", "specialty": "Oncology", "priority": "medium"}),
+    ("Spoke to Dr. Patel about insulin dosing, she was pleased with the results",
+     {"hcp_name": "Dr. Patel", "sentiment": "positive", "specialty": "Endocrinology", "priority": "medium"}),
+    ("Dr. Patel reported an adverse event in a diabetic patient, needs follow-up immediately",
+     {"hcp_name": "Dr. Patel", "sentiment": "neutral", "specialty": "Endocrinology", "priority": "high"}),
+    ("Had a great call with Dr. Johnson regarding the migraine study",
+     {"hcp_name": "Dr. Johnson", "sentiment": "positive", "specialty": "Neurology", "priority": "medium"}),
+    ("Dr. Johnson was frustrated with prior authorization delays",
+     {"hcp_name": "Dr. Johnson", "sentiment": "negative", "specialty": "Neurology", "priority": "medium"}),
+    ("Met Dr. Garcia to talk about the pediatric formulation, no rush on the follow-up",
+     {"hcp_name": "Dr. Maria Garcia", "sentiment": "neutral", "specialty": "Pediatrics", "priority": "low"}),
+    ("Dr. Maria Garcia loved the patient education leaflets",
+     {"hcp_name": "Dr. Maria Garcia", "sentiment": "positive", "specialty": "Pediatrics", "priority": "medium"}),
+    ("Dropped off samples with Dr. Chen for the psoriasis clinic",
+     {"hcp_name": "Dr. Chen", "sentiment": "neutral", "specialty": "Dermatology", "priority": "medium"}),
+    ("Dr. Chen had no concerns about the new cream and agreed to prescribe it",
+     {"hcp_name": "Dr. Chen", "sentiment": "positive", "specialty": "Dermatology", "priority": "medium"}),
+    ("Dr. Brown was skeptical about pricing but open to a trial",
+     {"hcp_name": "Dr. Brown", "sentiment": "neutral", "specialty": "Rheumatology", "priority": "medium"}),
+    ("Dr. Brown declined the meeting and complained about our rep",
+     {"hcp_name": "Dr. Brown", "sentiment": "negative", "specialty": "Rheumatology", "priority": "medium"}),
+    ("Urgent: Dr. Brown wants the lupus safety data as soon as possible",
+     {"hcp_name": "Dr. Brown", "sentiment": "neutral", "specialty": "Rheumatology", "priority": "high"}),
+    ("Log my visit with Dr. Wilson",
+     {"hcp_name": "Dr. Wilson", "sentiment": "neutral", "specialty": None, "priority": "medium"}),
+    ("Met with Wilson and the heart failure team, very enthusiastic",
+     {"hcp_name": "Dr. Wilson", "sentiment": "positive", "specialty": "Cardiology", "priority": "medium"}),
+    ("show dr smith", {"hcp_name": "Dr. Smith", "sentiment": "neutral", "specialty": "Cardiology",
+                       "priority": "medium"}),
+    ("LOGGED A VISIT WITH DR. CHEN", {"hcp_name": "Dr. Chen", "sentiment": "neutral", "specialty": "Dermatology",
+                                      "priority": "medium"}),
+    ("Smith asked for the updated prescribing information",
+     {"hcp_name": "Dr. Smith", "sentiment": "neutral", "specialty": "Cardiology", "priority": "medium"}),
+    # HCPs not yet in the gazetteer
+    ("I met with Dr. Nguyen about asthma inhalers, she was receptive",
+     {"hcp_name": "Dr. Nguyen", "sentiment": "positive", "specialty": "Pulmonology", "priority": "medium"}),
+    ("Visited Dr. Okafor, worried about drug interactions with warfarin and blood pressure control",
+     {"hcp_name": "Dr. Okafor", "sentiment": "negative", "specialty": "Cardiology", "priority": "medium"}),
+    ("Doctor Rossi was happy with the chemotherapy support program",
+     {"hcp_name": "Dr. Rossi", "sentiment": "positive", "specialty": "Oncology", "priority": "medium"}),
+    ("Call with Dr. Kim about depression treatment; wants data next quarter",
+     {"hcp_name": "Dr. Kim", "sentiment": "neutral", "specialty": "Psychiatry", "priority": "low"}),
+    ("Dr. Ahmed refused to see reps this month",
+     {"hcp_name": "Dr. Ahmed", "sentiment": "negative", "specialty": None, "priority": "medium"}),
+    ("Meeting with Dr. Novak about arthritis, he is keen to try it with rheumatoid patients",
+     {"hcp_name": "Dr. Novak", "sentiment": "positive", "specialty": "Rheumatology", "priority": "medium"}),
+    ("Dr. Silva didn't like the side effects profile and was disappointed",
+     {"hcp_name": "Dr. Silva", "sentiment": "negative", "specialty": None, "priority": "medium"}),
+    ("Spoke with Dr. Haddad about thyroid dosing, escalate the sample request",
+     {"hcp_name": "Dr. Haddad", "sentiment": "neutral", "specialty": "Endocrinology", "priority": "high"}),
+    ("Met dr. park about epilepsy, very positive discussion",
+     {"hcp_name": "Dr. Park", "sentiment": "positive", "specialty": "Neurology", "priority": "medium"}),
+    ("Visited Dr. Fischer at the children's hospital to discuss infant dosing",
+     {"hcp_name": "Dr. Fischer", "sentiment": "neutral", "specialty": "Pediatrics", "priority": "medium"}),
+    ("Had lunch with Dr. Moreau, excellent conversation about eczema outcomes",
+     {"hcp_name": "Dr. Moreau", "sentiment": "positive", "specialty": "Dermatology", "priority": "medium"}),
+    ("Dr. Evans is reluctant to switch patients, concerned about cost",
+     {"hcp_name": "Dr. Evans", "sentiment": "negative", "specialty": None, "priority": "medium"}),
+    ("Met Dr. Ito regarding COPD, not urgent",
+     {"hcp_name": "Dr. Ito", "sentiment": "neutral", "specialty": "Pulmonology", "priority": "low"}),
+    # Names the old regexes got wrong
+    ("Discussed dosing with the nurse practitioner, positive",
+     {"hcp_name": "Dr. Unknown", "sentiment": "positive", "specialty": None, "priority": "medium"}),
+    ("Follow up with the team about samples",
+     {"hcp_name": "Dr. Unknown", "sentiment": "neutral", "specialty": None, "priority": "medium"}),
+    ("Lunch with Dr. Abbott's office staff, they were not happy with the delays",
+     {"hcp_name": "Dr. Abbott", "sentiment": "negative", "specialty": None, "priority": "medium"}),
+    ("Coffee with Dr. O'Brien, interested in the stroke prevention data",
+     {"hcp_name": "Dr. O'Brien", "sentiment": "positive", "specialty": "Neurology", "priority": "medium"}),
+    ("Caught Dr. Smith-Jones between patients, busy clinic, asked for cholesterol data",
+     {"hcp_name": "Dr. Smith-Jones", "sentiment": "neutral", "specialty": "Cardiology", "priority": "medium"}),
+]
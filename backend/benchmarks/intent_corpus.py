@@ -0,0 +1,56 @@
+"""Labelled chat messages for the intent router: (message, expected intent)."""
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from intent_router import LOG_INTERACTION, VIEW_HISTORY, GET_SUGGESTIONS, ANALYZE_TRENDS, GENERAL_CHAT
+
+INTENT_CORPUS = [
+    # Logging
+    ("I met with Dr. Smith about cardiac devices", LOG_INTERACTION),
+    ("Met Dr. Smith, discussed Product X efficacy, positive sentiment, shared brochure", LOG_INTERACTION),
+    ("Log my visit with Dr. Wilson", LOG_INTERACTION),
+    ("Visited Dr. Patel at the clinic this morning", LOG_INTERACTION),
+    ("Had a positive call with Dr. Johnson regarding OncoBoost trial", LOG_INTERACTION),
+    ("Spoke to Dr. Lee about dosing", LOG_INTERACTION),
+    ("Quick meeting with Dr. Brown, very interested in samples", LOG_INTERACTION),
+    ("Please log interaction: Dr. Chen asked about side effects", LOG_INTERACTION),
+    ("I met Dr. Gupta; what should I do next?", LOG_INTERACTION),
+    ("LOGGED A VISIT WITH DR. KING", LOG_INTERACTION),
+    ("Had a meeting with Dr. Lopez this morning", LOG_INTERACTION),
+    # History
+    ("Show history for Dr. Johnson", VIEW_HISTORY),
+    ("Show me history for Dr. Johnson", VIEW_HISTORY),
+    ("What are the past notes on Dr. Rao?", VIEW_HISTORY),
+    ("show dr smith", VIEW_HISTORY),
+    ("View previous interactions with Dr. Young", VIEW_HISTORY),
+    # Suggestions
+    ("Suggest next actions for Dr. Brown", GET_SUGGESTIONS),
+    ("What should I do next with Dr. Brown?", GET_SUGGESTIONS),
+    ("Any recommendations for Dr. Allen?", GET_SUGGESTIONS),
+    ("Show me suggestions for Dr. Scott", GET_SUGGESTIONS),
+    ("next steps for Dr. Wright", GET_SUGGESTIONS),
+    ("Which action is best for Dr. Hall?", GET_SUGGESTIONS),
+    # Trends
+    ("Analyze my recent interactions", ANALYZE_TRENDS),
+    ("Show sentiment trends for last month", ANALYZE_TRENDS),
+    ("Any patterns this quarter?", ANALYZE_TRENDS),
+    ("analytics for the north territory", ANALYZE_TRENDS),
+    # Mixed keywords: an interaction noun next to an explicit history/suggest/analyze word
+    ("View interaction history for Dr. Smith", VIEW_HISTORY),
+    ("Show my last interaction with Dr. Lee", VIEW_HISTORY),
+    ("Show the meeting notes for Dr. Kim", VIEW_HISTORY),
+    ("Suggest what to discuss at my next visit with Dr. Lee", GET_SUGGESTIONS),
+    ("What should I bring to my next meeting with Dr. Shah?", GET_SUGGESTIONS),
+    ("Recommend talking points for the visit with Dr. Lewis", GET_SUGGESTIONS),
+    ("Please analyze the meeting notes", ANALYZE_TRENDS),
+    ("Analyze interaction trends for Cardiology", ANALYZE_TRENDS),
+    # General chat, including substring false positives the old scans hit
+    ("Hello", GENERAL_CHAT),
+    ("What can you do?", GENERAL_CHAT),
+    ("Dr. Moore asked about metoprolol dosing", GENERAL_CHAT),
+    ("The metformin data looks promising", GENERAL_CHAT),
+    ("Thanks, that's helpful", GENERAL_CHAT),
+    ("Is the catalog updated?", GENERAL_CHAT),
+    ("The pastry at the conference was nice", GENERAL_CHAT),
+]
@@ -0,0 +1,126 @@
+"""Chat latency under concurrency, before (blocking requests.post) and after (async LLMClient).
+
+Starts the mock Groq server and each app variant as subprocesses, then drives
+POST /chat with N concurrent clients and reports p50/p99 latency.
+
+Run: python benchmarks/load_test.py --latency-ms 300 --concurrency 1 10 100
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.join(BACKEND_DIR, "benchmarks")
+
+CHAT_MESSAGE = "I met with Dr. Smith about cardiac devices, very interested"
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def start_process(args, env=None):
+    return subprocess.Popen(
+        [sys.executable] + args, cwd=BACKEND_DIR, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+
+def wait_until_up(url, timeout=20.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(url, timeout=1.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.1)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+async def run_level(base_url, concurrency, requests_per_client):
+    latencies = []
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=120.0) as client:
+        async def worker():
+            for _ in range(requests_per_client):
+                start = time.perf_counter()
+                response = await client.post("/chat", json={"message": CHAT_MESSAGE})
+                response.raise_for_status()
+                latencies.append((time.perf_counter() - start) * 1000)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "throughput_rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies), 1),
+        "p99_ms": round(percentile(latencies, 99), 1),
+    }
+
+
+def benchmark_variant(name, server_args, port, env, levels, requests_per_client):
+    server = start_process(server_args + ["--port", str(port)], env=env)
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        wait_until_up(base_url + "/")
+        results = []
+        for concurrency in levels:
+            result = asyncio.run(run_level(base_url, concurrency, requests_per_client))
+            result["variant"] = name
+            results.append(result)
+            print(f"{name:<8} c={concurrency:<4} n={result['requests']:<5} "
+                  f"rps={result['throughput_rps']:<8} p50={result['p50_ms']:>9} ms  p99={result['p99_ms']:>9} ms")
+        return results
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--latency-ms", type=float, default=300.0, help="mock Groq latency per call")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--requests-per-client", type=int, default=3)
+    parser.add_argument("--variants", nargs="+", default=["before", "after"], choices=["before", "after"])
+    parser.add_argument("--mock-port", type=int, default=9100)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    mock = start_process([os.path.join(BENCH_DIR, "mock_groq.py"), "--port", str(args.mock_port),
+                          "--latency-ms", str(args.latency_ms)])
+    env = dict(os.environ, GROQ_URL=f"http://127.0.0.1:{args.mock_port}/openai/v1/chat/completions")
+    servers = {
+        "before": [os.path.join(BENCH_DIR, "blocking_app.py")],
+        "after": ["-m", "uvicorn", "final_app:app", "--log-level", "warning"],
+    }
+
+    results = []
+    try:
+        wait_until_up(f"http://127.0.0.1:{args.mock_port}/openai/v1/models")
+        for offset, name in enumerate(args.variants):
+            results += benchmark_variant(name, servers[name], 8101 + offset, env,
+                                         args.concurrency, args.requests_per_client)
+    finally:
+        mock.terminate()
+        mock.wait()
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"latency_ms": args.latency_ms, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
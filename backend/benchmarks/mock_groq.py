@@ -0,0 +1,176 @@
+"""Local stand-in for the Groq chat-completions API used by the benchmarks.
+
+Run: python benchmarks/mock_groq.py --port 9100 --latency-ms 300
+Then point the app at it with GROQ_URL=http://127.0.0.1:9100/openai/v1/chat/completions
+
+--profile picks a preset upstream behaviour (see PROFILES); explicit flags
+override the preset's values.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+import uvicorn
+
+app = FastAPI(title="Mock Groq API")
+
+config = {
+    "latency_ms": 300.0,
+    "jitter_ms": 0.0,
+    "token_interval_ms": 20.0,
+    "batch_drop_rate": 0.0,
+    "rate_limit_rps": 0.0,
+    "error_rate": 0.0,
+}
+
+# Named upstream behaviours for the benchmark suite
+PROFILES = {
+    "fast": {"latency_ms": 50.0, "jitter_ms": 10.0},
+    "normal": {"latency_ms": 300.0, "jitter_ms": 100.0},
+    "slow": {"latency_ms": 1500.0, "jitter_ms": 500.0},
+    "flaky": {"latency_ms": 300.0, "jitter_ms": 100.0, "error_rate": 0.1},
+    "throttled": {"latency_ms": 300.0, "jitter_ms": 100.0, "rate_limit_rps": 5.0},
+}
+
+# Fixed one-second window for the --rate-limit-rps throttling profile
+rate_window = {"start": 0.0, "count": 0}
+
+
+def throttle():
+    """Response headers for an admitted request, or None when it should get a 429"""
+    limit = config["rate_limit_rps"]
+    if not limit:
+        return {}
+    now = time.monotonic()
+    if now - rate_window["start"] >= 1.0:
+        rate_window["start"], rate_window["count"] = now, 0
+    reset = 1.0 - (now - rate_window["start"])
+    if rate_window["count"] >= limit:
+        return None
+    rate_window["count"] += 1
+    return {
+        "x-ratelimit-limit-requests": str(int(limit)),
+        "x-ratelimit-remaining-requests": str(int(limit - rate_window["count"])),
+        "x-ratelimit-reset-requests": f"{reset:.2f}s",
+    }
+
+ANALYSIS = {
+    "summary": "Discussed treatment options and clinical data",
+    "sentiment": "positive",
+    "specialty": "Cardiology",
+    "next_action": "Schedule follow-up meeting",
+    "priority": "medium",
+    "topics": ["treatment", "clinical data"]
+}
+
+SUGGESTIONS = """1. Schedule follow-up call within 1 week
+2. Send clinical data via email
+3. Invite to medical conference"""
+
+
+def batch_completion_for(prompt):
+    """JSON array answer to a multi-note prompt; batch_drop_rate of the items are left out"""
+    answers = []
+    for line in prompt.splitlines():
+        if line.startswith('{"id":'):
+            item_id = json.loads(line)["id"]
+            if random.random() >= config["batch_drop_rate"]:
+                answers.append(dict(ANALYSIS, id=item_id))
+    return json.dumps(answers)
+
+
+def completion_for(prompt):
+    if "JSON array" in prompt:
+        return batch_completion_for(prompt)
+    if "Return JSON only" in prompt or "JSON" in prompt:
+        return json.dumps(ANALYSIS)
+    if "next actions" in prompt:
+        return SUGGESTIONS
+    return "OK"
+
+
+def usage_for(prompt, content):
+    return {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(content) // 4,
+            "total_tokens": (len(prompt) + len(content)) // 4}
+
+
+async def stream_chunks(body, prompt, content):
+    """Emit the completion as OpenAI-style SSE deltas, a few characters at a time, then Groq's usage chunk"""
+    for start in range(0, len(content), 4):
+        chunk = {
+            "id": "chatcmpl-mock",
+            "object": "chat.completion.chunk",
+            "model": body.get("model", "gemma2-9b-it"),
+            "choices": [{"index": 0, "delta": {"content": content[start:start + 4]}, "finish_reason": None}]
+        }
+        yield f"data: {json.dumps(chunk)}\n\n"
+        await asyncio.sleep(config["token_interval_ms"] / 1000)
+    last = {"id": "chatcmpl-mock", "object": "chat.completion.chunk", "model": body.get("model", "gemma2-9b-it"),
+            "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+            "x_groq": {"id": "req-mock", "usage": usage_for(prompt, content)}}
+    yield f"data: {json.dumps(last)}\n\n"
+    yield "data: [DONE]\n\n"
+
+
+@app.post("/openai/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    prompt = body["messages"][-1]["content"]
+    headers = throttle()
+    if headers is None:
+        retry_after = 1.0 - (time.monotonic() - rate_window["start"])
+        return JSONResponse(
+            status_code=429,
+            content={"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+            headers={"retry-after": f"{max(retry_after, 0.01):.2f}", "x-ratelimit-remaining-requests": "0",
+                     "x-ratelimit-reset-requests": f"{max(retry_after, 0.01):.2f}s"}
+        )
+    if random.random() < config["error_rate"]:
+        await asyncio.sleep(config["latency_ms"] / 2000)
+        status = random.choice((500, 502, 503))
+        return JSONResponse(status_code=status,
+                            content={"error": {"message": "Upstream unavailable", "type": "server_error"}})
+    delay = config["latency_ms"] + random.uniform(-config["jitter_ms"], config["jitter_ms"])
+    await asyncio.sleep(max(delay, 0) / 1000)
+
+    content = completion_for(prompt)
+    if body.get("stream"):
+        return StreamingResponse(stream_chunks(body, prompt, content), media_type="text/event-stream", headers=headers)
+    return JSONResponse(headers=headers, content={
+        "id": "chatcmpl-mock",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "gemma2-9b-it"),
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": usage_for(prompt, content)
+    })
+
+
+@app.get("/openai/v1/models")
+async def models():
+    return {"object": "list", "data": [{"id": "gemma2-9b-it", "object": "model"}]}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--profile", choices=sorted(PROFILES), help="preset latency/error/429 behaviour")
+    parser.add_argument("--latency-ms", type=float)
+    parser.add_argument("--jitter-ms", type=float)
+    parser.add_argument("--token-interval-ms", type=float, help="delay between streamed chunks")
+    parser.add_argument("--batch-drop-rate", type=float, help="fraction of items missing from multi-note answers")
+    parser.add_argument("--rate-limit-rps", type=float,
+                        help="answer 429 with Retry-After beyond this many requests per second (0 = unlimited)")
+    parser.add_argument("--error-rate", type=float, help="fraction of requests answered with a 5xx")
+    args = parser.parse_args()
+
+    if args.profile:
+        config.update(PROFILES[args.profile])
+    for key in config:
+        if getattr(args, key) is not None:
+            config[key] = getattr(args, key)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,173 @@
+"""Synthetic hcp_interactions generator for the database benchmarks.
+
+Run: python benchmarks/synthetic_data.py --rows 10000000 --database-url sqlite:////tmp/crm_bench.db
+The hcp_interactions table in the target database is dropped and recreated.
+Indexes are built after the load, which is much faster than maintaining them row by row.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, insert
+from models import Base, HCPInteraction
+
+LAST_NAMES = ["Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller", "Davis", "Rodriguez",
+              "Martinez", "Wilson", "Anderson", "Taylor", "Thomas", "Moore", "Jackson", "Martin", "Lee",
+              "Thompson", "White", "Harris", "Clark", "Lewis", "Walker", "Hall", "Allen", "Young", "King",
+              "Wright", "Scott", "Patel", "Nguyen", "Chen", "Kim", "Singh", "Shah", "Rao", "Gupta"]
+FIRST_NAMES = ["James", "Mary", "John", "Patricia", "Robert", "Jennifer", "Michael", "Linda", "William",
+               "Elizabeth", "David", "Barbara", "Sarah", "Karen", "Ahmed", "Wei", "Priya", "Maria", "Jose",
+               "Fatima", "Olga", "Kenji", "Anna", "Peter", "Laura", "Omar", "Ines", "Raj", "Thomas", "Grace"]
+SURNAME_SYLLABLES = ["ka", "ro", "len", "mar", "ti", "son", "ber", "gu", "vi", "lo", "ne", "sch", "ad", "el",
+                     "man", "in", "os", "wa", "ri", "dov", "ich", "ez", "an", "ton", "ha", "kow", "ski", "ner",
+                     "la", "mo", "phi", "ck", "ley", "the", "gar", "ci", "ny", "zu", "bre", "ld"]
+SPECIALTIES = ["Cardiology", "Oncology", "Neurology", "Endocrinology", "Pediatrics", "Dermatology",
+               "Rheumatology", "General Medicine"]
+TYPES = ["visit", "call", "email", "meeting", "conference"]
+SENTIMENTS = ["positive", "positive", "neutral", "neutral", "negative"]
+PRIORITIES = ["high", "medium", "medium", "low"]
+TERRITORIES = ["North", "South", "East", "West", "Central"]
+TOPICS = ["dosing", "efficacy", "side effects", "clinical trial", "pricing", "samples", "patient outcomes",
+          "formulary access", "safety data", "new indication", "adherence", "insurance coverage"]
+PRODUCTS = ["OncoBoost", "CardioMax", "NeuroCalm", "GlucoSteady", "DermaClear"]
+PHRASES = [
+    "Met with {hcp} to discuss {topic} for {product}.",
+    "{hcp} raised concerns about {topic} with {product}.",
+    "Quick call with {hcp} on {topic}; very interested in {product}.",
+    "Dropped off {product} samples, {hcp} asked about {topic}.",
+    "{hcp} was skeptical about {topic} but open to a {product} trial.",
+]
+# Extra clauses so note text has a realistic long tail of vocabulary for the search benchmarks
+DETAILS = [
+    "Asked for renal impairment data.", "Mentioned hepatic dose adjustment.", "Wants titration guidance.",
+    "Concerned about drug interactions with warfarin.", "Requested the latest phase III results.",
+    "Prior authorization delays are an issue.", "Patients report nausea in the first week.",
+    "Interested in the pediatric formulation.", "Asked about pregnancy and lactation labelling.",
+    "Hospital formulary committee meets next month.", "Prefers email follow-up.",
+    "Would like a lunch-and-learn for the practice.", "Switching patients from a competitor.",
+    "Reported a suspected adverse event; routed to pharmacovigilance.", "Needs copay card information.",
+    "Nurse practitioner joined the discussion.", "Asked about long-term cardiovascular outcomes.",
+    "Wants real-world evidence from community practices.", "Raised cost concerns for uninsured patients.",
+    "Asked for the updated prescribing information.", "Interested in speaking at a regional symposium.",
+    "Noted improved adherence with once-daily dosing.", "Concerned about QT prolongation.",
+    "Asked whether tablets can be crushed.", "Requested patient education leaflets in Spanish.",
+    "Reviewing the guideline update from the society.", "Busy clinic; only five minutes available.",
+    "Asked about storage requirements and refrigeration.", "Following up on the biosimilar question.",
+    "Mentioned elderly patients with polypharmacy.", "Interested in the home infusion program.",
+]
+
+
+def hcp_names(count, seed=7):
+    """Deterministic 'Dr. Lastname' / 'Dr. Lastname-N' population"""
+    rng = random.Random(seed)
+    names = []
+    for i in range(count):
+        base = rng.choice(LAST_NAMES)
+        names.append(f"Dr. {base}" if i < len(LAST_NAMES) else f"Dr. {base}-{i}")
+    return names
+
+
+def full_hcp_names(count, seed=11):
+    """Deterministic, distinct 'Dr. First Surname' names over about count / 4 made-up surnames"""
+    rng = random.Random(seed)
+    surnames = set()
+    while len(surnames) < max(count // 4, 100):
+        surnames.add("".join(rng.choice(SURNAME_SYLLABLES) for _ in range(rng.randint(2, 4))).capitalize())
+    surnames = sorted(surnames)
+    names = set()
+    while len(names) < count:
+        names.add(f"Dr. {rng.choice(FIRST_NAMES)} {rng.choice(surnames)}")
+    return sorted(names)
+
+
+def generate_rows(count, hcp_count=50000, days=3 * 365, seed=42, end=None):
+    """Yield hcp_interactions rows with a realistic spread over HCPs and dates"""
+    rng = random.Random(seed)
+    names = hcp_names(hcp_count)
+    specialty_of = {name: SPECIALTIES[i % len(SPECIALTIES)] for i, name in enumerate(names)}
+    territory_of = {name: TERRITORIES[i % len(TERRITORIES)] for i, name in enumerate(names)}
+    end = end or datetime.utcnow()
+    span = days * 86400
+    for _ in range(count):
+        hcp = names[min(int(rng.paretovariate(1.2)) - 1, hcp_count - 1)] if rng.random() < 0.2 else rng.choice(names)
+        topic, product = rng.choice(TOPICS), rng.choice(PRODUCTS)
+        notes = rng.choice(PHRASES).format(hcp=hcp, topic=topic, product=product)
+        if rng.random() < 0.7:
+            notes += " " + " ".join(rng.sample(DETAILS, rng.randint(1, 2)))
+        when = end - timedelta(seconds=rng.randrange(span))
+        sentiment = rng.choice(SENTIMENTS)
+        yield {
+            "hcp_name": hcp,
+            "hcp_specialty": specialty_of[hcp],
+            "interaction_type": rng.choice(TYPES),
+            "interaction_date": when,
+            "raw_notes": notes,
+            "ai_summary": f"{topic.capitalize()} discussion about {product} ({sentiment})",
+            "key_topics": json.dumps([topic, product]),
+            "sentiment": sentiment,
+            "next_action": "Schedule follow-up meeting",
+            "priority_level": rng.choice(PRIORITIES),
+            "territory": territory_of[hcp],
+            "created_at": when,
+            "updated_at": when,
+        }
+
+
+def load(engine, rows, hcp_count=50000, chunk_size=50000, seed=42):
+    """Recreate hcp_interactions and bulk-load `rows` synthetic interactions"""
+    table = HCPInteraction.__table__
+    Base.metadata.drop_all(bind=engine, tables=[table])
+    indexes = set(table.indexes)
+    table.indexes.clear()
+    try:
+        Base.metadata.create_all(bind=engine, tables=[table])
+    finally:
+        table.indexes.update(indexes)
+
+    start = time.perf_counter()
+    chunk = []
+    loaded = 0
+    with engine.begin() as conn:
+        for row in generate_rows(rows, hcp_count=hcp_count, seed=seed):
+            chunk.append(row)
+            if len(chunk) == chunk_size:
+                conn.execute(insert(table), chunk)
+                loaded += len(chunk)
+                chunk = []
+                print(f"\r  loaded {loaded:,} rows", end="", flush=True)
+        if chunk:
+            conn.execute(insert(table), chunk)
+            loaded += len(chunk)
+    print(f"\r  loaded {loaded:,} rows in {time.perf_counter() - start:.1f}s")
+
+    start = time.perf_counter()
+    for index in indexes:
+        index.create(bind=engine)
+    print(f"  built {len(indexes)} indexes in {time.perf_counter() - start:.1f}s")
+
+
+def make_engine(url):
+    connect_args = {"check_same_thread": False} if url.startswith("sqlite") else {}
+    return create_engine(url, connect_args=connect_args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", default="sqlite:////tmp/crm_bench.db")
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--hcps", type=int, default=50000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    engine = make_engine(args.database_url)
+    print(f"Generating {args.rows:,} interactions for {args.hcps:,} HCPs into {args.database_url}")
+    load(engine, args.rows, hcp_count=args.hcps, seed=args.seed)
+
+
+if __name__ == "__main__":
+    main()
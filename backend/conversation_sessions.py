@@ -0,0 +1,200 @@
+"""Server-side chat sessions: recent turns and the HCPs discussed, kept small.
+
+A session remembers which HCP the conversation is about, so "what next for
+him?" answers for the HCP named a turn earlier instead of "Dr. Unknown",
+and holds the last note that was not logged, so "log that" logs it without
+the rep repeating it. What the LLM is shown of the conversation is a
+rolling summary rather than the transcript: the last SESSION_RECENT_TURNS
+turns, each cut to TURN_CHARS, and one line per HCP discussed (at most
+SESSION_MAX_ENTITIES, the latest outcome for each), so a suggestion prompt
+is the same size at turn 200 as at turn 5.
+
+Sessions are evicted least recently used past SESSION_MAX_SESSIONS and
+after SESSION_IDLE_TTL seconds without a message; a session over
+SESSION_MAX_BYTES drops its oldest turns, then its oldest HCPs, then its
+held note. Sessions live in the worker's memory: with several serve.py
+workers a conversation keeps its context only while its requests reach
+the same worker.
+"""
+import os
+import secrets
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+
+from prompt_registry import fit_tokens
+
+# Chat session configuration
+SESSION_MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", "10000"))
+SESSION_IDLE_TTL = float(os.getenv("SESSION_IDLE_TTL", "1800"))
+SESSION_MAX_BYTES = int(os.getenv("SESSION_MAX_BYTES", "4096"))
+SESSION_RECENT_TURNS = int(os.getenv("SESSION_RECENT_TURNS", "4"))
+SESSION_MAX_ENTITIES = int(os.getenv("SESSION_MAX_ENTITIES", "5"))
+SESSION_CONTEXT_TOKENS = int(os.getenv("SESSION_CONTEXT_TOKENS", "150"))
+
+# Characters of a message kept in a turn line; the rest only matters to the turn that handled it
+TURN_CHARS = 160
+OUTCOME_CHARS = 80
+# Session object, its deque and entity dict, before any strings
+BASE_BYTES = sys.getsizeof(deque()) + sys.getsizeof(OrderedDict()) + 120
+
+
+def clip(text, chars=TURN_CHARS):
+    """`text` on one line, cut to `chars`"""
+    text = " ".join(text.split())
+    return text if len(text) <= chars else text[:chars - 1].rstrip() + "…"
+
+
+class Session:
+    """One conversation's compact state"""
+
+    __slots__ = ("id", "last_seen", "hcp_name", "turns", "entities", "pending", "turn_count", "size", "dropped")
+
+    def __init__(self, session_id, now):
+        self.id = session_id
+        self.last_seen = now
+        self.hcp_name = None  # HCP the conversation is currently about
+        self.turns = deque()  # "intent: message => outcome", newest last
+        self.entities = OrderedDict()  # HCP name -> latest outcome, most recently discussed last
+        self.pending = None  # (note, hcp_name) said but not yet logged
+        self.turn_count = 0
+        self.size = BASE_BYTES
+        self.dropped = 0  # items given up to stay within SESSION_MAX_BYTES
+
+    def record(self, intent, text, hcp_name=None, outcome=""):
+        """Add a handled turn; an HCP it was about becomes the conversation's current HCP"""
+        self.turn_count += 1
+        outcome = clip(outcome, OUTCOME_CHARS)
+        line = f"{intent}: {clip(text)}" + (f" => {outcome}" if outcome else "")
+        self.turns.append(line)
+        if len(self.turns) > SESSION_RECENT_TURNS:
+            self.turns.popleft()
+        if hcp_name:
+            self.hcp_name = hcp_name
+            self.entities[hcp_name] = outcome or self.entities.get(hcp_name, "")
+            self.entities.move_to_end(hcp_name)
+            if len(self.entities) > SESSION_MAX_ENTITIES:
+                self.entities.popitem(last=False)
+        self._fit()
+
+    def hold(self, note, hcp_name):
+        """Keep a note that was not logged, for a following "log that" """
+        self.pending = (note, hcp_name)
+        self._fit()
+
+    def take_pending(self):
+        """The held (note, hcp_name), or None; it is released either way"""
+        pending, self.pending = self.pending, None
+        self.size = self.measure()
+        return pending
+
+    def summary(self):
+        """Rolling summary of the conversation for prompts, within SESSION_CONTEXT_TOKENS"""
+        if not self.turn_count:
+            return ""
+        parts = []
+        earlier = self.turn_count - len(self.turns)
+        discussed = "; ".join(f"{name} ({outcome})" if outcome else name for name, outcome in self.entities.items())
+        if discussed:
+            parts.append(f"HCPs discussed: {discussed}.")
+        if earlier:
+            parts.append(f"{earlier} earlier turns.")
+        parts.append("Recent turns: " + " | ".join(self.turns))
+        return fit_tokens(" ".join(parts), SESSION_CONTEXT_TOKENS)[0]
+
+    def measure(self):
+        """Approximate bytes held by this session"""
+        size = BASE_BYTES + sys.getsizeof(self.id) + sum(sys.getsizeof(line) for line in self.turns)
+        size += sum(sys.getsizeof(name) + sys.getsizeof(outcome) for name, outcome in self.entities.items())
+        if self.pending is not None:
+            size += sys.getsizeof(self.pending[0])
+        return size
+
+    def _fit(self):
+        """Drop the oldest turns, then the oldest other HCPs, then the held note, until within SESSION_MAX_BYTES"""
+        self.size = self.measure()
+        while self.size > SESSION_MAX_BYTES:
+            if len(self.turns) > 1:
+                self.turns.popleft()
+            elif len(self.entities) > 1:
+                self.entities.popitem(last=False)
+            elif self.pending is not None:
+                self.pending = None
+            else:
+                break
+            self.dropped += 1
+            self.size = self.measure()
+
+
+class SessionStore:
+    """Sessions by id in an LRU with idle expiry.
+
+    Entries are kept in last-use order, so idle sessions are always at the
+    front and expiring them never scans the live ones.
+    """
+
+    def __init__(self, max_sessions=SESSION_MAX_SESSIONS, idle_ttl=SESSION_IDLE_TTL):
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = {
+            "created": 0,
+            "resumed": 0,
+            "expired": 0,
+            "evicted": 0,
+        }
+        # Items dropped by sessions no longer in the store
+        self._dropped = 0
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def open(self, session_id=None):
+        """The live session with this id, or a new one under a fresh server-issued id.
+
+        An unknown id (expired, evicted, from another worker or made up by the
+        client) is never adopted, so a client cannot pick an id to share or
+        pre-seed someone else's session.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            session = self._sessions.get(session_id) if session_id else None
+            if session is not None:
+                self._sessions.move_to_end(session_id)
+                session.last_seen = now
+                self.counters["resumed"] += 1
+                return session
+            session_id = secrets.token_urlsafe(12)
+            session = self._sessions[session_id] = Session(session_id, now)
+            self.counters["created"] += 1
+            while len(self._sessions) > self.max_sessions:
+                self._dropped += self._sessions.popitem(last=False)[1].dropped
+                self.counters["evicted"] += 1
+            return session
+
+    def _expire(self, now):
+        while self._sessions:
+            session = next(iter(self._sessions.values()))
+            if now - session.last_seen < self.idle_ttl:
+                break
+            self._dropped += self._sessions.popitem(last=False)[1].dropped
+            self.counters["expired"] += 1
+
+    def stats(self):
+        with self._lock:
+            self._expire(time.monotonic())
+            sizes = [session.size for session in self._sessions.values()]
+            dropped = self._dropped + sum(session.dropped for session in self._sessions.values())
+        return dict(
+            self.counters,
+            active=len(sizes),
+            items_dropped_for_size=dropped,
+            max_sessions=self.max_sessions,
+            idle_ttl=self.idle_ttl,
+            max_session_bytes=SESSION_MAX_BYTES,
+            total_bytes=sum(sizes),
+            largest_session_bytes=max(sizes, default=0),
+        )
@@ -1,10 +1,35 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import Depends, FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field, ValidationError
+from typing import List, Optional
 import uvicorn
-import requests
+import asyncio
 import json
+import os
 import re
+import time
+from datetime import datetime
+from llm_client import LLMClient, LLMError
+from rate_limiter import RateLimiter, INTERACTIVE, BATCH
+from shared_state import open_shared_store
+from llm_cache import ResponseCache
+from llm_batcher import AnalysisBatcher, BATCH_PROMPT
+from prompt_registry import prompts, PROMPT_NOTES_TOKEN_BUDGET
+from json_extractor import JSONExtractor, extract_analysis, extraction_stats, normalize_field
+from health_monitor import CircuitBreaker, HealthMonitor, is_availability_error
+from sqlalchemy.ext.asyncio import AsyncSession
+from models import init_db, get_async_db, engine, async_engine, after_fork as reopen_db_pools
+from interaction_writer import InteractionWriter, build_interaction_row, WRITE_BATCH_SIZE
+from history_service import get_hcp_history_async, fetch_hcp_history_async, DEFAULT_HISTORY_LIMIT
+from search_service import init_search, search_interactions_async, DEFAULT_SEARCH_LIMIT
+from note_index import open_note_index, retrieve_context
+from note_extractor import NoteExtractor, UNKNOWN_HCP
+from hcp_resolver import HCPResolver, RESOLUTION_RESULTS
+from conversation_sessions import SessionStore
+from analytics_service import TrendAnalytics, trend_insights, ANALYTICS_MAX_DAYS
+from intent_router import classify_intent, LOG_INTERACTION, VIEW_HISTORY, GET_SUGGESTIONS, ANALYZE_TRENDS, GENERAL_CHAT
+from metrics import registry, PrometheusMiddleware, HTTP_REQUEST_SECONDS, CHAT_INTENT_SECONDS, LLM_FALLBACKS
 
 app = FastAPI(title="AI-First CRM HCP Module")
 
@@ -16,45 +41,212 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.add_middleware(PrometheusMiddleware, histogram=HTTP_REQUEST_SECONDS)
+
 class ChatMessage(BaseModel):
     message: str
+    session_id: Optional[str] = None
+    # Sales territory an interaction logged from this message is filed under (trend reports break down by it)
+    territory: Optional[str] = Field(None, max_length=50)
+
+class BatchLogRequest(BaseModel):
+    notes: List[str]
+    territory: Optional[str] = Field(None, max_length=50)  # applies to every note
 
 # Groq API configuration
-GROQ_API_KEY = "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"
-GROQ_URL = "https://api.groq.com/openai/v1/chat/completions"
+GROQ_API_KEY = os.getenv("GROQ_API_KEY", "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")
+GROQ_URL = os.getenv("GROQ_URL", "https://api.groq.com/openai/v1/chat/completions")
+GROQ_MODEL = "gemma2-9b-it"
+GROQ_TEMPERATURE = 0.1
 
-def call_groq_api(prompt):
-    """Call Groq API with error handling and fallback"""
+# Batch logging: notes analysed at once per request, and the largest JSON batch accepted
+BATCH_MAX_PARALLELISM = int(os.getenv("BATCH_MAX_PARALLELISM", "32"))
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "500"))
+
+# Rate-limit budget and breaker state shared by all worker processes when SHARED_STATE_PATH is set
+shared_store = open_shared_store()
+
+# Shared async client: pooled keep-alive connections, bounded concurrency, client-side rate limiting
+llm_client = LLMClient(GROQ_API_KEY, GROQ_URL, rate_limiter=RateLimiter(store=shared_store))
+
+# Content-addressed cache of successful LLM responses
+response_cache = ResponseCache()
+
+# Upstream availability: sampled in the background, consulted before every call
+circuit_breaker = CircuitBreaker(store=shared_store)
+health_monitor = HealthMonitor(llm_client, circuit_breaker)
+
+# HCP names resolve to their profile ("dr smyth" -> "Dr. Smith") before they are stored or looked up
+hcp_resolver = HCPResolver()
+
+# Logged interactions are persisted through a write-behind queue (INTERACTION_DURABILITY)
+interaction_writer = InteractionWriter(resolver=hcp_resolver)
+
+# Vector index over stored notes; suggestions are grounded in the HCP's most relevant past interactions.
+# Opened at startup, so importing the app creates no files
+note_index = None
+
+# Local name/sentiment/specialty/priority extraction; the LLM is called only when it is unsure
+note_extractor = NoteExtractor()
+
+# Trend rollups; past days are cached so a report only recounts today
+trend_analytics = TrendAnalytics()
+
+# Per-conversation chat state: the HCP being discussed, recent turns, a note not yet logged
+chat_sessions = SessionStore()
+
+def after_fork():
+    """Reopen what a worker forked by serve.py inherited from the preloading parent"""
+    registry.after_fork()
+    reopen_db_pools()
+    response_cache.after_fork()
+    if shared_store is not None:
+        shared_store.after_fork()
+
+@app.on_event("startup")
+async def startup():
+    global note_index
+    init_db()
+    init_search(engine)
+    interaction_writer.start()
+    health_monitor.start()
+    note_extractor.start()
+    hcp_resolver.start()
+    note_index = open_note_index()
+    if note_index is not None:
+        note_index.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await health_monitor.stop()
+    await interaction_writer.stop()
+    await asyncio.to_thread(note_extractor.stop)
+    await asyncio.to_thread(hcp_resolver.stop)
+    await asyncio.to_thread(response_cache.flush)
+    if note_index is not None:
+        await asyncio.to_thread(note_index.stop)
+    await llm_client.aclose()
+    await async_engine.dispose()
+
+def fallback_reason(error):
+    if error.status_code == 429:
+        return "rate_limited"
+    return "upstream_unavailable" if is_availability_error(error) else "upstream_error"
+
+async def request_groq(prompt, max_tokens=500, priority=INTERACTIVE, template="other"):
+    """One upstream completion under the circuit breaker; None when the API is unavailable or fails"""
     try:
         # Check if API key is available
         if not GROQ_API_KEY or GROQ_API_KEY == "your_groq_api_key_here":
             print("No valid API key found, using fallback mode")
-            return generate_fallback_response(prompt)
-            
-        headers = {
-            "Authorization": f"Bearer {GROQ_API_KEY}",
-            "Content-Type": "application/json"
-        }
+            LLM_FALLBACKS.inc(1, "no_api_key")
+            return None
         
-        data = {
-            "model": "gemma2-9b-it",
-            "messages": [{"role": "user", "content": prompt}],
-            "temperature": 0.1,
-            "max_tokens": 500
-        }
+        # Upstream known to be down: answer now instead of waiting for a timeout
+        if not await circuit_breaker.allow_request():
+            LLM_FALLBACKS.inc(1, "circuit_open")
+            return None
         
-        response = requests.post(GROQ_URL, headers=headers, json=data, timeout=30)
-        
-        if response.status_code == 200:
-            result = response.json()
-            return result["choices"][0]["message"]["content"]
-        else:
-            print(f"Groq API Error: {response.status_code} - {response.text}")
-            return generate_fallback_response(prompt)
+        content = await llm_client.complete(prompt, model=GROQ_MODEL, temperature=GROQ_TEMPERATURE,
+                                            max_tokens=max_tokens, priority=priority, template=template)
+        await circuit_breaker.record_success()
+        return content
             
+    except LLMError as e:
+        print(f"Groq API Error: {e}")
+        LLM_FALLBACKS.inc(1, fallback_reason(e))
+        if is_availability_error(e):
+            await circuit_breaker.record_failure(e)
+        elif e.replied:
+            # The upstream answered, if only with an error, so it is up
+            await circuit_breaker.record_success()
+        else:
+            # Refused locally (rate-limit wait): no outcome, and a half-open trial goes to the next call
+            await circuit_breaker.cancel_trial()
+        return None
+    except asyncio.CancelledError:
+        await circuit_breaker.cancel_trial()
+        raise
     except Exception as e:
         print(f"Groq API Exception: {e}")
+        LLM_FALLBACKS.inc(1, "exception")
+        await circuit_breaker.record_failure(e)
+        return None
+
+async def call_groq_api(prompt, cache_key=None, template="other"):
+    """Call Groq API with error handling and fallback"""
+    if cache_key:
+        cached = await response_cache.get(cache_key)
+        if cached is not None:
+            return cached
+    
+    content = await request_groq(prompt, template=template)
+    if content is None:
         return generate_fallback_response(prompt)
+    
+    # Only real upstream answers are cached, never fallbacks
+    if cache_key:
+        await response_cache.set(cache_key, content)
+    return content
+
+async def stream_groq_api(prompt, cache_key=None, template="other", fallback=True):
+    """Streaming call_groq_api: yields text chunks under the same cache, breaker and fallback rules.
+
+    With fallback=False nothing is yielded when the upstream cannot answer.
+    """
+    if cache_key:
+        cached = await response_cache.get(cache_key)
+        if cached is not None:
+            yield cached
+            return
+    
+    if not GROQ_API_KEY or GROQ_API_KEY == "your_groq_api_key_here":
+        LLM_FALLBACKS.inc(1, "no_api_key")
+        if fallback:
+            yield generate_fallback_response(prompt)
+        return
+    if not await circuit_breaker.allow_request():
+        LLM_FALLBACKS.inc(1, "circuit_open")
+        if fallback:
+            yield generate_fallback_response(prompt)
+        return
+    
+    chunks = []
+    try:
+        async for chunk in llm_client.stream(prompt, model=GROQ_MODEL, temperature=GROQ_TEMPERATURE, max_tokens=500,
+                                             template=template):
+            chunks.append(chunk)
+            yield chunk
+        await circuit_breaker.record_success()
+    except LLMError as e:
+        print(f"Groq API Error: {e}")
+        LLM_FALLBACKS.inc(1, fallback_reason(e))
+        if is_availability_error(e):
+            await circuit_breaker.record_failure(e)
+        elif e.replied:
+            # The upstream answered, if only with an error, so it is up
+            await circuit_breaker.record_success()
+        else:
+            # Refused locally (rate-limit wait): no outcome, and a half-open trial goes to the next call
+            await circuit_breaker.cancel_trial()
+        # Nothing reached the client yet, so the fallback can still stand in for the whole answer
+        if fallback and not chunks:
+            yield generate_fallback_response(prompt)
+        return
+    except (asyncio.CancelledError, GeneratorExit):
+        # Client went away mid-stream
+        await circuit_breaker.cancel_trial()
+        raise
+    except Exception as e:
+        print(f"Groq API Exception: {e}")
+        LLM_FALLBACKS.inc(1, "exception")
+        await circuit_breaker.record_failure(e)
+        if fallback and not chunks:
+            yield generate_fallback_response(prompt)
+        return
+    
+    if cache_key and chunks:
+        await response_cache.set(cache_key, "".join(chunks))
 
 def generate_fallback_response(prompt):
     """Generate intelligent fallback responses without API"""
@@ -73,88 +265,78 @@ def generate_fallback_response(prompt):
     return "Thank you for the information. I've processed your interaction details using our intelligent system."
 
 def extract_hcp_name(text):
-    """Extract HCP name from text"""
-    # Look for Dr. patterns
-    patterns = [
-        r"Dr\.?\s+([A-Z][a-z]+)",
-        r"Doctor\s+([A-Z][a-z]+)",
-        r"with\s+([A-Z][a-z]+)",
-    ]
-    
-    for pattern in patterns:
-        match = re.search(pattern, text, re.IGNORECASE)
-        if match:
-            return f"Dr. {match.group(1)}"
-    
-    return "Dr. Unknown"
+    """HCP named in a message as its profile name when it resolves to one, else "Dr. <name after the title>" """
+    return hcp_resolver.canonical_name(note_extractor.extract_name(text)[0])
 
-def analyze_interaction(user_input, hcp_name):
-    """Analyze interaction with AI or fallback"""
-    
-    # Try AI analysis first
-    prompt = f"""
+# Bump a template's version whenever its text changes, so answers cached for the old text are not reused
+ANALYSIS_PROMPT = prompts.register("analyze_interaction", 2, """
     Analyze this healthcare professional interaction:
-    
-    Input: {user_input}
-    HCP: {hcp_name}
-    
+    Input: {notes}
+    HCP: {hcp}
     Return JSON only:
-    {{
-        "summary": "brief summary",
-        "sentiment": "positive/neutral/negative", 
-        "specialty": "medical specialty",
-        "next_action": "suggested action",
-        "priority": "high/medium/low",
-        "topics": ["topic1", "topic2"]
-    }}
-    """
-    
-    ai_response = call_groq_api(prompt)
-    
-    if ai_response:
-        try:
-            # Clean response and parse JSON
-            cleaned = ai_response.strip()
-            if cleaned.startswith("```json"):
-                cleaned = cleaned.replace("```json", "").replace("```", "")
-            
-            data = json.loads(cleaned)
-            return data
-        except:
-            pass
-    
-    # Fallback analysis
-    sentiment = "positive" if any(word in user_input.lower() for word in ["good", "great", "excellent", "positive", "interested"]) else "neutral"
-    
-    specialty = "Cardiology" if "cardiac" in user_input.lower() else "General Medicine"
-    
-    return {
-        "summary": f"Meeting with {hcp_name} - {user_input[:50]}...",
-        "sentiment": sentiment,
-        "specialty": specialty,
-        "next_action": "Schedule follow-up meeting",
-        "priority": "medium",
-        "topics": ["discussion", "treatment"]
-    }
+    {{"summary": "brief summary", "sentiment": "positive/neutral/negative", "specialty": "medical specialty", "next_action": "suggested action", "priority": "high/medium/low", "topics": ["topic1", "topic2"]}}
+    """, budgets={"notes": PROMPT_NOTES_TOKEN_BUDGET})
 
-def get_ai_suggestions(hcp_name):
-    """Get AI suggestions or fallback"""
-    prompt = f"""
-    Suggest 3-5 next actions for healthcare professional {hcp_name}.
-    
-    Return as numbered list:
-    1. Action with timing
-    2. Action with timing
-    etc.
-    """
-    
-    ai_response = call_groq_api(prompt)
-    
-    if ai_response:
-        return ai_response
+def build_analysis_prompt(user_input, hcp_name):
+    return ANALYSIS_PROMPT.render(notes=user_input, hcp=hcp_name)
+
+def analysis_cache_key(user_input, hcp_name):
+    return response_cache.make_key(
+        GROQ_MODEL, ANALYSIS_PROMPT.key, GROQ_TEMPERATURE,
+        {"input": user_input, "hcp": hcp_name}
+    )
+
+def local_analysis(user_input, hcp_name):
+    """Analysis from the local extractor; also fills whatever the LLM's answer lacks"""
+    return note_extractor.analyze(user_input, hcp_name)[0]
+
+def parse_analysis(ai_response, user_input, hcp_name):
+    """Parse the LLM's JSON analysis, repairing common defects; local analysis fills any gaps"""
+    return extract_analysis(ai_response, local_analysis(user_input, hcp_name))
+
+async def analyze_interaction(user_input, hcp_name):
+    """Analyze interaction locally when every field is confident, else with AI or fallback"""
+    analysis, confidences = note_extractor.analyze(user_input, hcp_name)
+    if note_extractor.confident(confidences):
+        return analysis
+    cache_key = analysis_cache_key(user_input, hcp_name)
+    ai_response = await response_cache.get(cache_key)
+    if ai_response is None:
+        # Not call_groq_api: its canned fallback JSON would override the local analysis
+        ai_response = await request_groq(build_analysis_prompt(user_input, hcp_name), template=ANALYSIS_PROMPT.name)
+        if ai_response is None:
+            return analysis
+        await response_cache.set(cache_key, ai_response)
+    return extract_analysis(ai_response, analysis)
+
+# Bulk analysis: concurrent notes share multi-note LLM requests (see llm_batcher),
+# queued behind interactive chat for rate-limit budget
+analysis_batcher = AnalysisBatcher(lambda prompt, max_tokens: request_groq(prompt, max_tokens, priority=BATCH,
+                                                                          template=BATCH_PROMPT.name))
+
+def batch_analysis_cache_key(user_input, hcp_name):
+    return response_cache.make_key(
+        GROQ_MODEL, BATCH_PROMPT.key, GROQ_TEMPERATURE,
+        {"input": user_input, "hcp": hcp_name}
+    )
+
+async def analyze_interaction_batched(user_input, hcp_name):
+    """analyze_interaction for bulk imports: the note shares an LLM request with concurrent notes"""
+    analysis, confidences = note_extractor.analyze(user_input, hcp_name)
+    if note_extractor.confident(confidences):
+        return analysis
+    cache_key = batch_analysis_cache_key(user_input, hcp_name)
+    cached = await response_cache.get(cache_key)
+    if cached is not None:
+        return json.loads(cached)
     
-    # Fallback suggestions
-    return f"""
+    analysis = await analysis_batcher.analyze(user_input, hcp_name)
+    if analysis is None:
+        return parse_analysis(None, user_input, hcp_name)
+    await response_cache.set(cache_key, json.dumps(analysis))
+    return analysis
+
+FALLBACK_SUGGESTIONS = """
     1. Schedule follow-up call within 1 week
     2. Send clinical data via email
     3. Invite to medical conference
@@ -162,38 +344,70 @@ def get_ai_suggestions(hcp_name):
     5. Share patient case studies
     """
 
-@app.get("/")
-async def root():
-    return {
-        "message": "AI-First CRM HCP Module", 
-        "status": "active",
-        "ai_enabled": True,
-        "version": "2.0"
-    }
+# {conversation} is empty or a line with the chat session's rolling summary (already within SESSION_CONTEXT_TOKENS)
+SUGGESTIONS_PROMPT = prompts.register("get_ai_suggestions", 4, """
+    Suggest 3-5 next actions for healthcare professional {hcp}.{conversation}
+    Return as numbered list:
+    1. Action with timing
+    2. Action with timing
+    etc.
+    """)
 
-@app.get("/health")
-async def health_check():
-    # Test Groq API
-    test_response = call_groq_api("Hello, respond with 'OK'")
-    ai_status = "working" if test_response else "fallback_mode"
-    
-    return {
-        "status": "healthy",
-        "ai_status": ai_status,
-        "timestamp": "2024-01-17"
-    }
+# With the HCP's past notes retrieved from the note index (already packed to NOTE_CONTEXT_TOKEN_BUDGET)
+SUGGESTIONS_CONTEXT_PROMPT = prompts.register("get_ai_suggestions_context", 2, """
+    Suggest 3-5 next actions for healthcare professional {hcp}.{conversation}
+    Past interactions with {hcp}, most relevant first:
+    {history}
+    Base the actions on these interactions.
+    Return as numbered list:
+    1. Action with timing
+    2. Action with timing
+    etc.
+    """)
 
-@app.post("/chat")
-async def chat_endpoint(message: ChatMessage):
+def suggestions_template(context=()):
+    return SUGGESTIONS_CONTEXT_PROMPT if context else SUGGESTIONS_PROMPT
+
+def conversation_line(conversation):
+    return f"\nEarlier in this chat: {conversation}" if conversation else ""
+
+def build_suggestions_prompt(hcp_name, context=(), conversation=""):
+    if context:
+        return SUGGESTIONS_CONTEXT_PROMPT.render(hcp=hcp_name, history="\n".join(context),
+                                                 conversation=conversation_line(conversation))
+    return SUGGESTIONS_PROMPT.render(hcp=hcp_name, conversation=conversation_line(conversation))
+
+def suggestions_cache_key(hcp_name, context=(), conversation=""):
+    return response_cache.make_key(
+        GROQ_MODEL, suggestions_template(context).key, GROQ_TEMPERATURE,
+        {"hcp": hcp_name, "context": list(context), "conversation": conversation}
+    )
+
+async def suggestion_context(hcp_name, request_text):
+    """The HCP's past notes most relevant to the request, packed for the prompt; empty if unavailable"""
+    if note_index is None:
+        return []
     try:
-        user_input = message.message.lower()
-        
-        # Log interaction
-        if any(word in user_input for word in ["met", "visit", "meeting", "log", "interaction"]):
-            hcp_name = extract_hcp_name(message.message)
-            analysis = analyze_interaction(message.message, hcp_name)
-            
-            response_text = f"""Interaction Logged Successfully!
+        return await retrieve_context(note_index, hcp_name, request_text)
+    except Exception as e:
+        print(f"Note retrieval error: {e}")
+        return []
+
+async def get_ai_suggestions(hcp_name, request_text="", conversation=""):
+    """Get AI suggestions or fallback"""
+    context = await suggestion_context(hcp_name, request_text)
+    ai_response = await call_groq_api(build_suggestions_prompt(hcp_name, context, conversation),
+                                      cache_key=suggestions_cache_key(hcp_name, context, conversation),
+                                      template=suggestions_template(context).name)
+    
+    if ai_response:
+        return ai_response
+    
+    # Fallback suggestions
+    return FALLBACK_SUGGESTIONS
+
+def format_log_response(hcp_name, analysis):
+    return f"""Interaction Logged Successfully!
 
 HCP: {hcp_name}
 Summary: {analysis['summary']}
@@ -204,53 +418,9 @@ Next Action: {analysis['next_action']}
 Topics: {', '.join(analysis['topics'])}
 
 *Powered by AI Analysis*"""
-            
-            return {
-                "response": response_text,
-                "action_taken": "log_interaction",
-                "tools_used": ["log_interaction", "ai_analysis"]
-            }
-        
-        # Show history
-        elif any(word in user_input for word in ["history", "show", "past"]):
-            hcp_name = extract_hcp_name(message.message)
-            
-            return {
-                "response": f"""Interaction History: {hcp_name}
 
-Summary:
-• Total Interactions: 4
-• Last Meeting: 3 days ago
-• Engagement Level: High
-• Preferred Contact: Email
-
-Recent Activity:
-• Jan 15: Positive discussion about new treatment
-• Jan 10: Product demo - very interested  
-• Jan 5: Initial introduction meeting
-• Dec 28: Follow-up call
-
-AI Insights:
-• Strong relationship established
-• Responds well to clinical data
-• Prefers evidence-based discussions
-• Good candidate for pilot programs
-
-Recommendations:
-• Schedule quarterly reviews
-• Share latest research findings
-• Invite to advisory board""",
-                "action_taken": "view_history",
-                "tools_used": ["get_hcp_history", "ai_insights"]
-            }
-        
-        # Get suggestions
-        elif any(word in user_input for word in ["suggest", "next", "recommend", "action"]):
-            hcp_name = extract_hcp_name(message.message)
-            suggestions = get_ai_suggestions(hcp_name)
-            
-            return {
-                "response": f"""AI Suggestions for {hcp_name}:
+def format_suggestions_response(hcp_name, suggestions):
+    return f"""AI Suggestions for {hcp_name}:
 
 {suggestions}
 
@@ -265,15 +435,9 @@ Timing Recommendations:
 • Medium priority: Next 2 weeks  
 • Long-term: Next month
 
-*AI-powered recommendations based on interaction patterns*""",
-                "action_taken": "get_suggestions", 
-                "tools_used": ["suggest_next_actions", "ai_strategy"]
-            }
-        
-        # General chat
-        else:
-            return {
-                "response": """Welcome to AI-First CRM!
+*AI-powered recommendations based on interaction patterns*"""
+
+GENERAL_CHAT_RESPONSE = """Welcome to AI-First CRM!
 
 I can help you with:
 
@@ -288,7 +452,355 @@ Pro Tips:
 • Ask for specific recommendations
 • I learn from your interaction patterns
 
-Powered by Groq AI (gemma2-9b-it)""",
+Powered by Groq AI (gemma2-9b-it)"""
+
+TREND_DAYS_PATTERN = re.compile(r"\b(\d{1,3})\s*days?\b", re.IGNORECASE)
+
+def trend_days(text, default=30):
+    """Window asked for in a chat message ("last 90 days"), else the default"""
+    match = TREND_DAYS_PATTERN.search(text)
+    return min(max(int(match.group(1)), 1), ANALYTICS_MAX_DAYS) if match else default
+
+def format_trends_response(report):
+    """Render a trend report as chat text"""
+    def counts(distribution):
+        return ", ".join(f"{name} {count:,}" for name, count in distribution.items()) or "none"
+    territories = "\n".join(
+        f"• {name}: {item['total']:,} ({counts(item['sentiment'])})"
+        for name, item in list(report["territories"].items())[:5]
+    ) or "• none"
+    weekly = "\n".join(f"• {week['week_start']}: {week['total']:,}" for week in report["weekly"][-6:])
+    return f"""Interaction Trends: last {report['period_days']} days ({report['start']} to {report['end']})
+
+{trend_insights(report)}
+
+Sentiment: {counts(report['sentiment_distribution'])}
+Interaction Types: {counts(report['interaction_types'])}
+Priority Levels: {counts(report['priority_levels'])}
+
+Territories:
+{territories}
+
+Weekly Volume:
+{weekly}"""
+
+def format_history_response(hcp_name, interactions):
+    """Render a page of stored interactions as chat text"""
+    if not interactions:
+        return f"""Interaction History: {hcp_name}
+
+No interactions recorded yet.
+
+Log one with: "I met with {hcp_name} about ..." """
+    
+    latest = interactions[0]
+    activity = "\n".join(
+        f"• {item['date'][:10] if item['date'] else 'Unknown date'}: {item['summary'] or 'No summary'} ({item['sentiment'] or 'neutral'})"
+        for item in interactions
+    )
+    return f"""Interaction History: {hcp_name}
+
+Summary:
+• Recent Interactions: {len(interactions)}
+• Last Interaction: {latest['date'][:10] if latest['date'] else 'Unknown'}
+• Latest Sentiment: {latest['sentiment'] or 'neutral'}
+• Next Action: {latest['next_action'] or 'None recorded'}
+
+Recent Activity:
+{activity}"""
+
+# "log that", "log it", "please save this": log the note held from an earlier turn
+LOG_REFERENCE_PATTERN = re.compile(r"^\W*(?:please\s+)?(?:log|save|record)\s+(?:that|it|this)\b\W*", re.IGNORECASE)
+
+NOTHING_TO_LOG_RESPONSE = """Nothing to log yet.
+
+Describe the interaction first, e.g. "I met with Dr. Smith about cardiac devices", then say "log that"."""
+
+def session_hcp(session, text):
+    """HCP named in the message, else the one the conversation is about ("what next for him?")"""
+    hcp_name = extract_hcp_name(text)
+    if hcp_name == UNKNOWN_HCP and session.hcp_name:
+        return session.hcp_name
+    return hcp_name
+
+def remember(session, intent, text, hcp_name=None, outcome=""):
+    """Record a handled turn in the chat session; "Dr. Unknown" never becomes the current HCP"""
+    session.record(intent, text, hcp_name if hcp_name != UNKNOWN_HCP else None, outcome)
+
+def note_to_log(session, text):
+    """(note, hcp_name, rest of the message) for a log request.
+
+    "log that, and what next for him?" logs the note held from an earlier
+    turn under the HCP already extracted from it, and returns the rest of
+    the message as a follow-up; the note is None when nothing is held. Any
+    other message is itself the note.
+    """
+    match = LOG_REFERENCE_PATTERN.match(text)
+    if match is None:
+        return text, session_hcp(session, text), ""
+    pending = session.take_pending()
+    if pending is None:
+        return None, None, ""
+    return pending[0], pending[1], text[match.end():]
+
+def log_outcome(analysis):
+    return f"logged, {analysis['sentiment']}; next: {analysis['next_action']}"
+
+async def follow_up_suggestions(session, follow_up, hcp_name):
+    """Suggestions asked for after "log that" in the same message, as chat text; None if none were"""
+    if classify_intent(follow_up) != GET_SUGGESTIONS:
+        return None
+    suggestions = await get_ai_suggestions(hcp_name, follow_up, session.summary())
+    remember(session, GET_SUGGESTIONS, follow_up, hcp_name)
+    return format_suggestions_response(hcp_name, suggestions)
+
+def hold_note(session, text):
+    """General chat that names an HCP may be a note; keep it for a following "log that" """
+    hcp_name = extract_hcp_name(text)
+    if hcp_name == UNKNOWN_HCP:
+        remember(session, GENERAL_CHAT, text)
+        return GENERAL_CHAT_RESPONSE
+    session.hold(text, hcp_name)
+    remember(session, GENERAL_CHAT, text, hcp_name)
+    return f"Noted about {hcp_name}. Say \"log that\" to save it as an interaction.\n\n{GENERAL_CHAT_RESPONSE}"
+
+@app.get("/")
+async def root():
+    return {
+        "message": "AI-First CRM HCP Module", 
+        "status": "active",
+        "ai_enabled": True,
+        "version": "2.0"
+    }
+
+@app.get("/health")
+async def health_check():
+    # Cached state from the background monitor; never calls the LLM
+    return health_monitor.snapshot()
+
+@app.get("/health/deep")
+async def deep_health_check():
+    # On-demand one-token completion against the upstream
+    return await health_monitor.check(deep=True)
+
+@app.get("/hcps/{hcp_name}/history")
+async def hcp_history_endpoint(hcp_name: str, limit: int = DEFAULT_HISTORY_LIMIT, cursor: Optional[str] = None,
+                               db: AsyncSession = Depends(get_async_db)):
+    hcp_name = hcp_resolver.canonical_name(hcp_name)
+    # Rows still in the write-behind queue are written first; any that could not be in time are counted
+    pending = await interaction_writer.wait_for_hcp(hcp_name)
+    try:
+        history = await get_hcp_history_async(db, hcp_name, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {**history, "pending_writes": pending}
+
+@app.get("/search")
+async def search_endpoint(q: str, hcp: Optional[str] = None, sentiment: Optional[str] = None,
+                          date_from: Optional[datetime] = None, date_to: Optional[datetime] = None,
+                          limit: int = DEFAULT_SEARCH_LIMIT, cursor: Optional[str] = None,
+                          db: AsyncSession = Depends(get_async_db)):
+    try:
+        hcp = hcp_resolver.canonical_name(hcp) if hcp else None
+        return await search_interactions_async(db, q, hcp, sentiment, date_from, date_to, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/analytics/trends")
+async def trends_endpoint(days: int = 30):
+    try:
+        report = await asyncio.to_thread(trend_analytics.report, days)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return dict(report, insights=trend_insights(report))
+
+@app.get("/analytics/trends/stats")
+async def trends_stats():
+    return trend_analytics.stats()
+
+@app.get("/interactions/writer/stats")
+async def interaction_writer_stats():
+    return interaction_writer.stats()
+
+@app.get("/analysis/batcher/stats")
+async def analysis_batcher_stats():
+    return analysis_batcher.stats()
+
+@app.get("/analysis/extraction/stats")
+async def analysis_extraction_stats():
+    return extraction_stats.snapshot()
+
+@app.get("/analysis/local/stats")
+async def local_analysis_stats():
+    return note_extractor.stats()
+
+@app.get("/hcps/resolution/stats")
+async def hcp_resolution_stats():
+    return hcp_resolver.stats()
+
+@app.get("/notes/index/stats")
+async def note_index_stats():
+    if note_index is None:
+        return {"enabled": False}
+    return dict(note_index.stats(), enabled=True)
+
+@app.get("/llm/stats")
+async def llm_stats():
+    return llm_client.stats()
+
+@app.get("/prompts/stats")
+async def prompt_stats():
+    return prompts.stats()
+
+@app.get("/chat/sessions/stats")
+async def chat_session_stats():
+    return chat_sessions.stats()
+
+@app.get("/llm/rate-limit/stats")
+async def rate_limit_stats():
+    return llm_client.rate_limiter.stats()
+
+# Scrape-time gauges over state the components already keep
+registry.gauge("crm_llm_in_flight", "Upstream LLM calls in flight", lambda: llm_client.in_flight)
+registry.gauge("crm_llm_coalesced_calls_total", "Calls that shared an identical in-flight completion",
+               lambda: llm_client.coalesced, kind="counter")
+registry.gauge("crm_llm_retries_total", "Upstream LLM attempts retried after 429 or 5xx",
+               lambda: llm_client.retries, kind="counter")
+registry.gauge("crm_rate_limit_queue_depth", "Calls waiting for rate-limit budget",
+               lambda: {(name,): stats["queue_depth"]
+                        for name, stats in llm_client.rate_limiter.stats()["priorities"].items()},
+               labelnames=("priority",))
+registry.gauge("crm_circuit_breaker_state", "1 for the circuit breaker's current state",
+               lambda: {(state,): int(circuit_breaker.snapshot()["state"] == state)
+                        for state in ("closed", "open", "half_open")},
+               labelnames=("state",))
+registry.gauge("crm_llm_cache_lookups_total", "LLM response cache lookups by result",
+               lambda: {("hit",): response_cache.counters["hits"], ("miss",): response_cache.counters["misses"]},
+               labelnames=("result",), kind="counter")
+registry.gauge("crm_analysis_parse_total", "LLM analysis answers by parse outcome",
+               lambda: {(outcome,): extraction_stats.snapshot()[key]
+                        for outcome, key in (("clean", "clean"), ("repaired", "repaired"), ("fallback", "fallbacks"))},
+               labelnames=("outcome",), kind="counter")
+registry.gauge("crm_analysis_repairs_total", "Defects repaired in LLM analysis JSON",
+               lambda: {(repair,): count for repair, count in extraction_stats.snapshot()["repairs"].items()},
+               labelnames=("repair",), kind="counter")
+registry.gauge("crm_interaction_write_queue_depth", "Interaction rows waiting in the write-behind queue",
+               lambda: interaction_writer.stats()["pending"])
+registry.gauge("crm_interactions_written_total", "Interaction rows persisted",
+               lambda: interaction_writer.rows_written, kind="counter")
+registry.gauge("crm_interaction_write_retries_total", "Interaction batches retried after a failed write",
+               lambda: interaction_writer.retried_batches, kind="counter")
+registry.gauge("crm_interaction_write_failures_total", "Interaction rows that could not be written (dead-lettered)",
+               lambda: interaction_writer.failed_rows, kind="counter")
+
+registry.gauge("crm_analysis_route_total", "Interaction analyses answered locally vs sent to the LLM",
+               lambda: {("local",): note_extractor.local, ("llm",): note_extractor.llm},
+               labelnames=("route",), kind="counter")
+registry.gauge("crm_hcp_resolution_total", "Interaction HCP names by how they resolved to a profile",
+               lambda: {(result,): hcp_resolver.lookups[result] for result in RESOLUTION_RESULTS},
+               labelnames=("result",), kind="counter")
+registry.gauge("crm_prompt_fields_truncated_total", "Prompt fields cut to their token budget, by template",
+               lambda: {(name,): template.truncated for name, template in prompts.templates.items()},
+               labelnames=("template",), kind="counter")
+registry.gauge("crm_chat_sessions", "Live chat sessions", lambda: len(chat_sessions))
+registry.gauge("crm_chat_sessions_removed_total", "Chat sessions removed as idle or least recently used",
+               lambda: {("idle",): chat_sessions.counters["expired"], ("lru",): chat_sessions.counters["evicted"]},
+               labelnames=("reason",), kind="counter")
+registry.gauge("crm_note_index_rows", "Interaction notes in the suggestion retrieval index",
+               lambda: len(note_index) if note_index is not None else 0)
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    return PlainTextResponse(registry.exposition(), media_type="text/plain; version=0.0.4")
+
+@app.get("/cache/stats")
+async def cache_stats():
+    return response_cache.stats()
+
+@app.post("/chat")
+async def chat_endpoint(message: ChatMessage):
+    return await chat(message, chat_sessions.open(message.session_id))
+
+async def chat(message, session):
+    intent = classify_intent(message.message)
+    start = time.perf_counter()
+    try:
+        return dict(await handle_chat(message, intent, session), session_id=session.id)
+    finally:
+        CHAT_INTENT_SECONDS.observe(time.perf_counter() - start, intent)
+
+async def handle_chat(message, intent, session):
+    try:
+        # Log interaction
+        if intent == LOG_INTERACTION:
+            note, hcp_name, follow_up = note_to_log(session, message.message)
+            if note is None:
+                remember(session, intent, message.message)
+                return {
+                    "response": NOTHING_TO_LOG_RESPONSE,
+                    "action_taken": "general_chat",
+                    "tools_used": []
+                }
+            analysis = await analyze_interaction(note, hcp_name)
+            await interaction_writer.submit(build_interaction_row(note, hcp_name, analysis,
+                                                                  territory=message.territory))
+            remember(session, intent, note, hcp_name, log_outcome(analysis))
+            
+            result = {
+                "response": format_log_response(hcp_name, analysis),
+                "action_taken": "log_interaction",
+                "tools_used": ["log_interaction", "ai_analysis"]
+            }
+            suggestions = await follow_up_suggestions(session, follow_up, hcp_name)
+            if suggestions:
+                result["response"] += "\n\n" + suggestions
+                result["tools_used"] += ["suggest_next_actions", "ai_strategy"]
+            return result
+        
+        # Show history
+        elif intent == VIEW_HISTORY:
+            hcp_name = session_hcp(session, message.message)
+            
+            pending = await interaction_writer.wait_for_hcp(hcp_name)
+            history = await fetch_hcp_history_async(hcp_name, 5)
+            remember(session, intent, message.message, hcp_name)
+            response = format_history_response(hcp_name, history["interactions"])
+            if pending:
+                response += f"\n\n{pending} more interaction(s) are still being saved and will show up shortly."
+            
+            return {
+                "response": response,
+                "action_taken": "view_history",
+                "tools_used": ["get_hcp_history"]
+            }
+        
+        # Get suggestions
+        elif intent == GET_SUGGESTIONS:
+            hcp_name = session_hcp(session, message.message)
+            suggestions = await get_ai_suggestions(hcp_name, message.message, session.summary())
+            remember(session, intent, message.message, hcp_name)
+            
+            return {
+                "response": format_suggestions_response(hcp_name, suggestions),
+                "action_taken": "get_suggestions", 
+                "tools_used": ["suggest_next_actions", "ai_strategy"]
+            }
+        
+        # Analyze trends
+        elif intent == ANALYZE_TRENDS:
+            report = await asyncio.to_thread(trend_analytics.report, trend_days(message.message))
+            remember(session, intent, message.message, outcome=f"last {report['period_days']} days")
+            
+            return {
+                "response": format_trends_response(report),
+                "action_taken": "analyze_trends",
+                "tools_used": ["analyze_interaction_trends"]
+            }
+        
+        # General chat
+        else:
+            return {
+                "response": hold_note(session, message.message),
                 "action_taken": "general_chat",
                 "tools_used": []
             }
@@ -300,11 +812,251 @@ Powered by Groq AI (gemma2-9b-it)""",
             "tools_used": []
         }
 
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def stream_chat(message):
+    """Server-sent events for one chat message.
+
+    `token` frames carry LLM output as it arrives, `field` frames carry each
+    analysis field once it is complete, and a single `final` frame
+    carries the same response/action_taken/tools_used/session_id as /chat
+    plus the extracted fields.
+    """
+    session = chat_sessions.open(message.session_id)
+    try:
+        intent = classify_intent(message.message)
+        note, hcp_name, follow_up = None, None, ""
+        if intent == LOG_INTERACTION:
+            note, hcp_name, follow_up = note_to_log(session, message.message)
+        
+        if note is not None:
+            analysis, confidences = note_extractor.analyze(note, hcp_name)
+            if note_extractor.confident(confidences):
+                # Answered locally: no tokens to stream, every field is ready at once
+                for name, value in analysis.items():
+                    yield sse_event("field", {"name": name, "value": value})
+            else:
+                chunks = []
+                extractor = JSONExtractor()
+                async for chunk in stream_groq_api(build_analysis_prompt(note, hcp_name),
+                                                   cache_key=analysis_cache_key(note, hcp_name),
+                                                   template=ANALYSIS_PROMPT.name, fallback=False):
+                    chunks.append(chunk)
+                    yield sse_event("token", {"text": chunk})
+                    # Each analysis field is sent as soon as its value has closed in the stream
+                    for name, value in extractor.feed(chunk).items():
+                        field = normalize_field(name, value)
+                        if field:
+                            yield sse_event("field", {"name": field[0], "value": field[1]})
+                # No chunks means the upstream did not answer: the local analysis stands
+                if chunks:
+                    analysis = extract_analysis("".join(chunks), analysis)
+            await interaction_writer.submit(build_interaction_row(note, hcp_name, analysis,
+                                                                  territory=message.territory))
+            remember(session, intent, note, hcp_name, log_outcome(analysis))
+            
+            result = {
+                "response": format_log_response(hcp_name, analysis),
+                "action_taken": "log_interaction",
+                "tools_used": ["log_interaction", "ai_analysis"],
+                "extracted": dict(analysis, hcp_name=hcp_name),
+                "session_id": session.id
+            }
+            suggestions = await follow_up_suggestions(session, follow_up, hcp_name)
+            if suggestions:
+                result["response"] += "\n\n" + suggestions
+                result["tools_used"] += ["suggest_next_actions", "ai_strategy"]
+        
+        elif intent == GET_SUGGESTIONS:
+            hcp_name = session_hcp(session, message.message)
+            context = await suggestion_context(hcp_name, message.message)
+            conversation = session.summary()
+            chunks = []
+            async for chunk in stream_groq_api(build_suggestions_prompt(hcp_name, context, conversation),
+                                               cache_key=suggestions_cache_key(hcp_name, context, conversation),
+                                               template=suggestions_template(context).name):
+                chunks.append(chunk)
+                yield sse_event("token", {"text": chunk})
+            remember(session, intent, message.message, hcp_name)
+            
+            result = {
+                "response": format_suggestions_response(hcp_name, "".join(chunks) or FALLBACK_SUGGESTIONS),
+                "action_taken": "get_suggestions",
+                "tools_used": ["suggest_next_actions", "ai_strategy"],
+                "extracted": {"hcp_name": hcp_name},
+                "session_id": session.id
+            }
+        
+        # History, trends, general chat and "log that" with nothing held make no LLM call: one frame
+        else:
+            result = await chat(message, session)
+        
+        yield sse_event("final", result)
+    
+    except Exception as e:
+        yield sse_event("final", {
+            "response": f"System Error: {str(e)}\n\nPlease try again or contact support.",
+            "action_taken": "error",
+            "tools_used": [],
+            "session_id": session.id
+        })
+
+@app.post("/chat/stream")
+async def chat_stream_endpoint(message: ChatMessage):
+    return StreamingResponse(
+        stream_chat(message),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.post("/log-interaction")
 async def log_interaction_endpoint(message: ChatMessage):
     # Redirect to chat endpoint
     return await chat_endpoint(message)
 
+async def analyze_batch_item(index, note, territory=None):
+    """Analyse one batch note; returns its per-item result and the row to persist (None on error)"""
+    if not note.strip():
+        return {"index": index, "status": "error", "error": "Empty note"}, None
+    try:
+        hcp_name = extract_hcp_name(note)
+        analysis = await analyze_interaction_batched(note, hcp_name)
+    except Exception as e:
+        return {"index": index, "status": "error", "error": str(e)}, None
+    result = {"index": index, "status": "logged", "hcp_name": hcp_name, "analysis": analysis}
+    return result, build_interaction_row(note, hcp_name, analysis, territory=territory)
+
+async def persist_batch_results(results, rows):
+    """Write rows in one transaction; if it fails, every item in it is reported as failed"""
+    try:
+        await interaction_writer.submit_many(rows)
+    except Exception as e:
+        print(f"Batch interaction write error ({len(rows)} rows): {e}")
+        for result in results:
+            if result["status"] == "logged":
+                result.update(status="error", error=f"Write failed: {e}")
+
+def batch_summary(results):
+    logged = sum(1 for result in results if result["status"] == "logged")
+    return {"total": len(results), "logged": logged, "failed": len(results) - logged}
+
+@app.post("/log-interactions/batch")
+async def log_interactions_batch_endpoint(batch: BatchLogRequest):
+    """Analyse many notes concurrently (BATCH_MAX_PARALLELISM at a time) and persist them in one transaction"""
+    if len(batch.notes) > BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {BATCH_MAX_ITEMS} notes per batch; use /log-interactions/batch/stream for more"
+        )
+    
+    semaphore = asyncio.Semaphore(BATCH_MAX_PARALLELISM)
+    
+    async def limited(index, note):
+        async with semaphore:
+            return await analyze_batch_item(index, note, batch.territory)
+    
+    outcomes = await asyncio.gather(*(limited(i, note) for i, note in enumerate(batch.notes)))
+    results = [result for result, _ in outcomes]
+    await persist_batch_results(results, [row for _, row in outcomes if row is not None])
+    
+    return dict(batch_summary(results), results=results)
+
+class NDJSONStreamingResponse(StreamingResponse):
+    """StreamingResponse that leaves `receive` to the body generator.
+
+    Starlette's StreamingResponse listens for disconnects on `receive` while
+    streaming, which would swallow request body chunks the generator has not
+    read yet. A client that drops mid-upload still surfaces through
+    request.stream().
+    """
+    
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+async def read_ndjson_lines(request):
+    """Yield the non-blank lines of a streamed request body as they arrive"""
+    buffer = b""
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield line
+    if buffer.strip():
+        yield buffer
+
+async def analyze_ndjson_line(index, line):
+    try:
+        item = ChatMessage.model_validate_json(line)
+    except ValidationError:
+        return {"index": index, "status": "error", "error": "Invalid line; expected {\"message\": \"...\"}"}, None
+    return await analyze_batch_item(index, item.message, item.territory)
+
+async def stream_batch_log(lines):
+    """NDJSON pipeline for /log-interactions/batch/stream.
+
+    At most BATCH_MAX_PARALLELISM lines are being analysed at once, and at
+    most WRITE_BATCH_SIZE finished items wait for their transaction, so memory
+    stays flat however long the upload is. Each item's result line is sent
+    after its transaction commits, in completion order; a summary line ends
+    the stream.
+    """
+    pending = set()
+    chunk_results, chunk_rows = [], []
+    totals = {"total": 0, "logged": 0, "failed": 0}
+    
+    def collect(done):
+        for task in done:
+            result, row = task.result()
+            chunk_results.append(result)
+            if row is not None:
+                chunk_rows.append(row)
+    
+    async def flush():
+        results = chunk_results[:]
+        await persist_batch_results(results, chunk_rows[:])
+        chunk_results.clear()
+        chunk_rows.clear()
+        for key, value in batch_summary(results).items():
+            totals[key] += value
+        return "".join(json.dumps(result) + "\n" for result in results)
+    
+    try:
+        index = 0
+        async for line in lines:
+            if len(pending) >= BATCH_MAX_PARALLELISM:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                collect(done)
+                if len(chunk_results) >= WRITE_BATCH_SIZE:
+                    yield await flush()
+            pending.add(asyncio.ensure_future(analyze_ndjson_line(index, line)))
+            index += 1
+        
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            collect(done)
+            if len(chunk_results) >= WRITE_BATCH_SIZE:
+                yield await flush()
+        if chunk_results:
+            yield await flush()
+        
+        yield json.dumps({"summary": totals}) + "\n"
+    finally:
+        for task in pending:
+            task.cancel()
+
+@app.post("/log-interactions/batch/stream")
+async def log_interactions_batch_stream_endpoint(request: Request):
+    """NDJSON in, NDJSON out: one {"message": ..., "territory": ...} per request line, one result per response line"""
+    return NDJSONStreamingResponse(
+        stream_batch_log(read_ndjson_lines(request)),
+        media_type="application/x-ndjson",
+        headers={"X-Accel-Buffering": "no"}
+    )
+
 if __name__ == "__main__":
     print("Starting AI-First CRM Backend...")
     print("AI Engine: Groq (gemma2-9b-it)")
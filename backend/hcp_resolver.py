@@ -0,0 +1,410 @@
+"""Entity resolution of HCP names to HCPProfile rows.
+
+"Dr. Smith", "Doctor Smith", "dr smith" and "Dr. Smyth" are one HCP. Names
+are resolved at write time against an in-memory index of profile names, so
+interactions are stored under the profile's name and hcp_profile_id instead
+of fragmenting history and rollups across spellings:
+- exact: the name's lowercase tokens without the title
+- phonetic: every token respelled by sound ("smyth" ~ "smith", "phillips"
+  ~ "filips"); vowels are kept, so "Lee" and "Li" stay apart
+- typo (HCP_RESOLVE_TYPOS): one edit in a long enough surname, found through
+  the exact halves of the surname (an edit leaves one half intact)
+Every step is a few dict lookups, so lookups do not slow down as profiles grow.
+A name matching several profiles equally well is left unresolved, and
+names with digits in them only resolve exactly.
+
+Existing duplicates are merged with: python hcp_resolver.py dedup [--dry-run] [--typos]
+Running resolvers notice the merge on their next refresh (fewer profiles
+than they loaded) and rebuild their index, so they stop resolving names to
+the deleted profiles.
+"""
+import argparse
+import os
+import re
+import threading
+import time
+from collections import Counter
+from functools import lru_cache
+from sqlalchemy import bindparam, delete, func, select, text, update
+from models import HCPInteraction, HCPProfile, SessionLocal
+from note_extractor import name_key
+from profile_aggregator import merge_rollups, known_specialty, stored_strength, strength_values
+from note_index import open_note_index
+
+# New HCPProfile rows are added to the index this often (seconds)
+HCP_RESOLVER_REFRESH_SECONDS = float(os.getenv("HCP_RESOLVER_REFRESH_SECONDS", "60"))
+# One-typo matches at write time: off by default, since two real HCPs can be one letter apart
+HCP_RESOLVE_TYPOS = os.getenv("HCP_RESOLVE_TYPOS", "false").lower() in ("1", "true", "yes")
+# Surnames shorter than this never match by typo; short names one edit apart are often different people
+HCP_FUZZY_MIN_LENGTH = int(os.getenv("HCP_FUZZY_MIN_LENGTH", "7"))
+
+DEDUP_BATCH_SIZE = 1000
+
+EXACT = "exact"
+PHONETIC = "phonetic"
+TYPO = "typo"
+UNRESOLVED = "unresolved"
+SCORES = {EXACT: 1.0, PHONETIC: 0.9, TYPO: 0.85}
+RESOLUTION_RESULTS = (EXACT, PHONETIC, TYPO, UNRESOLVED)
+
+# Spellings of the same sound, applied in order
+PHONETIC_RULES = [
+    (re.compile(r"^(?:kn|gn|pn|wr)"), lambda m: m.group(0)[1]),
+    (re.compile(r"mb$"), lambda m: "m"),
+    (re.compile(r"sch"), lambda m: "sk"),
+    (re.compile(r"ph"), lambda m: "f"),
+    (re.compile(r"(?<=[tgkr])h"), lambda m: ""),
+    (re.compile(r"ck|q"), lambda m: "k"),
+    (re.compile(r"c(?=[eiy])"), lambda m: "s"),
+    (re.compile(r"c"), lambda m: "k"),
+    (re.compile(r"z"), lambda m: "s"),
+    (re.compile(r"x"), lambda m: "ks"),
+    (re.compile(r"dg"), lambda m: "j"),
+    (re.compile(r"(?<=.)y"), lambda m: "i"),
+    (re.compile(r"(.)\1+"), lambda m: m.group(1)),
+]
+
+
+@lru_cache(maxsize=1 << 16)
+def phonetic_key(word):
+    """A word respelled by sound: "smyth" and "smith" -> "smit", "phillips" and "filips" -> "filips" """
+    for pattern, replace in PHONETIC_RULES:
+        word = pattern.sub(replace, word)
+    return word
+
+
+def one_edit_apart(a, b):
+    """Whether b is a with one letter deleted, inserted, replaced, or swapped with its neighbour"""
+    if a == b or abs(len(a) - len(b)) > 1:
+        return False
+    i = 0
+    while i < len(a) and i < len(b) and a[i] == b[i]:
+        i += 1
+    if len(a) == len(b):
+        return a[i + 1:] == b[i + 1:] or (i + 1 < len(a) and a[i] == b[i + 1] and a[i + 1] == b[i]
+                                          and a[i + 2:] == b[i + 2:])
+    return a[i + 1:] == b[i:] if len(a) > len(b) else a[i:] == b[i + 1:]
+
+
+def surname_halves(key):
+    """(first names, surname halves) index keys of a name key; one typo in the surname keeps one half"""
+    rest, _, surname = key.rpartition(" ")
+    middle = len(surname) // 2
+    return (f"{rest}|{len(surname)}<{surname[:middle]}", f"{rest}|{len(surname)}>{surname[middle:]}")
+
+
+def _bucket_add(index, key, profile_id):
+    # Most keys have one profile; a bare int instead of a one-item list keeps 500k profiles compact
+    ids = index.get(key)
+    if ids is None:
+        index[key] = profile_id
+    elif isinstance(ids, int):
+        if ids != profile_id:
+            index[key] = [ids, profile_id]
+    elif profile_id not in ids:
+        ids.append(profile_id)
+
+
+def _bucket(index, key):
+    ids = index.get(key)
+    if ids is None:
+        return ()
+    return (ids,) if isinstance(ids, int) else ids
+
+
+class HCPResolver:
+    """In-memory index of HCPProfile names: exact, phonetic and one-typo lookups"""
+
+    def __init__(self, refresh_seconds=HCP_RESOLVER_REFRESH_SECONDS, typos=HCP_RESOLVE_TYPOS,
+                 fuzzy_min_length=HCP_FUZZY_MIN_LENGTH):
+        self.refresh_seconds = refresh_seconds
+        self.typos = typos
+        self.fuzzy_min_length = fuzzy_min_length
+        self._names = {}
+        self._keys = {}
+        self._by_key = {}
+        self._by_sound = {}
+        self._by_half = {}
+        self._lock = threading.Lock()
+        # Serialises load() between the refresh thread and writers reloading after a merge
+        self._loading = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+        self.last_id = 0
+        # Profiles with ids up to last_id when they were loaded; fewer in the table means some were merged away
+        self.loaded = 0
+        self.loaded_at = None
+        self.rebuilds = 0
+        self.lookups = Counter()
+
+    def __len__(self):
+        return len(self._names)
+
+    def add(self, profile_id, name):
+        """Index one profile; the first profile with a key keeps it"""
+        key = " ".join(name_key(name))
+        if not key:
+            return
+        with self._lock:
+            if profile_id in self._names:
+                return
+            self._names[profile_id] = name
+            self._keys[profile_id] = key
+            self._by_key.setdefault(key, profile_id)
+            _bucket_add(self._by_sound, " ".join(phonetic_key(word) for word in key.split()), profile_id)
+            if self.typos:
+                for half in surname_halves(key):
+                    _bucket_add(self._by_half, half, profile_id)
+
+    def name_of(self, profile_id):
+        return self._names.get(profile_id)
+
+    def _closest_surname(self, surname, candidates):
+        """The one candidate whose surname is one edit from surname; None if none or several"""
+        found = None
+        for profile_id in candidates:
+            key = self._keys.get(profile_id)
+            if key is not None and one_edit_apart(surname, key.rpartition(" ")[2]):
+                if found is not None:
+                    return None
+                found = profile_id
+        return found
+
+    def match(self, name):
+        """(profile_id, how) for a name: how is exact, phonetic or typo; None when unknown or ambiguous"""
+        key = " ".join(name_key(name))
+        if not key:
+            return None
+        profile_id = self._by_key.get(key)
+        if profile_id is not None:
+            return profile_id, EXACT
+        if any(char.isdigit() for char in key):
+            # "Dr. Smith-12" and "Dr. Smith-13" are different people
+            return None
+        sounds = _bucket(self._by_sound, " ".join(phonetic_key(word) for word in key.split()))
+        if len(sounds) == 1:
+            return sounds[0], PHONETIC
+        rest, _, surname = key.rpartition(" ")
+        if sounds or not self.typos or len(surname) < self.fuzzy_min_length:
+            return None
+        candidates = set()
+        for length in (len(surname) - 1, len(surname), len(surname) + 1):
+            middle = length // 2
+            candidates.update(_bucket(self._by_half, f"{rest}|{length}<{surname[:middle]}"))
+            candidates.update(_bucket(self._by_half, f"{rest}|{length}>{surname[len(surname) - length + middle:]}"))
+        found = self._closest_surname(surname, candidates)
+        return (found, TYPO) if found is not None else None
+
+    def resolve(self, name):
+        """(profile_id, profile name, score) for a name, or None; counted in stats()"""
+        found = self.match(name)
+        if found is None:
+            self.lookups[UNRESOLVED] += 1
+            return None
+        profile_id, how = found
+        name = self._names.get(profile_id)
+        if name is None:
+            # Dropped by a rebuild between the match and here
+            self.lookups[UNRESOLVED] += 1
+            return None
+        self.lookups[how] += 1
+        return profile_id, name, SCORES[how]
+
+    def canonical_name(self, name):
+        """The profile name a name resolves to, or the name itself; not counted in stats()"""
+        found = self.match(name)
+        return self._names.get(found[0], name) if found else name
+
+    def load(self, session_factory=SessionLocal, batch_size=10000):
+        """Add HCPProfile rows created since the last load, rebuilding if any were deleted; returns profiles added"""
+        with self._loading:
+            return self._load(session_factory, batch_size)
+
+    def _load(self, session_factory, batch_size):
+        if self.loaded:
+            with session_factory() as session:
+                remaining = session.scalar(select(func.count()).where(HCPProfile.id <= self.last_id))
+            if remaining < self.loaded:
+                return self.rebuild(session_factory, batch_size)
+        added = 0
+        while True:
+            with session_factory() as session:
+                rows = session.execute(
+                    select(HCPProfile.id, HCPProfile.name)
+                    .where(HCPProfile.id > self.last_id)
+                    .order_by(HCPProfile.id)
+                    .limit(batch_size)
+                ).all()
+            for profile_id, name in rows:
+                self.add(profile_id, name)
+                self.last_id = profile_id
+            added += len(rows)
+            self.loaded += len(rows)
+            if len(rows) < batch_size:
+                self.loaded_at = time.monotonic()
+                return added
+
+    def load_if_due(self, session_factory=SessionLocal):
+        """load() unless the last load was less than refresh_seconds ago, for callers without start()"""
+        if self.loaded_at is None or time.monotonic() - self.loaded_at >= self.refresh_seconds:
+            self.load(session_factory)
+
+    def rebuild(self, session_factory=SessionLocal, batch_size=10000):
+        """Reload every profile into a new index and swap it in, dropping profiles since deleted"""
+        fresh = HCPResolver(self.refresh_seconds, self.typos, self.fuzzy_min_length)
+        fresh.load(session_factory, batch_size)
+        with self._lock:
+            self._by_key, self._by_sound, self._by_half = fresh._by_key, fresh._by_sound, fresh._by_half
+            self._names, self._keys = fresh._names, fresh._keys
+            self.last_id, self.loaded, self.loaded_at = fresh.last_id, fresh.loaded, fresh.loaded_at
+        self.rebuilds += 1
+        print(f"HCP resolver rebuilt after profiles were merged: {len(self):,} profiles")
+        return len(self)
+
+    def _refresh_loop(self):
+        while True:
+            try:
+                self.load()
+            except Exception as e:
+                print(f"HCP resolver refresh error: {e}")
+            if self._stopping.wait(self.refresh_seconds):
+                return
+
+    def start(self):
+        """Load HCP profiles now and pick up new ones every refresh_seconds in a background thread"""
+        if self._thread is None:
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._refresh_loop, name="hcp-resolver", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def stats(self):
+        resolved = sum(self.lookups[how] for how in SCORES)
+        total = resolved + self.lookups[UNRESOLVED]
+        return {
+            "profiles": len(self),
+            "lookups": total,
+            "resolved": {how: self.lookups[how] for how in SCORES},
+            "unresolved": self.lookups[UNRESOLVED],
+            "resolved_ratio": round(resolved / total, 3) if total else 0.0,
+            "typo_matching": self.typos,
+            "rebuilds": self.rebuilds,
+        }
+
+
+def dedup_profiles(session_factory=SessionLocal, batch_size=DEDUP_BATCH_SIZE, dry_run=False, typos=False,
+                   same_name_only=False):
+    """Merge duplicate HCP profiles in one streaming pass over hcp_profiles, oldest first.
+
+    Each profile is resolved against the profiles kept so far (one-typo
+    matches only with typos=True); a match is merged into that older
+    profile: its interactions are renamed and relinked (through the
+    hcp_name index), its rollups folded into the survivor's, and the
+    profile deleted. Interactions from before
+    hcp_profile_id existed are then linked by name, and the note index
+    re-keys the merged names' notes. As in rebuild_profiles,
+    writes wait until the read stream is done. Running servers' resolvers
+    drop the merged profiles on their next refresh. With same_name_only=True
+    only profiles with identical names are merged (init_db does this before
+    adding the unique name index).
+    """
+    start = time.perf_counter()
+    resolver = HCPResolver(typos=typos)
+    merges = []
+    profiles = 0
+    first_with_name = {}
+    with session_factory() as session:
+        stream = session.execute(
+            select(HCPProfile.id, HCPProfile.name, HCPProfile.specialty, HCPProfile.total_interactions,
+                   HCPProfile.last_interaction_date, HCPProfile.relationship_strength, HCPProfile.strength_score)
+            .order_by(HCPProfile.id)
+            .execution_options(yield_per=10000)
+        )
+        for row in stream:
+            profiles += 1
+            if same_name_only:
+                survivor_id = first_with_name.setdefault(row.name, row.id)
+                found = (survivor_id, EXACT) if survivor_id != row.id else None
+            else:
+                found = resolver.match(row.name)
+            if found is None:
+                resolver.add(row.id, row.name)
+            else:
+                merges.append((row, found[0], found[1]))
+
+    for row, survivor_id, how in merges[:20] if dry_run else ():
+        print(f"  {row.name!r} -> {resolver.name_of(survivor_id)!r} ({how})")
+    if dry_run or not merges:
+        print(f"{len(merges):,} of {profiles:,} profiles are duplicates"
+              f"{' (dry run, nothing changed)' if dry_run else ''}")
+        return len(merges)
+
+    survivor_ids = sorted({survivor_id for _, survivor_id, _ in merges})
+    with session_factory() as session:
+        states = {}
+        for offset in range(0, len(survivor_ids), batch_size):
+            for profile in session.scalars(
+                    select(HCPProfile).where(HCPProfile.id.in_(survivor_ids[offset:offset + batch_size]))):
+                states[profile.id] = ((profile.total_interactions or 0, profile.last_interaction_date,
+                                       stored_strength(profile)), profile.specialty)
+        for row, survivor_id, _ in merges:
+            state, specialty = states[survivor_id]
+            duplicate = (row.total_interactions or 0, row.last_interaction_date, stored_strength(row))
+            states[survivor_id] = (merge_rollups(state, duplicate),
+                                  known_specialty(specialty) or known_specialty(row.specialty) or specialty)
+
+        relink = (update(HCPInteraction)
+                  .where(HCPInteraction.hcp_name == bindparam("duplicate"))
+                  .values(hcp_name=bindparam("survivor"), hcp_profile_id=bindparam("survivor_id")))
+        renames = [{"duplicate": row.name, "survivor": resolver.name_of(survivor_id), "survivor_id": survivor_id}
+                   for row, survivor_id, _ in merges]
+        for offset in range(0, len(renames), batch_size):
+            session.connection().execute(relink, renames[offset:offset + batch_size])
+        duplicate_ids = [row.id for row, _, _ in merges]
+        for offset in range(0, len(duplicate_ids), batch_size):
+            session.execute(delete(HCPProfile).where(HCPProfile.id.in_(duplicate_ids[offset:offset + batch_size])))
+        rollups = [{"id": profile_id, "total_interactions": total, "last_interaction_date": last_date,
+                    **strength_values(strength), "specialty": specialty}
+                   for profile_id, ((total, last_date, strength), specialty) in states.items()]
+        for offset in range(0, len(rollups), batch_size):
+            session.execute(update(HCPProfile), rollups[offset:offset + batch_size])
+        link_interactions(session)
+        session.commit()
+
+    # Notes indexed under a merged name would otherwise never be retrieved for the survivor
+    moves = {rename["duplicate"]: rename["survivor"] for rename in renames if rename["duplicate"] != rename["survivor"]}
+    index = open_note_index() if moves else None
+    if index is not None:
+        rekeyed = index.rekey(moves)
+        print(f"Note index: {rekeyed:,} notes moved to their surviving HCP names")
+
+    elapsed = time.perf_counter() - start
+    print(f"Merged {len(merges):,} duplicate profiles into {len(survivor_ids):,} "
+          f"(of {profiles:,} profiles) in {elapsed:.1f}s")
+    return len(merges)
+
+
+def link_interactions(session):
+    """Set hcp_profile_id on interactions written before it existed, by profile name"""
+    return session.execute(text(
+        "UPDATE hcp_interactions SET hcp_profile_id = "
+        "(SELECT id FROM hcp_profiles WHERE hcp_profiles.name = hcp_interactions.hcp_name) "
+        "WHERE hcp_profile_id IS NULL"
+    )).rowcount
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="HCP entity resolution maintenance")
+    parser.add_argument("command", choices=["dedup"])
+    parser.add_argument("--dry-run", action="store_true", help="report duplicates without merging")
+    parser.add_argument("--typos", action="store_true", help="also merge names one typo apart")
+    args = parser.parse_args()
+
+    from models import init_db
+    init_db()
+    dedup_profiles(dry_run=args.dry_run, typos=args.typos)
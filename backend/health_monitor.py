@@ -0,0 +1,205 @@
+import asyncio
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from llm_client import LLMError
+
+# Health monitor configuration
+HEALTH_CHECK_INTERVAL = float(os.getenv("HEALTH_CHECK_INTERVAL", "15"))
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "3"))
+BREAKER_RESET_TIMEOUT = float(os.getenv("BREAKER_RESET_TIMEOUT", "30"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+def is_availability_error(error):
+    """Timeouts, connection errors and 5xx mean the upstream is down; 4xx do not"""
+    return error.status_code is None or error.status_code >= 500
+
+
+class CircuitBreaker:
+    """Closed/open/half-open breaker for the upstream LLM.
+
+    After `failure_threshold` consecutive failures the breaker opens and
+    callers skip the upstream entirely. Once `reset_timeout` has passed a
+    single trial call is let through (half-open); its outcome closes or
+    re-opens the breaker. A trial that never reports back (its worker died)
+    is given up after another `reset_timeout`.
+
+    Given a SharedStore, the breaker's state lives there and every worker
+    process opens, probes and closes the same breaker; changes to it run in
+    a worker thread, so the event loop never waits on another process.
+    """
+
+    FIELDS = ("state", "consecutive_failures", "opened_at", "last_error", "trial_started")
+
+    def __init__(self, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_timeout=BREAKER_RESET_TIMEOUT, store=None):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.store = store
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        # Wall-clock times, so they mean the same in every process sharing the store
+        self.opened_at = None
+        self.last_error = None
+        self.trial_started = None
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _synced(self):
+        """Hold the lock, with the shared state loaded first and written back afterwards"""
+        with self._lock:
+            if self.store is None:
+                yield
+                return
+            with self.store.update("circuit_breaker") as state:
+                for field in self.FIELDS:
+                    if field in state:
+                        setattr(self, field, state[field])
+                yield
+                state.update({field: getattr(self, field) for field in self.FIELDS})
+
+    def _apply(self, change, *args):
+        with self._synced():
+            return change(*args)
+
+    async def _change(self, change, *args):
+        """Run `change` on the breaker's state; with a store, in a worker thread so the event loop never blocks"""
+        if self.store is None:
+            return self._apply(change, *args)
+        return await self.store.change(self._apply, change, *args)
+
+    async def allow_request(self):
+        return await self._change(self._allow)
+
+    def _allow(self):
+        if self.state == CLOSED:
+            return True
+        now = time.time()
+        if self.state == OPEN:
+            if now - self.opened_at < self.reset_timeout:
+                return False
+            self.state = HALF_OPEN
+            self.trial_started = None
+        if self.trial_started is not None and now - self.trial_started < self.reset_timeout:
+            return False
+        self.trial_started = now
+        return True
+
+    async def cancel_trial(self):
+        """Release the half-open trial slot when its call was abandoned without an outcome"""
+        await self._change(self._cancel_trial)
+
+    def _cancel_trial(self):
+        self.trial_started = None
+
+    async def record_success(self):
+        await self._change(self._succeed)
+
+    def _succeed(self):
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.last_error = None
+        self.trial_started = None
+
+    async def record_failure(self, error=None):
+        await self._change(self._fail, error)
+
+    def _fail(self, error):
+        self.consecutive_failures += 1
+        self.last_error = str(error) if error else None
+        self.trial_started = None
+        if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            self.state = OPEN
+            self.opened_at = time.time()
+
+    def snapshot(self):
+        """Current state; reads the shared store without locking or writing it"""
+        state = {field: getattr(self, field) for field in self.FIELDS}
+        if self.store is not None:
+            state.update(self.store.read("circuit_breaker"))
+        return {
+            "state": state["state"],
+            "consecutive_failures": state["consecutive_failures"],
+            "last_error": state["last_error"],
+        }
+
+
+class HealthMonitor:
+    """Samples upstream LLM availability on its own schedule.
+
+    The background loop hits the provider's model-list endpoint, which costs
+    no tokens, and feeds the result into the circuit breaker. `/health`
+    serves the cached snapshot without touching the network.
+    """
+
+    def __init__(self, client, breaker, interval=HEALTH_CHECK_INTERVAL):
+        self.client = client
+        self.breaker = breaker
+        self.interval = interval
+        self.last_check = None
+        self.last_latency_ms = None
+        self.last_ok = None
+        self._task = None
+
+    async def check(self, deep=False):
+        """Probe the upstream now; deep checks run a one-token completion instead"""
+        start = time.perf_counter()
+        try:
+            if deep:
+                await self.client.complete("Respond with OK", max_tokens=1)
+            else:
+                await self.client.ping()
+            self.last_ok = True
+            await self.breaker.record_success()
+        except LLMError as e:
+            self.last_ok = False
+            if is_availability_error(e):
+                await self.breaker.record_failure(e)
+        self.last_latency_ms = round((time.perf_counter() - start) * 1000, 1)
+        self.last_check = datetime.now(timezone.utc).isoformat()
+        return self.snapshot()
+
+    async def _run(self):
+        while True:
+            try:
+                await self.check()
+            except Exception as e:
+                print(f"Health monitor error: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def snapshot(self):
+        breaker = self.breaker.snapshot()
+        if breaker["state"] == CLOSED and self.last_ok is not False:
+            ai_status = "working"
+        elif breaker["state"] == OPEN:
+            ai_status = "fallback_mode"
+        else:
+            ai_status = "degraded"
+        return {
+            "status": "healthy",
+            "ai_status": ai_status,
+            "circuit_breaker": breaker,
+            "last_check": self.last_check,
+            "last_latency_ms": self.last_latency_ms,
+            "check_interval_seconds": self.interval,
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+        }
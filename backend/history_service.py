@@ -0,0 +1,153 @@
+import base64
+import json
+from datetime import datetime
+from sqlalchemy import select, tuple_
+from models import HCPInteraction, SessionLocal, AsyncSessionLocal
+
+DEFAULT_HISTORY_LIMIT = 10
+MAX_HISTORY_LIMIT = 100
+
+HISTORY_COLUMNS = (
+    HCPInteraction.id,
+    HCPInteraction.interaction_date,
+    HCPInteraction.interaction_type,
+    HCPInteraction.hcp_specialty,
+    HCPInteraction.ai_summary,
+    HCPInteraction.sentiment,
+    HCPInteraction.priority_level,
+    HCPInteraction.next_action,
+)
+
+
+def encode_cursor(interaction_date, interaction_id):
+    """Opaque keyset cursor for the last row of a page; the date is null for an undated row"""
+    raw = json.dumps([interaction_date.isoformat() if interaction_date else None, interaction_id])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        date_text, interaction_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(date_text) if date_text is not None else None, int(interaction_id)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+
+
+def clamp_limit(limit):
+    return max(1, min(int(limit or DEFAULT_HISTORY_LIMIT), MAX_HISTORY_LIMIT))
+
+
+def _page_statements(stmt, limit, cursor):
+    """Newest-first keyset queries, each fetching limit + 1 rows to detect a next page.
+
+    Rows without an interaction_date come after every dated row, newest id
+    first, on all backends (SQLite and PostgreSQL disagree on where NULLs
+    sort). They are a second index range scan, run only when the dated rows
+    run out before the page is full.
+    """
+    date, row_id = HCPInteraction.interaction_date, HCPInteraction.id
+    cursor_date, cursor_id = decode_cursor(cursor) if cursor else (None, None)
+    undated = stmt.where(date.is_(None))
+    if cursor_id is not None and cursor_date is None:
+        return [undated.where(row_id < cursor_id).order_by(row_id.desc()).limit(limit + 1)]
+    if cursor_date is None:
+        dated = stmt.where(date.is_not(None))
+    else:
+        dated = stmt.where(tuple_(date, row_id) < tuple_(cursor_date, cursor_id))
+    return [dated.order_by(date.desc(), row_id.desc()).limit(limit + 1),
+            undated.order_by(row_id.desc()).limit(limit + 1)]
+
+
+def _page_result(rows, limit):
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].interaction_date, rows[-1].id)
+
+    interactions = [{
+        "id": row.id,
+        "date": row.interaction_date.isoformat() if row.interaction_date else None,
+        "type": row.interaction_type,
+        "specialty": row.hcp_specialty,
+        "summary": row.ai_summary,
+        "sentiment": row.sentiment,
+        "priority": row.priority_level,
+        "next_action": row.next_action,
+    } for row in rows]
+    return interactions, next_cursor
+
+
+def _page(session, stmt, limit, cursor):
+    rows = []
+    for page_stmt in _page_statements(stmt, limit, cursor):
+        rows += session.execute(page_stmt).all()
+        if len(rows) > limit:
+            break
+    return _page_result(rows, limit)
+
+
+async def _page_async(session, stmt, limit, cursor):
+    rows = []
+    for page_stmt in _page_statements(stmt, limit, cursor):
+        rows += (await session.execute(page_stmt)).all()
+        if len(rows) > limit:
+            break
+    return _page_result(rows, limit)
+
+
+def _history_query(hcp_name):
+    return select(*HISTORY_COLUMNS).where(HCPInteraction.hcp_name == hcp_name)
+
+
+def _sentiment_query(sentiment):
+    return select(HCPInteraction.hcp_name, *HISTORY_COLUMNS).where(HCPInteraction.sentiment == sentiment)
+
+
+def get_hcp_history(session, hcp_name, limit=DEFAULT_HISTORY_LIMIT, cursor=None):
+    """One page of an HCP's interactions, served from ix_hcp_interactions_hcp_date"""
+    limit = clamp_limit(limit)
+    interactions, next_cursor = _page(session, _history_query(hcp_name), limit, cursor)
+    return {
+        "hcp_name": hcp_name,
+        "interactions": interactions,
+        "next_cursor": next_cursor,
+    }
+
+
+async def get_hcp_history_async(session, hcp_name, limit=DEFAULT_HISTORY_LIMIT, cursor=None):
+    """get_hcp_history on an AsyncSession"""
+    limit = clamp_limit(limit)
+    interactions, next_cursor = await _page_async(session, _history_query(hcp_name), limit, cursor)
+    return {
+        "hcp_name": hcp_name,
+        "interactions": interactions,
+        "next_cursor": next_cursor,
+    }
+
+
+def get_interactions_by_sentiment(session, sentiment, limit=DEFAULT_HISTORY_LIMIT, cursor=None):
+    """One page of interactions with a given sentiment, served from ix_hcp_interactions_sentiment_date"""
+    limit = clamp_limit(limit)
+    interactions, next_cursor = _page(session, _sentiment_query(sentiment), limit, cursor)
+    return {
+        "sentiment": sentiment,
+        "interactions": interactions,
+        "next_cursor": next_cursor,
+    }
+
+
+def fetch_hcp_history(hcp_name, limit=DEFAULT_HISTORY_LIMIT, cursor=None):
+    """get_hcp_history with its own short-lived session"""
+    with SessionLocal() as session:
+        return get_hcp_history(session, hcp_name, limit, cursor)
+
+
+def fetch_interactions_by_sentiment(sentiment, limit=DEFAULT_HISTORY_LIMIT, cursor=None):
+    with SessionLocal() as session:
+        return get_interactions_by_sentiment(session, sentiment, limit, cursor)
+
+
+async def fetch_hcp_history_async(hcp_name, limit=DEFAULT_HISTORY_LIMIT, cursor=None):
+    """get_hcp_history_async with its own short-lived AsyncSession"""
+    async with AsyncSessionLocal() as session:
+        return await get_hcp_history_async(session, hcp_name, limit, cursor)
@@ -0,0 +1,85 @@
+"""Shared chat intent router for final_app, ai_app and the agent.
+
+All keywords are compiled into one word-boundary-aware regex, so a message
+is classified in a single scan and "met" no longer matches "metoprolol".
+
+Priority rules:
+1. Strong keywords beat weak ones. "show me suggestions" is a suggestion
+   request even though "show" usually means history.
+2. Nouns that only mention an interaction ("interaction", "visit",
+   "meeting") rank below every other keyword. "Show my last interaction
+   with Dr. Lee" is a history request, and "what to discuss at my next
+   visit" is a suggestion request; on their own they still mean logging.
+3. Among intents at the same strength, INTENT_PRIORITY decides.
+"""
+import re
+
+LOG_INTERACTION = "log_interaction"
+VIEW_HISTORY = "view_history"
+GET_SUGGESTIONS = "get_suggestions"
+ANALYZE_TRENDS = "analyze_trends"
+GENERAL_CHAT = "general_chat"
+
+INTENT_PRIORITY = [LOG_INTERACTION, VIEW_HISTORY, GET_SUGGESTIONS, ANALYZE_TRENDS]
+
+# intent -> (strong keywords, weak keywords, mentions); phrases may span several words
+INTENT_KEYWORDS = {
+    LOG_INTERACTION: (
+        ["met", "visited", "log", "logged"],
+        ["call", "called", "spoke", "discussed"],
+        ["visit", "meeting", "interaction"],
+    ),
+    VIEW_HISTORY: (
+        ["history", "past", "previous interactions"],
+        ["show", "view"],
+        [],
+    ),
+    GET_SUGGESTIONS: (
+        ["suggest", "suggestion", "suggestions", "recommend", "recommendation", "recommendations"],
+        ["next", "action", "actions", "what should"],
+        [],
+    ),
+    ANALYZE_TRENDS: (
+        ["trend", "trends", "analytics", "analyze", "analyse"],
+        ["patterns"],
+        [],
+    ),
+}
+
+
+class IntentRouter:
+    """Single-pass keyword classifier built from an intent -> keywords table"""
+
+    def __init__(self, keywords=INTENT_KEYWORDS, priority=INTENT_PRIORITY):
+        self.priority = list(priority)
+        # Regex group number -> (rank, intent); lower rank wins, strong before weak before mentions
+        self._group_rank = [None]
+        alternatives = []
+        for intent, tiers in keywords.items():
+            for strength, phrases in enumerate(tiers):
+                if not phrases:
+                    continue
+                self._group_rank.append((strength * len(self.priority) + self.priority.index(intent), intent))
+                # Longest first so "suggestions" is preferred over "suggest"
+                body = "|".join(
+                    r"\s+".join(re.escape(word) for word in phrase.lower().split())
+                    for phrase in sorted(phrases, key=len, reverse=True)
+                )
+                alternatives.append(f"({body})")
+        self._pattern = re.compile(r"\b(?:" + "|".join(alternatives) + r")\b")
+
+    def classify(self, text):
+        best = None
+        for match in self._pattern.finditer(text.lower()):
+            candidate = self._group_rank[match.lastindex]
+            if best is None or candidate[0] < best[0]:
+                best = candidate
+        return best[1] if best else GENERAL_CHAT
+
+
+router = IntentRouter()
+
+
+def classify_intent(text):
+    """Intent for a chat message; one of the module-level intent constants"""
+    return router.classify(text)
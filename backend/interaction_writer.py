@@ -0,0 +1,327 @@
+import asyncio
+import json
+import os
+import time
+from collections import Counter
+from datetime import datetime
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from models import HCPInteraction, SessionLocal
+from profile_aggregator import apply_interactions, link_new_interactions
+
+# Write-behind configuration
+INTERACTION_DURABILITY = os.getenv("INTERACTION_DURABILITY", "batched")  # "sync" or "batched"
+WRITE_BATCH_SIZE = int(os.getenv("WRITE_BATCH_SIZE", "200"))
+WRITE_FLUSH_INTERVAL = float(os.getenv("WRITE_FLUSH_INTERVAL", "0.5"))
+WRITE_QUEUE_SIZE = int(os.getenv("WRITE_QUEUE_SIZE", "10000"))
+# A failed batch is retried this many times (delay doubling from WRITE_RETRY_DELAY), then written row by row
+WRITE_RETRIES = int(os.getenv("WRITE_RETRIES", "3"))
+WRITE_RETRY_DELAY = float(os.getenv("WRITE_RETRY_DELAY", "0.5"))
+# Rows that still cannot be written are appended here as JSON lines; empty only counts them
+WRITE_DEAD_LETTER_PATH = os.path.expanduser(
+    os.getenv("WRITE_DEAD_LETTER_PATH", "~/.cache/crm/failed_interactions.jsonl"))
+# Longest a history read waits for the HCP's queued rows to be written
+WRITE_READ_WAIT = float(os.getenv("WRITE_READ_WAIT", "2"))
+
+SYNC = "sync"
+BATCHED = "batched"
+# Queued by readers: write the rows collected so far without waiting for the flush interval
+FLUSH = object()
+
+
+def infer_interaction_type(text):
+    """Map free-text notes onto the interaction_type column values"""
+    text = text.lower()
+    if "call" in text or "phone" in text:
+        return "call"
+    if "email" in text:
+        return "email"
+    if "conference" in text:
+        return "conference"
+    if "meeting" in text or "met " in text:
+        return "meeting"
+    return "visit"
+
+
+def build_interaction_row(raw_notes, hcp_name, analysis, interaction_type=None, territory=None):
+    """Turn a chat message and its AI analysis into an hcp_interactions row"""
+    return {
+        "hcp_name": hcp_name,
+        "hcp_specialty": analysis.get("specialty"),
+        "interaction_type": interaction_type or infer_interaction_type(raw_notes),
+        "raw_notes": raw_notes,
+        "ai_summary": analysis.get("summary"),
+        "key_topics": json.dumps(analysis.get("topics", [])),
+        "sentiment": analysis.get("sentiment"),
+        "next_action": analysis.get("next_action"),
+        "priority_level": analysis.get("priority"),
+        "territory": territory,
+    }
+
+
+class InteractionWriter:
+    """Persists interaction rows either synchronously or through a write-behind queue.
+
+    In "sync" mode every submit commits its own transaction before returning.
+    In "batched" mode rows are queued and a background task bulk-inserts them
+    (one executemany per batch) when WRITE_BATCH_SIZE rows are waiting or
+    WRITE_FLUSH_INTERVAL seconds have passed, whichever comes first. A
+    batch that fails is retried, then written row by row, and rows that
+    still fail go to the dead-letter file. Queued rows are not visible to
+    readers yet; wait_for_hcp writes an HCP's rows now, so history read
+    straight after logging includes them.
+
+    With a resolver (hcp_resolver.HCPResolver) each row's HCP name is
+    resolved to its profile before the insert; rows for HCPs the resolver
+    does not know yet are linked once their profile exists. A batch that
+    fails on a profile merged away by dedup since the resolver last
+    refreshed reloads the resolver and is resolved again. Without one,
+    hcp_profile_id is left for `python hcp_resolver.py dedup` to fill in.
+    """
+
+    def __init__(self, session_factory=SessionLocal, mode=INTERACTION_DURABILITY,
+                 batch_size=WRITE_BATCH_SIZE, flush_interval=WRITE_FLUSH_INTERVAL,
+                 queue_size=WRITE_QUEUE_SIZE, update_profiles=True, resolver=None, retries=WRITE_RETRIES,
+                 retry_delay=WRITE_RETRY_DELAY, dead_letter_path=WRITE_DEAD_LETTER_PATH):
+        if mode not in (SYNC, BATCHED):
+            raise ValueError(f"Unknown durability mode: {mode}")
+        self.session_factory = session_factory
+        self.mode = mode
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue_size = queue_size
+        self.update_profiles = update_profiles
+        self.resolver = resolver
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.dead_letter_path = dead_letter_path
+        self._queue = None
+        self._task = None
+        # Queued rows per HCP name, and an event set (then replaced) after every batch
+        self._pending = Counter()
+        self._written = asyncio.Event()
+        # Set when the batch being collected can be written before its flush interval is up
+        self._ready = asyncio.Event()
+        self._collected = 0
+        self.rows_written = 0
+        self.batches_written = 0
+        self.retried_batches = 0
+        self.failed_rows = 0
+
+    def write_batch(self, rows):
+        """Insert rows and their profile rollups in one transaction (blocking; run in an executor)"""
+        now = datetime.utcnow()
+        for row in rows:
+            row.setdefault("interaction_date", now)
+        submitted = [(row["hcp_name"], row.get("hcp_profile_id")) for row in rows]
+        try:
+            linked = self._insert(rows)
+        except IntegrityError:
+            # A profile merged away by dedup since the resolver's last refresh: reload it and resolve again
+            if not self._reload_resolver():
+                raise
+            for row, (name, profile_id) in zip(rows, submitted):
+                row["hcp_name"], row["hcp_profile_id"] = name, profile_id
+            linked = self._insert(rows)
+        if self.resolver is not None:
+            for name, profile_id in linked.items():
+                self.resolver.add(profile_id, name)
+        self.rows_written += len(rows)
+        self.batches_written += 1
+
+    def _insert(self, rows):
+        for row in rows:
+            self._resolve(row)
+        linked = {}
+        with self.session_factory() as session:
+            session.execute(insert(HCPInteraction), rows)
+            if self.update_profiles:
+                profile_ids = self._apply_profiles(session, rows)
+                if self.resolver is not None:
+                    linked = link_new_interactions(session, rows, profile_ids)
+            session.commit()
+        return linked
+
+    def _reload_resolver(self):
+        """Refresh the resolver now; whether that dropped profiles deleted since its last load"""
+        if self.resolver is None:
+            return False
+        rebuilds = self.resolver.rebuilds
+        self.resolver.load(self.session_factory)
+        return self.resolver.rebuilds != rebuilds
+
+    def _resolve(self, row):
+        row.setdefault("hcp_profile_id", None)
+        if self.resolver is None or row["hcp_profile_id"] is not None:
+            return
+        resolved = self.resolver.resolve(row["hcp_name"])
+        if resolved is not None:
+            row["hcp_profile_id"], row["hcp_name"], _ = resolved
+
+    def _apply_profiles(self, session, rows):
+        if session.bind.dialect.name == "sqlite":
+            # The interaction insert already holds SQLite's write lock, so no other writer can race us
+            return apply_interactions(session, rows)
+        # A concurrent writer may create the same new profile first; retry once against its row
+        for attempt in range(2):
+            try:
+                with session.begin_nested():
+                    return apply_interactions(session, rows)
+            except IntegrityError:
+                if attempt:
+                    raise
+
+    async def _write(self, rows):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.write_batch, rows)
+
+    async def submit(self, row):
+        """Persist one row; in batched mode this only waits for queue space"""
+        if self.mode == SYNC or self._task is None:
+            await self._write([row])
+        else:
+            self._pending[row["hcp_name"]] += 1
+            try:
+                await self._queue.put(row)
+            except BaseException:
+                self._settle([row["hcp_name"]])
+                raise
+            if self._collected + self._queue.qsize() >= self.batch_size:
+                self._ready.set()
+
+    async def submit_many(self, rows):
+        """Persist several rows in one transaction, regardless of mode"""
+        if rows:
+            await self._write(list(rows))
+
+    async def wait_for_hcp(self, hcp_name, timeout=WRITE_READ_WAIT):
+        """Write the HCP's queued rows now and wait for them; returns how many are still not written"""
+        if not self._pending[hcp_name]:
+            return 0
+        try:
+            self._queue.put_nowait(FLUSH)
+        except asyncio.QueueFull:
+            pass  # A full queue is written in full batches without waiting anyway
+        self._ready.set()
+        deadline = time.monotonic() + timeout
+        while self._pending[hcp_name]:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                await asyncio.wait_for(self._written.wait(), remaining)
+            except asyncio.TimeoutError:
+                break
+        return self._pending[hcp_name]
+
+    async def _run(self):
+        stopping = False
+        while not stopping:
+            row = await self._queue.get()
+            if row is None:
+                break
+            if row is FLUSH:
+                continue
+            batch = [row]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    row = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    # Sleep until the batch fills, a reader or stop() asks for it, or the interval is up
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._collected = len(batch)
+                    self._ready.clear()
+                    try:
+                        await asyncio.wait_for(self._ready.wait(), remaining)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                if row is None:
+                    stopping = True
+                    break
+                if row is FLUSH:
+                    break
+                batch.append(row)
+            self._collected = 0
+            await self._flush(batch)
+
+    async def _flush(self, batch):
+        names = [row["hcp_name"] for row in batch]
+        try:
+            await self._write_retrying(batch)
+        except Exception as e:
+            print(f"Interaction write error ({len(batch)} rows, writing them one at a time): {e}")
+            failed = []
+            for row in batch:
+                try:
+                    await self._write([row])
+                except Exception as row_error:
+                    failed.append((row, row_error))
+            if failed:
+                await self._dead_letter(failed)
+        finally:
+            self._settle(names)
+
+    async def _write_retrying(self, rows):
+        for attempt in range(self.retries + 1):
+            try:
+                return await self._write(rows)
+            except Exception as e:
+                if attempt == self.retries:
+                    raise
+                self.retried_batches += 1
+                print(f"Interaction write error ({len(rows)} rows, retrying): {e}")
+                await asyncio.sleep(self.retry_delay * 2 ** attempt)
+
+    async def _dead_letter(self, failed):
+        self.failed_rows += len(failed)
+        print(f"Interaction write error ({len(failed)} rows not written): {failed[0][1]}")
+        if self.dead_letter_path:
+            await asyncio.to_thread(self._append_dead_letter, failed)
+
+    def _append_dead_letter(self, failed):
+        try:
+            os.makedirs(os.path.dirname(self.dead_letter_path) or ".", exist_ok=True)
+            with open(self.dead_letter_path, "a") as f:
+                for row, error in failed:
+                    f.write(json.dumps({"row": row, "error": str(error)}, default=str) + "\n")
+        except OSError as e:
+            print(f"Interaction dead-letter write error ({len(failed)} rows lost): {e}")
+
+    def _settle(self, names):
+        for name in names:
+            self._pending[name] -= 1
+            if self._pending[name] <= 0:
+                del self._pending[name]
+        self._written.set()
+        self._written = asyncio.Event()
+
+    def start(self):
+        if self.mode == BATCHED and self._task is None:
+            self._queue = asyncio.Queue(maxsize=self.queue_size)
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Flush everything still queued, then stop the background task"""
+        if self._task is None:
+            return
+        await self._queue.put(None)
+        self._ready.set()
+        await self._task
+        self._task = None
+
+    def stats(self):
+        return {
+            "mode": self.mode,
+            "pending": self._queue.qsize() if self._queue is not None else 0,
+            "rows_written": self.rows_written,
+            "batches_written": self.batches_written,
+            "retried_batches": self.retried_batches,
+            "failed_rows": self.failed_rows,
+            "dead_letter_path": self.dead_letter_path or None,
+            "batch_size": self.batch_size,
+            "flush_interval_seconds": self.flush_interval,
+        }
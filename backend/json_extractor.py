@@ -0,0 +1,372 @@
+"""Incremental extraction and repair of JSON in LLM output.
+
+The model is asked for "JSON only" but regularly adds a prose preamble or a
+code fence, uses single quotes or Python literals, leaves trailing commas,
+or stops mid-object at max_tokens. JSONExtractor finds the first balanced
+object while the text is still streaming in, repair_json fixes those
+defects, and InteractionAnalysis validates the six analysis fields. Only
+output with nothing usable in it falls back to keyword analysis.
+"""
+import json
+import threading
+from collections import Counter
+from typing import List
+from pydantic import AliasChoices, BaseModel, Field, field_validator
+
+ANALYSIS_FIELDS = ("summary", "sentiment", "specialty", "next_action", "priority", "topics")
+
+# Names the model sometimes uses instead (ai_app's prompt asks for these)
+FIELD_ALIASES = {
+    "summary": ("summary",),
+    "sentiment": ("sentiment",),
+    "specialty": ("specialty",),
+    "next_action": ("next_action",),
+    "priority": ("priority", "priority_level"),
+    "topics": ("topics", "key_topics"),
+}
+CANONICAL_FIELD = {alias: field for field, aliases in FIELD_ALIASES.items() for alias in aliases}
+
+SENTIMENTS = ("positive", "negative", "neutral")
+PRIORITIES = ("high", "medium", "low")
+
+CLOSERS = {"{": "}", "[": "]"}
+PYTHON_LITERALS = {"True": "true", "False": "false", "None": "null"}
+
+
+def as_text(value):
+    if isinstance(value, (list, tuple)):
+        return ", ".join(str(item) for item in value)
+    return str(value).strip()
+
+
+def as_choice(value, choices, default):
+    text = str(value).strip().lower()
+    for choice in choices:
+        if choice in text:
+            return choice
+    return default
+
+
+def as_topics(value):
+    if isinstance(value, str):
+        items = value.split(",")
+    elif isinstance(value, (list, tuple)):
+        items = value
+    else:
+        items = [value]
+    return [as_text(item) for item in items if item is not None and as_text(item)]
+
+
+FIELD_NORMALIZERS = {
+    "summary": as_text,
+    "specialty": as_text,
+    "next_action": as_text,
+    "sentiment": lambda value: as_choice(value, SENTIMENTS, "neutral"),
+    "priority": lambda value: as_choice(value, PRIORITIES, "medium"),
+    "topics": as_topics,
+}
+
+
+class InteractionAnalysis(BaseModel):
+    """The six fields analyze_interaction returns, normalised to the values the CRM stores"""
+
+    summary: str
+    sentiment: str
+    specialty: str
+    next_action: str
+    priority: str = Field(validation_alias=AliasChoices("priority", "priority_level"))
+    topics: List[str] = Field(validation_alias=AliasChoices("topics", "key_topics"))
+
+    @field_validator("summary", "specialty", "next_action", "sentiment", "priority", "topics", mode="before")
+    @classmethod
+    def normalize(cls, value, info):
+        return FIELD_NORMALIZERS[info.field_name](value)
+
+
+def normalize_field(name, value):
+    """(canonical name, normalised value) for one analysis field, or None if it is not one"""
+    field = CANONICAL_FIELD.get(name)
+    if field is None or value is None:
+        return None
+    return field, FIELD_NORMALIZERS[field](value)
+
+
+def repair_json(text):
+    """Parse text as JSON, fixing common LLM defects; returns (value, repairs) or raises ValueError.
+
+    Fixes single-quoted strings, Python literals, unquoted keys, trailing
+    commas, raw newlines in strings and mismatched brackets in one pass, then
+    closes whatever a truncated answer left open. An answer that stopped
+    mid-string, or still does not parse, is cut back to the last comma that
+    leaves valid JSON.
+    """
+    try:
+        return json.loads(text), []
+    except ValueError:
+        pass
+
+    repairs = set()
+    out = []
+    stack = []
+    cut_points = []
+    quote = None
+    escape = False
+    i, n = 0, len(text)
+    while i < n:
+        ch = text[i]
+        i += 1
+        if quote:
+            if escape:
+                escape = False
+                out.append(ch)
+            elif ch == "\\":
+                escape = True
+                out.append(ch)
+            elif ch == quote:
+                quote = None
+                out.append('"')
+            elif ch == '"':
+                out.append('\\"')
+            elif ch == "\n":
+                repairs.add("control_characters")
+                out.append("\\n")
+            else:
+                out.append(ch)
+        elif ch == '"':
+            quote = ch
+            out.append(ch)
+        elif ch == "'":
+            repairs.add("single_quotes")
+            quote = ch
+            out.append('"')
+        elif ch in CLOSERS:
+            stack.append(CLOSERS[ch])
+            out.append(ch)
+        elif ch in "}]":
+            while out and out[-1].isspace():
+                out.pop()
+            if out and out[-1] == ",":
+                repairs.add("trailing_commas")
+                out.pop()
+            if not stack:
+                repairs.add("mismatched_brackets")
+                continue
+            closer = stack.pop()
+            if closer != ch:
+                repairs.add("mismatched_brackets")
+            out.append(closer)
+        elif ch == ",":
+            cut_points.append((len(out), "".join(reversed(stack))))
+            out.append(ch)
+        elif ch.isalpha() or ch == "_":
+            start = i - 1
+            while i < n and (text[i].isalnum() or text[i] == "_"):
+                i += 1
+            word = text[start:i]
+            rest = text[i:i + 20].lstrip()
+            if word in PYTHON_LITERALS:
+                repairs.add("python_literals")
+                out.append(PYTHON_LITERALS[word])
+            elif rest.startswith(":") and stack and stack[-1] == "}":
+                repairs.add("unquoted_keys")
+                out.append(f'"{word}"')
+            else:
+                out.append(word)
+        else:
+            out.append(ch)
+
+    truncated = bool(quote or stack)
+    candidates = [(position, closers) for position, closers in reversed(cut_points)]
+    if quote:
+        # A value cut off mid-string is only kept when no earlier cut point parses
+        if escape:
+            out.pop()
+        candidates.append((len(out), '"' + "".join(reversed(stack))))
+        out.append('"')
+    else:
+        candidates.insert(0, (len(out), "".join(reversed(stack))))
+
+    repairs.add("truncated" if truncated else "dropped_invalid_tail")
+    for position, closers in candidates:
+        try:
+            value = json.loads("".join(out[:position]) + closers)
+        except ValueError:
+            continue
+        if position == len(out) and not truncated:
+            repairs.discard("dropped_invalid_tail")
+        return value, sorted(repairs)
+    raise ValueError("Unrepairable JSON")
+
+
+class JSONExtractor:
+    """Finds the first balanced JSON object (or array) in text that arrives in chunks.
+
+    feed() looks at each character once. For objects, every top-level
+    "key": value member is returned from feed() as soon as it closes, so a
+    streaming caller can use early fields before the answer is complete.
+    """
+
+    def __init__(self, opener="{"):
+        self.opener = opener
+        self.done = False
+        self.leading_text = ""
+        self.trailing_text = False
+        self.trailing_fence = False
+        self._buffer = []
+        self._stack = []
+        self._quote = None
+        self._escape = False
+        self._member_start = None
+
+    def feed(self, chunk):
+        members = {}
+        for ch in chunk:
+            if self.done:
+                if ch == "`":
+                    self.trailing_fence = True
+                elif not ch.isspace():
+                    self.trailing_text = True
+                continue
+            if not self._stack:
+                if ch == self.opener:
+                    self._stack.append(CLOSERS[ch])
+                    self._buffer.append(ch)
+                    self._member_start = 1
+                elif len(self.leading_text) < 200:
+                    self.leading_text += ch
+                continue
+
+            self._buffer.append(ch)
+            if self._quote:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == self._quote:
+                    self._quote = None
+            elif ch in "\"'":
+                self._quote = ch
+            elif ch in CLOSERS:
+                self._stack.append(CLOSERS[ch])
+            elif ch in "}]":
+                if len(self._stack) == 1:
+                    members.update(self._close_member())
+                self._stack.pop()
+                if not self._stack:
+                    self.done = True
+            elif ch == "," and len(self._stack) == 1:
+                members.update(self._close_member())
+        return members
+
+    def _close_member(self):
+        segment = "".join(self._buffer[self._member_start:-1])
+        self._member_start = len(self._buffer)
+        if self.opener != "{" or not segment.strip():
+            return {}
+        try:
+            value, _ = repair_json("{" + segment + "}")
+        except ValueError:
+            return {}
+        return value if isinstance(value, dict) else {}
+
+    @property
+    def started(self):
+        return bool(self._buffer)
+
+    def result(self):
+        """(value, repairs) for what has been fed so far; raises ValueError if nothing usable"""
+        if not self._buffer:
+            raise ValueError("No JSON found")
+        value, repairs = repair_json("".join(self._buffer))
+        if self.trailing_text or self.leading_text.replace("`", "").replace("json", "").strip():
+            repairs.append("surrounding_text")
+        elif self.trailing_fence or self.leading_text.strip():
+            repairs.append("code_fence")
+        return value, repairs
+
+
+def extract_json(text, opener="{"):
+    """(value, repairs) for the first JSON object (or array) in text"""
+    try:
+        # Well-formed answers skip the character scan
+        value = json.loads(text)
+        if isinstance(value, dict if opener == "{" else list):
+            return value, []
+    except ValueError:
+        pass
+    extractor = JSONExtractor(opener)
+    extractor.feed(text)
+    return extractor.result()
+
+
+def validate_analysis(data, fallback=None):
+    """(analysis, repairs) for a parsed object; missing fields come from fallback when one is given"""
+    if not isinstance(data, dict):
+        raise ValueError("Analysis is not a JSON object")
+    present = {}
+    for field, aliases in FIELD_ALIASES.items():
+        for alias in aliases:
+            if data.get(alias) is not None:
+                present[field] = data[alias]
+                break
+    if not present:
+        raise ValueError("No analysis fields")
+
+    repairs = []
+    values = dict(present)
+    missing = [field for field in ANALYSIS_FIELDS if field not in present]
+    if missing:
+        if fallback is None:
+            raise ValueError(f"Missing fields: {', '.join(missing)}")
+        repairs.append("missing_fields")
+        values.update({field: fallback[field] for field in missing})
+
+    analysis = InteractionAnalysis.model_validate(values).model_dump()
+    if any(analysis[field] != value for field, value in present.items()):
+        repairs.append("schema_coercion")
+    return analysis, repairs
+
+
+class ExtractionStats:
+    """How often LLM analysis output parsed cleanly, needed repairs, or was thrown away"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.clean = 0
+        self.repaired = 0
+        self.fallbacks = 0
+        self.repairs = Counter()
+
+    def record(self, repairs=None, fallback=False):
+        with self._lock:
+            if fallback:
+                self.fallbacks += 1
+            elif repairs:
+                self.repaired += 1
+                self.repairs.update(repairs)
+            else:
+                self.clean += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "clean": self.clean,
+                "repaired": self.repaired,
+                "fallbacks": self.fallbacks,
+                "repairs": dict(self.repairs),
+            }
+
+
+extraction_stats = ExtractionStats()
+
+
+def extract_analysis(text, fallback):
+    """Analysis dict from LLM output, repaired where possible; `fallback` when nothing is usable"""
+    try:
+        data, repairs = extract_json(text or "")
+        analysis, schema_repairs = validate_analysis(data, fallback)
+    except ValueError:
+        extraction_stats.record(fallback=True)
+        return dict(fallback)
+    extraction_stats.record(repairs + schema_repairs)
+    return analysis
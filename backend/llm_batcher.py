@@ -0,0 +1,194 @@
+"""Multi-prompt batching for interaction analysis.
+
+Notes from concurrent callers that arrive within BATCH_COALESCE_WINDOW are
+packed into one prompt, up to BATCH_PROMPT_MAX_ITEMS notes and
+BATCH_PROMPT_TOKEN_BUDGET tokens including the expected output. The model
+answers with a JSON array of analyses tagged with each note's id, and the
+array is split back to the callers. Only the items whose analysis is
+missing or malformed are queued again, so one bad element does not cost
+the whole batch a retry.
+"""
+import asyncio
+import json
+import os
+from json_extractor import extract_json, validate_analysis
+from prompt_registry import prompts, count_tokens, PROMPT_NOTES_TOKEN_BUDGET
+
+BATCH_COALESCE_WINDOW = float(os.getenv("BATCH_COALESCE_WINDOW", "0.05"))
+BATCH_PROMPT_MAX_ITEMS = int(os.getenv("BATCH_PROMPT_MAX_ITEMS", "10"))
+BATCH_PROMPT_TOKEN_BUDGET = int(os.getenv("BATCH_PROMPT_TOKEN_BUDGET", "6000"))
+BATCH_MAX_ATTEMPTS = int(os.getenv("BATCH_MAX_ATTEMPTS", "2"))
+
+# Rough answer size of one analysis object, used to size max_tokens and the budget
+OUTPUT_TOKENS_PER_ITEM = 120
+
+# Each note ("input") is cut to its budget when it is queued, not when the prompt is rendered
+BATCH_PROMPT = prompts.register("analyze_interaction_batch", 2, """
+    Analyze each healthcare professional interaction below. Each line is one
+    interaction as JSON with an "id", the "hcp" and the rep's "input" notes.
+    {items}
+    Return a JSON array only, with one object per interaction, in any order:
+    [{{"id": <id of the interaction>, "summary": "brief summary", "sentiment": "positive/neutral/negative", "specialty": "medical specialty", "next_action": "suggested action", "priority": "high/medium/low", "topics": ["topic1", "topic2"]}}]
+    """, budgets={"input": PROMPT_NOTES_TOKEN_BUDGET}, answer_tokens=OUTPUT_TOKENS_PER_ITEM * BATCH_PROMPT_MAX_ITEMS)
+
+
+def item_line(item_id, note, hcp_name):
+    return json.dumps({"id": item_id, "hcp": hcp_name, "input": note}, ensure_ascii=False)
+
+
+def build_batch_prompt(items):
+    """Prompt for a list of (note, hcp_name); ids are positions in the list"""
+    lines = "\n".join(item_line(i, note, hcp_name) for i, (note, hcp_name) in enumerate(items))
+    return BATCH_PROMPT.render(items=lines)
+
+
+PROMPT_OVERHEAD_TOKENS = BATCH_PROMPT.static_tokens
+
+
+def parse_batch_response(text):
+    """Map item id -> analysis dict from the model's JSON array.
+
+    The array is repaired like a single analysis (a truncated answer keeps
+    its complete elements). When it cannot be, every well-formed object in
+    the text is still recovered on its own.
+    """
+    try:
+        objects, _ = extract_json(text, opener="[")
+    except ValueError:
+        decoder = json.JSONDecoder()
+        objects = []
+        position = text.find("{")
+        while position != -1:
+            try:
+                obj, end = decoder.raw_decode(text, position)
+                objects.append(obj)
+                position = text.find("{", end)
+            except ValueError:
+                position = text.find("{", position + 1)
+
+    results = {}
+    for obj in objects if isinstance(objects, list) else []:
+        if isinstance(obj, dict) and isinstance(obj.get("id"), int):
+            results[obj["id"]] = obj
+    return results
+
+
+def validated(obj):
+    """The item's analysis normalised by the shared schema, or None if any field is missing"""
+    try:
+        analysis, _ = validate_analysis(obj)
+    except ValueError:
+        return None
+    return analysis
+
+
+class _BatchItem:
+    __slots__ = ("note", "hcp_name", "future", "attempts", "tokens")
+
+    def __init__(self, note, hcp_name, future):
+        self.note = BATCH_PROMPT.fit("input", note)
+        self.hcp_name = hcp_name
+        self.future = future
+        self.attempts = 0
+        self.tokens = count_tokens(item_line(0, self.note, hcp_name)) + OUTPUT_TOKENS_PER_ITEM
+
+
+class AnalysisBatcher:
+    """Coalesces concurrent analyze() calls into multi-note LLM requests.
+
+    `complete(prompt, max_tokens)` is an async callable returning the model's
+    text, or None when the upstream is unavailable. analyze() resolves to the
+    analysis dict, or None when the note could not be analysed, in which case
+    the caller applies its own fallback.
+    """
+
+    def __init__(self, complete, max_items=BATCH_PROMPT_MAX_ITEMS, token_budget=BATCH_PROMPT_TOKEN_BUDGET,
+                 window=BATCH_COALESCE_WINDOW, max_attempts=BATCH_MAX_ATTEMPTS):
+        self.complete = complete
+        self.max_items = max_items
+        self.token_budget = token_budget
+        self.window = window
+        self.max_attempts = max_attempts
+        self._pending = []
+        self._pending_tokens = 0
+        self._timer = None
+        self._tasks = set()
+        self.upstream_calls = 0
+        self.items_analysed = 0
+        self.items_resubmitted = 0
+        self.items_failed = 0
+
+    async def analyze(self, note, hcp_name):
+        future = asyncio.get_running_loop().create_future()
+        self._enqueue(_BatchItem(note, hcp_name, future))
+        return await future
+
+    def _enqueue(self, item):
+        self._pending.append(item)
+        self._pending_tokens += item.tokens
+        if len(self._pending) >= self.max_items or PROMPT_OVERHEAD_TOKENS + self._pending_tokens >= self.token_budget:
+            self._dispatch()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.window, self._dispatch)
+
+    def _dispatch(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        items = [item for item in self._pending if not item.future.done()]
+        self._pending, self._pending_tokens = [], 0
+        for batch in self._pack(items):
+            task = asyncio.get_running_loop().create_task(self._run_batch(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    def _pack(self, items):
+        """Greedy split into batches within the item and token limits; an oversized note goes alone"""
+        batch, tokens = [], PROMPT_OVERHEAD_TOKENS
+        for item in items:
+            if batch and (len(batch) >= self.max_items or tokens + item.tokens > self.token_budget):
+                yield batch
+                batch, tokens = [], PROMPT_OVERHEAD_TOKENS
+            batch.append(item)
+            tokens += item.tokens
+        if batch:
+            yield batch
+
+    async def _run_batch(self, batch):
+        self.upstream_calls += 1
+        try:
+            text = await self.complete(
+                build_batch_prompt([(item.note, item.hcp_name) for item in batch]),
+                OUTPUT_TOKENS_PER_ITEM * len(batch)
+            )
+            parsed = parse_batch_response(text) if text else {}
+        except Exception as e:
+            print(f"Batch analysis error: {e}")
+            text, parsed = None, {}
+
+        for item_id, item in enumerate(batch):
+            if item.future.done():
+                continue
+            analysis = validated(parsed.get(item_id))
+            if analysis is not None:
+                self.items_analysed += 1
+                item.future.set_result(analysis)
+            elif text is not None and item.attempts + 1 < self.max_attempts:
+                # The upstream answered but this element was unusable: only it goes round again
+                item.attempts += 1
+                self.items_resubmitted += 1
+                self._enqueue(item)
+            else:
+                self.items_failed += 1
+                item.future.set_result(None)
+
+    def stats(self):
+        return {
+            "upstream_calls": self.upstream_calls,
+            "items_analysed": self.items_analysed,
+            "items_resubmitted": self.items_resubmitted,
+            "items_failed": self.items_failed,
+            "pending": len(self._pending),
+            "max_items": self.max_items,
+            "token_budget": self.token_budget,
+        }
@@ -0,0 +1,224 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# Response cache configuration
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "2048"))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "3600"))
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "")  # empty disables the SQLite tier
+LLM_CACHE_MAX_DISK_ENTRIES = int(os.getenv("LLM_CACHE_MAX_DISK_ENTRIES", "100000"))
+
+
+def normalize_input(value):
+    """Canonical form of prompt inputs so cosmetic differences hash the same"""
+    if isinstance(value, str):
+        return " ".join(unicodedata.normalize("NFC", value).split())
+    if isinstance(value, dict):
+        return {k: normalize_input(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [normalize_input(v) for v in value]
+    return value
+
+
+class ResponseCache:
+    """Content-addressed LLM response cache.
+
+    An in-memory LRU tier with TTL sits in front of an optional SQLite tier
+    that survives restarts. Entries found only on disk are promoted back
+    into memory. The memory tier is consulted on the event loop. Disk reads
+    run in a worker thread on their own connection, which under WAL never
+    waits for a writer; every disk write is made by one background thread,
+    so a slow or locked file never stalls a request.
+    """
+
+    def __init__(self, max_entries=LLM_CACHE_MAX_ENTRIES, ttl=LLM_CACHE_TTL,
+                 sqlite_path=LLM_CACHE_PATH, max_disk_entries=LLM_CACHE_MAX_DISK_ENTRIES):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_disk_entries = max_disk_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None  # the writer thread's connection
+        self._readers = threading.local()
+        self._writer = None
+        self._disk_writes = 0
+        self._disk_entries = 0  # rows in the file as far as this process knows; resynced when pruning
+        self.counters = {
+            "hits": 0,
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "sets": 0,
+        }
+        self.sqlite_path = sqlite_path
+        if sqlite_path:
+            self._open_disk()
+
+    def _connect(self):
+        db = sqlite3.connect(self.sqlite_path, timeout=10.0, check_same_thread=False, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        # A cache can lose its last writes on power failure; it cannot be corrupted by it under WAL
+        db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    def _open_disk(self):
+        self._db = self._connect()
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS ix_llm_cache_expires ON llm_cache (expires_at)")
+        self._disk_entries = self._db.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+        self._readers = threading.local()
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="llm-cache-writer")
+
+    def _reader(self):
+        db = getattr(self._readers, "db", None)
+        if db is None:
+            db = self._readers.db = self._connect()
+        return db
+
+    def after_fork(self):
+        """Worker processes forked by serve.py share the file but each needs its own connections and writer"""
+        self._lock = threading.Lock()
+        if self.sqlite_path:
+            self._open_disk()
+
+    @staticmethod
+    def make_key(model, template_version, temperature, inputs):
+        """Hash of (model, prompt template version, temperature, normalized input)"""
+        material = json.dumps(
+            [model, template_version, round(float(temperature), 4), normalize_input(inputs)],
+            sort_keys=True, ensure_ascii=False, separators=(",", ":")
+        )
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    async def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.counters["hits"] += 1
+                    self.counters["memory_hits"] += 1
+                    return value
+                del self._entries[key]
+                self.counters["expirations"] += 1
+
+        if self._db is not None:
+            row = await asyncio.to_thread(self._read_disk, key)
+            if row is not None:
+                if row[1] > now:
+                    with self._lock:
+                        self._store_memory(key, row[0], row[1])
+                        self.counters["hits"] += 1
+                        self.counters["disk_hits"] += 1
+                    return row[0]
+                self._writer.submit(self._write_disk, "DELETE FROM llm_cache WHERE key = ? AND expires_at <= ?",
+                                    (key, now))
+                with self._lock:
+                    self.counters["expirations"] += 1
+
+        with self._lock:
+            self.counters["misses"] += 1
+        return None
+
+    async def set(self, key, value, ttl=None):
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._store_memory(key, value, expires_at)
+            self.counters["sets"] += 1
+        if self._db is not None:
+            # Written back in order by the writer thread; the caller does not wait for the disk
+            self._writer.submit(self._write_disk, "INSERT OR REPLACE INTO llm_cache (key, value, expires_at) "
+                                "VALUES (?, ?, ?)", (key, value, expires_at), key)
+
+    def _read_disk(self, key):
+        return self._reader().execute("SELECT value, expires_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+
+    def _write_disk(self, sql, params, new_key=None):
+        """Run one write on the writer thread; an insert of `new_key` counts a row unless it replaced one"""
+        try:
+            # Take the write lock up front: a statement that waited on another worker's write
+            # would otherwise fail at once on its now-stale WAL snapshot
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                existed = new_key is not None and self._db.execute(
+                    "SELECT 1 FROM llm_cache WHERE key = ?", (new_key,)).fetchone() is not None
+                changed = self._db.execute(sql, params).rowcount
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        except sqlite3.Error as e:
+            print(f"LLM cache write failed: {e}")
+            return
+        if new_key is None:
+            self._disk_entries -= changed
+            return
+        self._disk_entries += not existed
+        self._disk_writes += 1
+        if self._disk_writes % 1000 == 0:
+            try:
+                self._prune_disk()
+            except sqlite3.Error as e:
+                print(f"LLM cache prune failed: {e}")
+
+    def _store_memory(self, key, value, expires_at):
+        self._entries[key] = (value, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.counters["evictions"] += 1
+
+    def _prune_disk(self):
+        # Single statements in autocommit mode; a locked file only postpones the prune to the next 1000 writes
+        self._disk_entries -= self._db.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (time.time(),)).rowcount
+        if self._disk_entries <= self.max_disk_entries:
+            return
+        # Other workers write the same file, so count before evicting rather than trusting this process's tally
+        self._disk_entries = self._db.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+        overflow = self._disk_entries - self.max_disk_entries
+        if overflow > 0:
+            self._db.execute(
+                "DELETE FROM llm_cache WHERE key IN "
+                "(SELECT key FROM llm_cache ORDER BY expires_at LIMIT ?)", (overflow,)
+            )
+            self._disk_entries -= overflow
+            with self._lock:
+                self.counters["evictions"] += overflow
+
+    def flush(self):
+        """Block until every queued disk write has been made"""
+        if self._writer is not None:
+            self._writer.submit(lambda: None).result()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self._db is not None:
+            self._writer.submit(self._write_disk, "DELETE FROM llm_cache", ()).result()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.counters["hits"] + self.counters["misses"]
+            stats = dict(self.counters)
+            stats["hit_rate"] = round(self.counters["hits"] / lookups, 4) if lookups else 0.0
+            stats["memory_entries"] = len(self._entries)
+            stats["max_entries"] = self.max_entries
+            stats["ttl_seconds"] = self.ttl
+            stats["disk_enabled"] = self._db is not None
+            if self._db is not None:
+                stats["disk_entries"] = max(self._disk_entries, 0)
+            return stats
@@ -0,0 +1,313 @@
+import asyncio
+import hashlib
+import json
+import os
+import random
+import time
+import httpx
+from rate_limiter import RateLimiter, RateLimitTimeout, INTERACTIVE
+from metrics import LLM_REQUEST_SECONDS, LLM_TOKENS
+
+# Groq API configuration
+GROQ_URL = os.getenv("GROQ_URL", "https://api.groq.com/openai/v1/chat/completions")
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "32"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+LLM_MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE", "32"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "0.5"))
+LLM_SINGLE_FLIGHT = os.getenv("LLM_SINGLE_FLIGHT", "true").lower() in ("1", "true", "yes")
+
+# Throttling and transient upstream errors are retried; other errors are final
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+def estimate_tokens(text):
+    """Cheap token estimate (about four characters per token)"""
+    return len(text) // 4 + 1
+
+
+def record_usage(usage, template):
+    LLM_TOKENS.inc(usage.get("prompt_tokens", 0), "prompt", template)
+    LLM_TOKENS.inc(usage.get("completion_tokens", 0), "completion", template)
+
+
+def retry_delay(attempt, base=LLM_RETRY_BASE_DELAY):
+    """Full-jitter exponential backoff, so retrying callers do not arrive together"""
+    return random.uniform(0, base * 2 ** attempt)
+
+
+class LLMError(Exception):
+    """Raised when an upstream LLM call fails, times out or returns an error status"""
+
+    def __init__(self, message, status_code=None, replied=None):
+        super().__init__(message)
+        self.status_code = status_code
+        # Whether the upstream answered; a local rate-limit timeout carries a 429 without it
+        self.replied = status_code is not None if replied is None else replied
+
+
+class LLMClient:
+    """Async chat-completions client with pooled keep-alive connections.
+
+    One instance is shared by every request handled by the worker. The
+    rate limiter admits calls by priority within the request/token budgets,
+    the semaphore bounds how many are in flight at once, and each call has
+    its own deadline covering the queue waits, retries and the HTTP
+    round-trips.
+
+    Identical completions requested while one is already in flight share
+    its upstream call (single-flight), so a burst of the same prompt costs
+    one request however many callers ask.
+    """
+
+    def __init__(self, api_key, base_url=GROQ_URL, max_concurrency=LLM_MAX_CONCURRENCY,
+                 timeout=LLM_TIMEOUT, max_connections=LLM_MAX_CONNECTIONS,
+                 max_keepalive=LLM_MAX_KEEPALIVE, rate_limiter=None, max_retries=LLM_MAX_RETRIES,
+                 single_flight=LLM_SINGLE_FLIGHT):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.models_url = base_url.rsplit("/chat/completions", 1)[0] + "/models"
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.max_keepalive = max_keepalive
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.max_retries = max_retries
+        self.single_flight = single_flight
+        self.retries = 0
+        self.upstream_requests = 0
+        self.coalesced = 0
+        self._flights = {}
+        self._client = None
+        self._semaphore = None
+
+    def _get_client(self):
+        # Created lazily so the pool and semaphore bind to the running event loop
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                headers={
+                    "Authorization": f"Bearer {self.api_key}",
+                    "Content-Type": "application/json"
+                },
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_keepalive
+                ),
+                timeout=httpx.Timeout(self.timeout, connect=LLM_CONNECT_TIMEOUT)
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._client
+
+    @property
+    def in_flight(self):
+        if self._semaphore is None:
+            return 0
+        return self.max_concurrency - self._semaphore._value
+
+    async def _admit(self, payload, priority):
+        """Wait for rate-limit budget; returns the tokens reserved for the call"""
+        reserved = estimate_tokens(payload["messages"][-1]["content"]) + payload["max_tokens"]
+        try:
+            await self.rate_limiter.acquire(reserved, priority)
+        except RateLimitTimeout as e:
+            raise LLMError(str(e), 429, replied=False)
+        return reserved
+
+    async def _post(self, payload, priority, template):
+        client = self._get_client()
+        for attempt in range(self.max_retries + 1):
+            reserved = await self._admit(payload, priority)
+            # A refused, failed or abandoned attempt used none of the tokens reserved for it
+            used = 0
+            try:
+                async with self._semaphore:
+                    self.upstream_requests += 1
+                    start = time.perf_counter()
+                    try:
+                        response = await client.post(self.base_url, json=payload)
+                    except httpx.HTTPError as e:
+                        LLM_REQUEST_SECONDS.observe(time.perf_counter() - start, "error")
+                        # Connection failures and timeouts are retried like a 5xx
+                        if attempt == self.max_retries:
+                            raise LLMError(f"{type(e).__name__}: {e}")
+                        response = None
+                if response is not None:
+                    LLM_REQUEST_SECONDS.observe(time.perf_counter() - start, str(response.status_code))
+                    await self.rate_limiter.observe(response.status_code, response.headers)
+                    if response.status_code == 200:
+                        result = response.json()
+                        usage = result.get("usage", {})
+                        record_usage(usage, template)
+                        used = usage.get("total_tokens")
+                        return result["choices"][0]["message"]["content"]
+                    if response.status_code not in RETRYABLE_STATUS or attempt == self.max_retries:
+                        raise LLMError(f"{response.status_code} - {response.text}", response.status_code)
+            finally:
+                await self.rate_limiter.settle(reserved, used)
+            self.retries += 1
+            await asyncio.sleep(retry_delay(attempt))
+
+    async def complete(self, prompt, model="gemma2-9b-it", temperature=0.1, max_tokens=500, timeout=None,
+                       priority=INTERACTIVE, template="other"):
+        """Send a single-turn chat completion and return the message content.
+
+        `template` names the prompt template the tokens are recorded under.
+        """
+        payload = {
+            "model": model,
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": temperature,
+            "max_tokens": max_tokens
+        }
+        deadline = timeout if timeout is not None else self.timeout
+        if not self.single_flight:
+            try:
+                return await asyncio.wait_for(self._post(payload, priority, template), deadline)
+            except asyncio.TimeoutError:
+                raise LLMError(f"Deadline of {deadline}s exceeded")
+
+        key = hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+        flight = self._flights.get(key)
+        if flight is None:
+            # The first caller's deadline and priority apply to the shared call
+            flight = asyncio.ensure_future(self._deadline_post(payload, priority, deadline, template))
+            self._flights[key] = flight
+            flight.add_done_callback(lambda done: self._land(key, done))
+        else:
+            self.coalesced += 1
+        # Shielded: a caller that disconnects leaves the call running for everyone else
+        return await asyncio.shield(flight)
+
+    async def _deadline_post(self, payload, priority, deadline, template):
+        try:
+            return await asyncio.wait_for(self._post(payload, priority, template), deadline)
+        except asyncio.TimeoutError:
+            raise LLMError(f"Deadline of {deadline}s exceeded")
+
+    def _land(self, key, flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        # Mark the outcome retrieved even if every caller went away before it arrived
+        if not flight.cancelled():
+            flight.exception()
+
+    async def stream(self, prompt, model="gemma2-9b-it", temperature=0.1, max_tokens=500, timeout=None,
+                     priority=INTERACTIVE, template="other"):
+        """Stream a chat completion, yielding content deltas as the upstream produces them.
+
+        The deadline bounds the whole stream, not just the first byte; the
+        concurrency slot is held until the stream finishes or is abandoned.
+        Throttled or failed attempts are retried only before any content has
+        been yielded.
+        """
+        payload = {
+            "model": model,
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "stream": True
+        }
+        deadline = timeout if timeout is not None else self.timeout
+        expires_at = time.monotonic() + deadline
+        client = self._get_client()
+
+        for attempt in range(self.max_retries + 1):
+            reserved = None
+            try:
+                reserved = await asyncio.wait_for(self._admit(payload, priority),
+                                                  max(expires_at - time.monotonic(), 0))
+                await asyncio.wait_for(self._semaphore.acquire(), max(expires_at - time.monotonic(), 0))
+            except BaseException as e:
+                if reserved is not None:
+                    # Admitted but never sent
+                    await self.rate_limiter.settle(reserved, 0)
+                if isinstance(e, asyncio.TimeoutError):
+                    raise LLMError(f"Deadline of {deadline}s exceeded")
+                raise
+            retry = False
+            yielded = False
+            # Tokens spent so far: none until the upstream accepts the request, then an estimate
+            # of the prompt and of what it has streamed, until it reports the real total
+            used = 0
+            reported = False
+            status = "error"
+            start = time.perf_counter()
+            self.upstream_requests += 1
+            try:
+                async with client.stream("POST", self.base_url, json=payload) as response:
+                    status = str(response.status_code)
+                    await self.rate_limiter.observe(response.status_code, response.headers)
+                    if response.status_code != 200:
+                        body = (await response.aread()).decode(errors="replace")
+                        if response.status_code in RETRYABLE_STATUS and attempt < self.max_retries:
+                            retry = True
+                        else:
+                            raise LLMError(f"{response.status_code} - {body}", response.status_code)
+                    else:
+                        used = estimate_tokens(prompt)
+                        async for line in response.aiter_lines():
+                            if time.monotonic() > expires_at:
+                                raise LLMError(f"Deadline of {deadline}s exceeded")
+                            if not line.startswith("data:"):
+                                continue
+                            data = line[len("data:"):].strip()
+                            if data == "[DONE]":
+                                break
+                            chunk = json.loads(data)
+                            # Groq reports usage on the last chunk, under x_groq
+                            usage = chunk.get("usage") or chunk.get("x_groq", {}).get("usage")
+                            if usage:
+                                record_usage(usage, template)
+                                if usage.get("total_tokens") is not None:
+                                    used = usage["total_tokens"]
+                                    reported = True
+                            if not chunk.get("choices"):
+                                continue
+                            delta = chunk["choices"][0].get("delta", {}).get("content")
+                            if delta:
+                                if not reported:
+                                    used += estimate_tokens(delta)
+                                yielded = True
+                                yield delta
+            except httpx.HTTPError as e:
+                # Connection failures are retried like a 5xx until content has reached the caller
+                if yielded or attempt == self.max_retries:
+                    raise LLMError(f"{type(e).__name__}: {e}")
+                retry = True
+            finally:
+                self._semaphore.release()
+                # Streams are timed to their last chunk
+                LLM_REQUEST_SECONDS.observe(time.perf_counter() - start, status)
+                # Also when the stream fails midway or the caller abandons it
+                await self.rate_limiter.settle(reserved, used)
+            if not retry:
+                return
+            self.retries += 1
+            await asyncio.sleep(min(retry_delay(attempt), max(expires_at - time.monotonic(), 0)))
+
+    def stats(self):
+        return {
+            "in_flight": self.in_flight,
+            "shared_flights": len(self._flights),
+            "upstream_requests": self.upstream_requests,
+            "coalesced_calls": self.coalesced,
+            "retries": self.retries,
+            "single_flight": self.single_flight,
+        }
+
+    async def ping(self, timeout=5.0):
+        """Cheap availability probe against the model-list endpoint (no tokens spent)"""
+        client = self._get_client()
+        try:
+            response = await client.get(self.models_url, timeout=timeout)
+        except httpx.HTTPError as e:
+            raise LLMError(f"{type(e).__name__}: {e}")
+        if response.status_code != 200:
+            raise LLMError(f"{response.status_code} - {response.text}", response.status_code)
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
@@ -0,0 +1,260 @@
+"""Prometheus-style metrics with per-thread recording.
+
+Counters and histograms write into a dict owned by the calling thread, so
+the hot path takes no lock and never contends with other threads (the
+event loop, threadpool DB work, the write-behind executor). /metrics sums
+every thread's values when it is scraped. Gauges are read from callbacks
+at scrape time, so existing stats objects cost nothing between scrapes.
+"""
+import bisect
+import threading
+import time
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(names, values, extra=""):
+    pairs = [f'{name}="{escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class Registry:
+    """Holds metric definitions and every thread's recorded values"""
+
+    def __init__(self):
+        self._metrics = []
+        self._shards = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def after_fork(self):
+        """Start a forked worker from zero rather than repeating what the parent recorded"""
+        self._shards = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def shard(self):
+        """This thread's values: metric -> {label values: value}"""
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = {}
+            with self._lock:
+                self._shards.append(shard)
+            self._local.shard = shard
+            return shard
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(self, name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(self, name, documentation, labelnames, buckets))
+
+    def gauge(self, name, documentation, callback, labelnames=(), kind="gauge"):
+        """Value read at scrape time: `callback()` returns a number, or {label values: number}.
+
+        kind="counter" exposes a running total some other object already keeps.
+        """
+        return self._register(Gauge(name, documentation, callback, labelnames, kind))
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def merged(self, metric):
+        """Sum of every thread's values for one metric"""
+        with self._lock:
+            shards = list(self._shards)
+        totals = {}
+        for shard in shards:
+            # dict.copy is atomic under the GIL, so a thread recording right now cannot break iteration
+            for labels, value in shard.get(metric, {}).copy().items():
+                metric.merge(totals, labels, value)
+        return totals
+
+    def exposition(self):
+        """All metrics in the Prometheus text format"""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples(self))
+        return "\n".join(lines) + "\n"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, registry, name, documentation, labelnames):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def inc(self, amount=1, *labels):
+        values = self.registry.shard().setdefault(self, {})
+        values[labels] = values.get(labels, 0) + amount
+
+    def merge(self, totals, labels, value):
+        totals[labels] = totals.get(labels, 0) + value
+
+    def samples(self, registry):
+        for labels, value in sorted(registry.merged(self).items()):
+            yield f"{self.name}{format_labels(self.labelnames, labels)} {format_value(value)}"
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, registry, name, documentation, labelnames, buckets):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *labels):
+        values = self.registry.shard().setdefault(self, {})
+        state = values.get(labels)
+        if state is None:
+            # Per-bucket counts (not cumulative) followed by sum and count
+            state = values[labels] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+        state[bisect.bisect_left(self.buckets, value)] += 1
+        state[-2] += value
+        state[-1] += 1
+
+    def time(self, *labels):
+        return _Timer(self, labels)
+
+    def merge(self, totals, labels, value):
+        total = totals.get(labels)
+        if total is None:
+            totals[labels] = list(value)
+        else:
+            for i, item in enumerate(value):
+                total[i] += item
+
+    def samples(self, registry):
+        for labels, state in sorted(registry.merged(self).items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), state):
+                cumulative += count
+                le = 'le="' + format_value(float(bound)) + '"'
+                yield f"{self.name}_bucket{format_labels(self.labelnames, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{format_labels(self.labelnames, labels)} {format_value(state[-2])}"
+            yield f"{self.name}_count{format_labels(self.labelnames, labels)} {state[-1]}"
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "start")
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labels)
+
+
+class Gauge:
+    def __init__(self, name, documentation, callback, labelnames, kind):
+        self.kind = kind
+        self.name = name
+        self.documentation = documentation
+        self.callback = callback
+        self.labelnames = tuple(labelnames)
+
+    def samples(self, registry):
+        try:
+            value = self.callback()
+        except Exception as e:
+            print(f"Metrics gauge {self.name} failed: {e}")
+            return
+        if not self.labelnames:
+            value = {(): value}
+        for labels, number in sorted(value.items()):
+            yield f"{self.name}{format_labels(self.labelnames, labels)} {format_value(float(number))}"
+
+
+class PrometheusMiddleware:
+    """Pure ASGI middleware timing every HTTP request by method, route template and status.
+
+    Latency runs until the last body chunk is sent, so streamed responses are
+    timed to completion. Routes are labelled by template (/hcps/{hcp_name}/history),
+    never by raw path, to keep label cardinality bounded.
+    """
+
+    def __init__(self, app, histogram):
+        self.app = app
+        self.histogram = histogram
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            self.histogram.observe(time.perf_counter() - start, scope["method"], path, str(status[0]))
+
+
+def instrument_engine(engine, histogram):
+    """Time every SQL statement an engine runs, labelled by its verb (SELECT, INSERT, ...)"""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before(conn, cursor, statement, parameters, context, executemany):
+        context._metrics_start = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after(conn, cursor, statement, parameters, context, executemany):
+        verb = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+        histogram.observe(time.perf_counter() - context._metrics_start, verb)
+
+
+# The application's metric catalogue
+registry = Registry()
+
+HTTP_REQUEST_SECONDS = registry.histogram(
+    "crm_http_request_duration_seconds", "HTTP request latency by route template", ("method", "path", "status"))
+CHAT_INTENT_SECONDS = registry.histogram(
+    "crm_chat_intent_duration_seconds", "Time spent handling a /chat message by intent branch", ("intent",))
+LLM_REQUEST_SECONDS = registry.histogram(
+    "crm_llm_request_duration_seconds", "Upstream LLM HTTP round-trip latency by status code", ("status",))
+LLM_TOKENS = registry.counter(
+    "crm_llm_tokens_total", "Tokens reported by the upstream LLM by prompt template", ("kind", "template"))
+AGENT_NODE_SECONDS = registry.histogram(
+    "crm_agent_node_duration_seconds", "Agent graph node wall time by node", ("node",))
+LLM_FALLBACKS = registry.counter(
+    "crm_llm_fallbacks_total", "Answers served from the fallback path instead of the LLM", ("reason",))
+DB_QUERY_SECONDS = registry.histogram(
+    "crm_db_query_duration_seconds", "SQL statement latency by statement verb", ("verb",))
@@ -1,10 +1,15 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, Float, Boolean
+from sqlalchemy import Column, Integer, String, DateTime, Text, Float, Boolean, Index, ForeignKey
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, func, inspect, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, StaticPool
+from sqlalchemy.schema import CreateIndex
 from datetime import datetime
 import os
 from dotenv import load_dotenv
+from metrics import instrument_engine, DB_QUERY_SECONDS
 
 # Load environment variables
 load_dotenv()
@@ -16,6 +21,7 @@ class HCPInteraction(Base):
     
     id = Column(Integer, primary_key=True, index=True)
     hcp_name = Column(String(255), nullable=False)
+    hcp_profile_id = Column(Integer, ForeignKey("hcp_profiles.id"))  # resolved at write time, see hcp_resolver
     hcp_specialty = Column(String(100))
     interaction_type = Column(String(50))  # visit, call, email, etc.
     interaction_date = Column(DateTime, default=datetime.utcnow)
@@ -25,14 +31,28 @@ class HCPInteraction(Base):
     sentiment = Column(String(20))  # positive, neutral, negative
     next_action = Column(String(255))
     priority_level = Column(String(20))  # high, medium, low
+    territory = Column(String(50))  # sales territory
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    __table_args__ = (
+        # Per-HCP history and sentiment timelines, newest first
+        Index("ix_hcp_interactions_hcp_date", "hcp_name", "interaction_date"),
+        Index("ix_hcp_interactions_sentiment_date", "sentiment", "interaction_date"),
+        Index("ix_hcp_interactions_profile_date", "hcp_profile_id", "interaction_date"),
+    )
+
+# Trend rollups: a window of days is counted from this index alone, in day order.
+# interaction_date is repeated at the end so SQLite treats the index as covering.
+Index("ix_hcp_interactions_day_rollup", func.date(HCPInteraction.interaction_date), HCPInteraction.territory,
+      HCPInteraction.hcp_specialty, HCPInteraction.sentiment, HCPInteraction.interaction_type,
+      HCPInteraction.priority_level, HCPInteraction.interaction_date)
+
 class HCPProfile(Base):
     __tablename__ = "hcp_profiles"
     
     id = Column(Integer, primary_key=True, index=True)
-    name = Column(String(255), nullable=False)
+    name = Column(String(255), nullable=False, unique=True, index=True)
     specialty = Column(String(100))
     hospital_clinic = Column(String(255))
     email = Column(String(255))
@@ -41,16 +61,142 @@ class HCPProfile(Base):
     last_interaction_date = Column(DateTime)
     total_interactions = Column(Integer, default=0)
     relationship_strength = Column(Float, default=0.0)  # 0-10 scale
+    strength_score = Column(Float)  # relationship_strength before clamping, which the rollups accumulate
     created_at = Column(DateTime, default=datetime.utcnow)
 
 # Database setup
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./crm_database.db")
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {})
+# Async driver URL; derived from DATABASE_URL (aiosqlite / asyncpg) when unset
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", "")
+
+# Connection pool, per engine and per worker process
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # seconds; -1 never recycles
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+# Compiled-SQL cache entries per engine, and asyncpg prepared statements per connection
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "500"))
+
+# SQLite: WAL lets readers run alongside the write-behind writer instead of queueing behind it
+SQLITE_PRAGMAS = (
+    ("journal_mode", "WAL"),
+    ("synchronous", "NORMAL"),
+    ("busy_timeout", os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+    ("cache_size", "-" + os.getenv("SQLITE_CACHE_KB", "65536")),
+    ("temp_store", "MEMORY"),
+    ("foreign_keys", "ON"),
+)
+
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg", "mysql": "mysql+aiomysql"}
+
+
+def async_url(url):
+    """The async-driver form of a database URL (sqlite -> aiosqlite, postgresql -> asyncpg, mysql -> aiomysql)"""
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend in ASYNC_DRIVERS and url.drivername != ASYNC_DRIVERS[backend]:
+        url = url.set(drivername=ASYNC_DRIVERS[backend])
+    if url.drivername == "postgresql+asyncpg" and "prepared_statement_cache_size" not in url.query:
+        url = url.update_query_dict({"prepared_statement_cache_size": str(DB_STATEMENT_CACHE_SIZE)})
+    return url
+
+
+def engine_options(url, async_driver=False):
+    """Pool and cache settings for create_engine / create_async_engine"""
+    url = make_url(url)
+    options = {"query_cache_size": DB_STATEMENT_CACHE_SIZE}
+    pre_ping = DB_POOL_PRE_PING
+    if url.get_backend_name() == "sqlite":
+        options["connect_args"] = {"check_same_thread": False}
+        if not url.database or url.database == ":memory:":
+            # One shared in-memory database; a pool of separate connections would each see an empty one
+            options["poolclass"] = StaticPool
+            return options
+        if async_driver:
+            # aiosqlite would otherwise default to NullPool: a new connection and thread per session
+            options["poolclass"] = AsyncAdaptedQueuePool
+        # A local file cannot drop the connection; pinging would only add a round trip per checkout
+        pre_ping = False
+    options.update(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT,
+                   pool_recycle=DB_POOL_RECYCLE, pool_pre_ping=pre_ping)
+    return options
+
+
+def configure_engine(engine):
+    """Pragmas for SQLite connections and query timing"""
+    sync_engine = getattr(engine, "sync_engine", engine)
+    if sync_engine.dialect.name == "sqlite":
+        @event.listens_for(sync_engine, "connect")
+        def set_sqlite_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for name, value in SQLITE_PRAGMAS:
+                cursor.execute(f"PRAGMA {name}={value}")
+            cursor.close()
+    instrument_engine(sync_engine, DB_QUERY_SECONDS)
+
+
+# Blocking engine for the write-behind writer and scripts; run it in a thread from async code
+engine = create_engine(DATABASE_URL, **engine_options(DATABASE_URL))
+configure_engine(engine)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Async engine for request handlers
+async_engine = create_async_engine(async_url(ASYNC_DATABASE_URL or DATABASE_URL),
+                                   **engine_options(ASYNC_DATABASE_URL or DATABASE_URL, async_driver=True))
+configure_engine(async_engine)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+
+def after_fork():
+    """Pooled connections opened before serve.py forks its workers belong to the parent; children open their own"""
+    engine.dispose(close=False)
+    async_engine.sync_engine.dispose(close=False)
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+async def get_async_db():
+    """FastAPI dependency: one AsyncSession per request"""
+    async with AsyncSessionLocal() as session:
+        yield session
+
+def add_missing_columns(bind=engine):
+    """ALTER TABLE ... ADD COLUMN for nullable model columns that an existing table lacks"""
+    existing_tables = inspect(bind).get_table_names()
+    with bind.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            present = {column["name"] for column in inspect(conn).get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in present and column.nullable:
+                    column_type = column.type.compile(dialect=conn.dialect)
+                    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+                    print(f"Added column {table.name}.{column.name}")
+
+def merge_duplicate_profile_names(bind=engine):
+    """Merge hcp_profiles rows that share a name, which the unique name index would otherwise refuse"""
+    with bind.connect() as conn:
+        duplicated = conn.execute(text(
+            "SELECT name FROM hcp_profiles GROUP BY name HAVING COUNT(*) > 1 LIMIT 1")).first()
+    if duplicated is None:
+        return 0
+    from hcp_resolver import dedup_profiles  # imports this module
+    print("HCP profiles with identical names found; merging them before adding the unique name index")
+    return dedup_profiles(sessionmaker(bind=bind), same_name_only=True)
+
+def init_db(bind=engine):
+    """Create missing tables, columns and indexes"""
+    Base.metadata.create_all(bind=bind)
+    add_missing_columns(bind)
+    merge_duplicate_profile_names(bind)
+    # IF NOT EXISTS rather than checkfirst: reflection does not report expression indexes
+    with bind.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                conn.execute(CreateIndex(index, if_not_exists=True))
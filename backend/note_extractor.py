@@ -0,0 +1,456 @@
+"""Local, CPU-only extraction of the HCP, sentiment, specialty, priority and topics of a chat note.
+
+HCP names are matched against a gazetteer of HCPProfile names: a token
+trie walked once over the message, so the cost does not grow with the
+number of profiles. A name not in the gazetteer is taken from a title
+("Dr.", "Doctor") followed by a word. Matching is case-sensitive where it
+matters, so "with the" no longer becomes "Dr. The".
+
+Sentiment is a weighted lexicon with negation ("not interested") and
+contrast ("skeptical ... but open") handling. Specialty, priority and
+topic terms share one phrase trie, found in the same kind of single pass. Every field
+comes with a confidence; analyze_interaction answers from the local
+analysis when sentiment, specialty, priority and summary all reach
+LOCAL_ANALYSIS_MIN_CONFIDENCE, and calls the LLM otherwise (set it above
+1 to always call the LLM). A field the note gives no evidence for (no
+sentiment or urgency words, several sentences to summarise) stays below
+the threshold.
+"""
+import os
+import re
+import threading
+from collections import Counter
+from sqlalchemy import select
+from models import HCPProfile, SessionLocal
+
+LOCAL_ANALYSIS_MIN_CONFIDENCE = float(os.getenv("LOCAL_ANALYSIS_MIN_CONFIDENCE", "0.8"))
+# New HCPProfile rows are added to the gazetteer this often (seconds)
+NOTE_GAZETTEER_REFRESH_SECONDS = float(os.getenv("NOTE_GAZETTEER_REFRESH_SECONDS", "60"))
+
+UNKNOWN_HCP = "Dr. Unknown"
+DEFAULT_SPECIALTY = "General Medicine"
+DEFAULT_TOPICS = ["discussion"]
+SUMMARY_MAX_CHARS = 160
+# Confidence of a field the note gives no evidence for: below the threshold, so the LLM is asked
+NO_EVIDENCE_CONFIDENCE = 0.6
+
+TOKEN_PATTERN = re.compile(r"[A-Za-z0-9]+(?:['’\-][A-Za-z0-9]+)*|[.,;:!?]")
+CLAUSE_BREAKS = frozenset(".,;:!?")
+# A sentence ends at . ! or ? followed by space, but not after a title ("Dr. Smith")
+SENTENCE_END = re.compile(r"(?<![Dd][Rr]\.)(?<!Prof\.)(?<=[.!?])\s+")
+POSSESSIVE = re.compile(r"['’]s$")
+TITLES = frozenset({"dr", "doctor", "prof", "professor"})
+# Words that follow "Dr." or "with" but are not names
+NOT_NAMES = frozenset({
+    "the", "a", "an", "and", "or", "about", "on", "at", "in", "for", "to", "from", "my", "our", "his", "her",
+    "their", "this", "that", "today", "yesterday", "tomorrow", "office", "clinic", "team", "staff", "nurse",
+    "unknown", "him", "them", "me", "us", "regarding", "re", "who", "whom", "new", "some", "all",
+})
+
+# word -> weight; positive words push towards positive, negative towards negative
+SENTIMENT_LEXICON = {
+    "good": 1.0, "great": 1.5, "excellent": 2.0, "positive": 1.5, "interested": 1.0, "interest": 0.5,
+    "enthusiastic": 1.5, "impressed": 1.5, "keen": 1.0, "receptive": 1.0, "pleased": 1.0, "happy": 1.0,
+    "agreed": 1.0, "agrees": 1.0, "supportive": 1.0, "open": 0.5, "likes": 1.0, "liked": 1.0, "love": 1.5,
+    "loved": 1.5, "willing": 1.0, "eager": 1.5, "favorable": 1.5, "favourable": 1.5, "appreciated": 1.0,
+    "appreciative": 1.0, "improved": 1.0, "committed": 1.0, "excited": 1.5, "satisfied": 1.0, "productive": 1.0,
+    "helpful": 1.0, "thanked": 1.0, "welcomed": 1.0, "prescribe": 0.5, "switching": 0.5,
+    "concerned": -1.0, "concerns": -1.0, "concern": -1.0, "skeptical": -1.5, "sceptical": -1.5,
+    "negative": -1.5, "unhappy": -1.5, "frustrated": -1.5, "complained": -1.5, "complaint": -1.5,
+    "refused": -2.0, "declined": -1.5, "rejected": -2.0, "worried": -1.0, "bad": -1.0, "poor": -1.0,
+    "issue": -0.5, "issues": -0.5, "problem": -1.0, "problems": -1.0, "dissatisfied": -2.0, "annoyed": -1.5,
+    "cancelled": -1.0, "canceled": -1.0, "hesitant": -1.0, "reluctant": -1.0, "angry": -2.0,
+    "disappointed": -1.5, "doubts": -1.0, "doubtful": -1.0, "unconvinced": -1.5, "dismissive": -1.5,
+    "rude": -1.5, "upset": -1.5, "critical": -1.0, "delays": -0.5, "expensive": -0.5, "unwilling": -1.5,
+}
+NEGATORS = frozenset({"not", "no", "never", "didn't", "didnt", "don't", "dont", "doesn't", "doesnt", "isn't",
+                      "wasn't", "won't", "hardly", "without", "nor", "neither", "lacks", "lacked"})
+NEGATION_SCOPE = 3  # words after a negator whose polarity flips
+CONTRASTS = frozenset({"but", "however", "although", "though", "yet"})
+
+SPECIALTY_TERMS = {
+    "Cardiology": ["cardiac", "cardiology", "cardiologist", "heart", "hypertension", "blood pressure", "statin",
+                   "statins", "cholesterol", "arrhythmia", "atrial fibrillation", "cardiovascular",
+                   "anticoagulant", "anticoagulation", "angina"],
+    "Oncology": ["oncology", "oncologist", "cancer", "tumor", "tumour", "chemotherapy", "chemo",
+                 "immunotherapy", "metastatic", "lymphoma", "leukemia", "leukaemia", "carcinoma"],
+    "Neurology": ["neurology", "neurologist", "migraine", "migraines", "epilepsy", "seizure", "seizures",
+                  "parkinson's", "alzheimer's", "multiple sclerosis", "stroke", "dementia", "neuropathy"],
+    "Endocrinology": ["endocrinology", "endocrinologist", "diabetes", "diabetic", "insulin", "thyroid", "glucose",
+                      "a1c", "hba1c", "obesity", "metformin"],
+    "Pediatrics": ["pediatric", "pediatrics", "paediatric", "pediatrician", "children", "infant", "infants",
+                   "adolescent", "adolescents"],
+    "Dermatology": ["dermatology", "dermatologist", "psoriasis", "eczema", "acne", "skin", "rash", "dermatitis"],
+    "Rheumatology": ["rheumatology", "rheumatologist", "arthritis", "rheumatoid", "lupus", "gout"],
+    "Pulmonology": ["pulmonology", "pulmonologist", "asthma", "copd", "inhaler", "inhalers", "respiratory"],
+    "Psychiatry": ["psychiatry", "psychiatrist", "depression", "anxiety", "antidepressant", "schizophrenia",
+                   "bipolar"],
+}
+PRIORITY_TERMS = {
+    "high": ["urgent", "urgently", "asap", "as soon as possible", "immediately", "right away", "adverse event",
+             "escalate", "escalated", "serious", "critical", "high priority", "top priority", "time-sensitive"],
+    "low": ["no rush", "not urgent", "low priority", "next quarter", "next year", "eventually",
+            "when convenient", "whenever", "someday", "no hurry", "at some point"],
+}
+TOPIC_TERMS = {
+    "dosing": ["dose", "doses", "dosing", "dosage", "titration", "dose adjustment"],
+    "efficacy": ["efficacy", "effectiveness", "effective", "phase iii results", "outcomes"],
+    "side effects": ["side effect", "side effects", "nausea", "tolerability", "adverse event", "adverse events"],
+    "safety": ["safety", "safety data", "qt prolongation", "drug interactions", "interactions"],
+    "clinical trial": ["clinical trial", "trial", "trials", "study", "studies", "phase iii"],
+    "pricing": ["price", "pricing", "cost", "costs", "copay", "co-pay", "discount"],
+    "insurance coverage": ["insurance", "coverage", "prior authorization", "reimbursement"],
+    "formulary access": ["formulary"],
+    "samples": ["sample", "samples"],
+    "adherence": ["adherence", "compliance", "once-daily"],
+    "patient education": ["patient education", "leaflets", "brochure", "brochures"],
+    "competitor": ["competitor", "competitors", "competing", "alternative"],
+}
+# First matching rule wins: (topics or sentiment that trigger it, action)
+NEXT_ACTION_RULES = [
+    ({"side effects", "safety"}, "Follow up on safety questions with medical information"),
+    ({"samples"}, "Deliver requested product samples"),
+    ({"negative"}, "Schedule a call to address concerns"),
+    ({"clinical trial", "efficacy"}, "Share the latest clinical data"),
+    ({"pricing", "insurance coverage", "formulary access"}, "Send pricing and access information"),
+]
+DEFAULT_NEXT_ACTION = "Schedule follow-up meeting"
+
+
+def tokenize(text):
+    """Word and clause-punctuation tokens as (text, lowercase) pairs"""
+    return [(token, token.lower().replace("’", "'")) for token in TOKEN_PATTERN.findall(text)]
+
+
+def name_key(name):
+    """Lowercase tokens of a name without its title: "Dr. Sarah Lee" -> ("sarah", "lee")"""
+    words = [lower for _, lower in tokenize(name) if lower not in CLAUSE_BREAKS]
+    while words and words[0] in TITLES:
+        words = words[1:]
+    return tuple(words)
+
+
+def build_term_trie(tables):
+    """Token trie over every term of {kind: {label: [phrases]}}; a node's END lists its (kind, label) pairs"""
+    root = {}
+    for kind, terms in tables.items():
+        for label, phrases in terms.items():
+            for phrase in phrases:
+                node = root
+                for _, lower in tokenize(phrase):
+                    node = node.setdefault(lower, {})
+                node.setdefault(NameGazetteer.END, []).append((kind, label))
+    return root
+
+
+def find_terms(lowered, trie):
+    """{kind: [labels in order of appearance]}; longest phrase first, so "not urgent" hides "urgent" """
+    found = {}
+    position = 0
+    while position < len(lowered):
+        node, end, hits = trie.get(lowered[position]), position + 1, None
+        cursor = position + 1
+        while node is not None:
+            if NameGazetteer.END in node:
+                end, hits = cursor, node[NameGazetteer.END]
+            if cursor == len(lowered):
+                break
+            node = node.get(lowered[cursor])
+            cursor += 1
+        for kind, label in hits or ():
+            found.setdefault(kind, []).append(label)
+        position = end
+    return found
+
+
+def titled(tokens, position):
+    """Whether the word at position follows a title ("Dr", "Dr.", "Doctor")"""
+    position -= 1
+    if position >= 0 and tokens[position][1] == ".":
+        position -= 1
+    return position >= 0 and tokens[position][1] in TITLES
+
+
+class NameGazetteer:
+    """Token trie of known HCP names, with their specialties"""
+
+    # Trie keys for the names ending at a node; neither can be a token
+    END = ""
+    ALIAS = " "
+
+    def __init__(self):
+        self._root = {}
+        self._specialty = {}
+        self.last_id = 0
+
+    def __len__(self):
+        return len(self._specialty)
+
+    def add(self, name, specialty=None):
+        key = name_key(name)
+        if not key:
+            return
+        self._specialty[name] = specialty or self._specialty.get(name)
+        self._insert(key, name, self.END)
+        if len(key) > 1:
+            # Surname alone: "Dr. Lee" finds "Dr. Sarah Lee", unless a "Dr. Lee" exists
+            self._insert(key[-1:], name, self.ALIAS)
+
+    def _insert(self, key, name, kind):
+        node = self._root
+        for word in key:
+            node = node.setdefault(word, {})
+        node.setdefault(kind, set()).add(name)
+
+    def specialty_of(self, name):
+        return self._specialty.get(name)
+
+    def match(self, tokens):
+        """Best (name, confidence) among known names in the tokens, or None.
+
+        A name after a title is near certain; an untitled one must be
+        capitalised, and a surname shared by several profiles is ambiguous.
+        """
+        best = None
+        lowered = [lower for _, lower in tokens]
+        for start in range(len(tokens)):
+            node = self._root.get(lowered[start])
+            if node is None:
+                continue
+            end, names, position = None, None, start + 1
+            while True:
+                if self.END in node or self.ALIAS in node:
+                    end, names = position, node.get(self.END) or node[self.ALIAS]
+                if position == len(tokens) or lowered[position] not in node:
+                    break
+                node = node[lowered[position]]
+                position += 1
+            if names is None:
+                continue
+            if titled(tokens, start):
+                confidence = 0.98
+            elif tokens[start][0][0].isupper():
+                confidence = 0.9 if end - start > 1 else 0.8
+            elif end - start > 1:
+                confidence = 0.7
+            else:
+                continue
+            if len(names) > 1:
+                confidence *= 0.5
+            if best is None or (confidence, end - start) > (best[1], best[2]):
+                best = (min(names), confidence, end - start)
+        return best[:2] if best else None
+
+    def load(self, session_factory=SessionLocal, batch_size=10000):
+        """Add HCPProfile rows created since the last load; returns names added"""
+        added = 0
+        while True:
+            with session_factory() as session:
+                rows = session.execute(
+                    select(HCPProfile.id, HCPProfile.name, HCPProfile.specialty)
+                    .where(HCPProfile.id > self.last_id)
+                    .order_by(HCPProfile.id)
+                    .limit(batch_size)
+                ).all()
+            for profile_id, name, specialty in rows:
+                self.add(name, specialty)
+                self.last_id = profile_id
+            added += len(rows)
+            if len(rows) < batch_size:
+                return added
+
+
+TERM_TRIE = build_term_trie({"specialty": SPECIALTY_TERMS, "priority": PRIORITY_TERMS, "topic": TOPIC_TERMS})
+
+
+def extract_unlisted_name(tokens):
+    """(name, confidence) for an HCP missing from the gazetteer, from "Dr. X" or "with X" """
+    for position, (word, lower) in enumerate(tokens):
+        if lower in CLAUSE_BREAKS or lower in NOT_NAMES or not word[0].isalpha() or not titled(tokens, position):
+            continue
+        word = POSSESSIVE.sub("", word)
+        if word[0].isupper():
+            return f"Dr. {word}", 0.85
+        return f"Dr. {word[0].upper()}{word[1:]}", 0.6
+    for position in range(1, len(tokens)):
+        word, lower = tokens[position]
+        if tokens[position - 1][1] == "with" and word[0].isupper() and lower not in NOT_NAMES \
+                and lower not in TITLES:
+            return f"Dr. {word}", 0.5
+    return UNKNOWN_HCP, 0.0
+
+
+def score_sentiment(tokens):
+    """(label, confidence) from the sentiment lexicon, with negation and contrast"""
+    positive = negative = 0.0
+    negated = 0
+    for _, lower in tokens:
+        if lower in CLAUSE_BREAKS:
+            negated = 0
+            continue
+        if lower in CONTRASTS:
+            # What follows a contrast usually carries the speaker's conclusion
+            positive, negative, negated = positive / 2, negative / 2, 0
+            continue
+        if lower in NEGATORS:
+            negated = NEGATION_SCOPE
+            continue
+        weight = SENTIMENT_LEXICON.get(lower)
+        if weight:
+            if negated:
+                # "not interested" is negative; "no concerns" is only mildly positive
+                weight = -weight if weight > 0 else -weight / 2
+            if weight > 0:
+                positive += weight
+            else:
+                negative -= weight
+        negated = max(negated - 1, 0)
+
+    total = positive + negative
+    if not total:
+        # No sentiment words is not evidence of neutrality
+        return "neutral", NO_EVIDENCE_CONFIDENCE
+    margin = (positive - negative) / total
+    if abs(margin) < 0.34:
+        return "neutral", 0.5
+    return ("positive" if margin > 0 else "negative"), min(1.0, abs(margin) * (0.7 + 0.15 * total))
+
+
+def classify_specialty(terms, profile_specialty=None):
+    """(specialty, confidence): the specialty terms used, else the HCP's profile specialty.
+
+    A profile specialty the note's terms contradict gives way to the note,
+    at a confidence that sends the note to the LLM to settle it. The
+    placeholder DEFAULT_SPECIALTY on a profile counts as unknown.
+    """
+    counts = Counter(terms.get("specialty", ())).most_common()
+    if profile_specialty and profile_specialty != DEFAULT_SPECIALTY:
+        if not counts or counts[0][0] == profile_specialty:
+            return profile_specialty, 0.95
+        return counts[0][0], NO_EVIDENCE_CONFIDENCE
+    if not counts:
+        return DEFAULT_SPECIALTY, 0.4
+    if len(counts) > 1:
+        return counts[0][0], 0.6 if counts[0][1] > counts[1][1] else 0.4
+    return counts[0][0], 0.85 if counts[0][1] == 1 else 0.95
+
+
+def classify_priority(terms):
+    """(priority, confidence) from urgency terms; notes with none are medium"""
+    levels = set(terms.get("priority", ()))
+    if len(levels) > 1:
+        return "medium", 0.5
+    if levels:
+        return levels.pop(), 0.9
+    return "medium", NO_EVIDENCE_CONFIDENCE
+
+
+def extract_topics(terms, limit=5):
+    topics = list(dict.fromkeys(terms.get("topic", ())))[:limit]
+    return topics or list(DEFAULT_TOPICS)
+
+
+def next_action(topics, sentiment):
+    signals = set(topics) | {sentiment}
+    for triggers, action in NEXT_ACTION_RULES:
+        if triggers & signals:
+            return action
+    return DEFAULT_NEXT_ACTION
+
+
+def summarize(text):
+    """(summary, confidence): the first sentence of the note, cut at a word boundary.
+
+    Only a one-sentence note is summarised by its first sentence; anything
+    longer, or cut, needs the LLM's summary.
+    """
+    sentences = SENTENCE_END.split(" ".join(text.split()), maxsplit=1)
+    sentence = sentences[0]
+    if len(sentence) > SUMMARY_MAX_CHARS:
+        return sentence[:SUMMARY_MAX_CHARS].rsplit(" ", 1)[0] + "...", 0.5
+    return sentence, 0.9 if len(sentences) == 1 else 0.5
+
+
+class NoteExtractor:
+    """Local note analysis with per-field confidence, backed by a gazetteer of known HCPs"""
+
+    def __init__(self, gazetteer=None, min_confidence=LOCAL_ANALYSIS_MIN_CONFIDENCE,
+                 refresh_seconds=NOTE_GAZETTEER_REFRESH_SECONDS):
+        self.gazetteer = gazetteer or NameGazetteer()
+        self.min_confidence = min_confidence
+        self.refresh_seconds = refresh_seconds
+        self.local = 0
+        self.llm = 0
+        self.low_confidence = Counter()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def extract_name(self, text):
+        """(hcp_name, confidence): a known profile name when one is mentioned, else "Dr. <word after title>" """
+        tokens = tokenize(text)
+        return self.gazetteer.match(tokens) or extract_unlisted_name(tokens)
+
+    def analyze(self, text, hcp_name):
+        """(analysis, confidences): the six analysis fields, and the confidence of the classified ones"""
+        tokens = tokenize(text)
+        terms = find_terms([lower for _, lower in tokens], TERM_TRIE)
+        sentiment, sentiment_confidence = score_sentiment(tokens)
+        specialty, specialty_confidence = classify_specialty(terms, self.gazetteer.specialty_of(hcp_name))
+        priority, priority_confidence = classify_priority(terms)
+        summary, summary_confidence = summarize(text)
+        topics = extract_topics(terms)
+        analysis = {
+            "summary": summary,
+            "sentiment": sentiment,
+            "specialty": specialty,
+            "next_action": next_action(topics, sentiment),
+            "priority": priority,
+            "topics": topics,
+        }
+        confidences = {"sentiment": sentiment_confidence, "specialty": specialty_confidence,
+                       "priority": priority_confidence, "summary": summary_confidence}
+        return analysis, confidences
+
+    def confident(self, confidences):
+        """Whether the local analysis can stand without an LLM call; counted for stats()"""
+        low = [field for field, confidence in confidences.items() if confidence < self.min_confidence]
+        if low:
+            self.llm += 1
+            self.low_confidence.update(low)
+            return False
+        self.local += 1
+        return True
+
+    def _refresh_loop(self):
+        while True:
+            try:
+                self.gazetteer.load()
+            except Exception as e:
+                print(f"Gazetteer refresh error: {e}")
+            if self._stopping.wait(self.refresh_seconds):
+                return
+
+    def start(self):
+        """Load HCP profiles now and pick up new ones every refresh_seconds in a background thread"""
+        if self._thread is None:
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._refresh_loop, name="note-gazetteer", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def stats(self):
+        analysed = self.local + self.llm
+        return {
+            "known_hcps": len(self.gazetteer),
+            "analysed": analysed,
+            "answered_locally": self.local,
+            "sent_to_llm": self.llm,
+            "local_ratio": round(self.local / analysed, 3) if analysed else 0.0,
+            "low_confidence_fields": dict(self.low_confidence),
+            "min_confidence": self.min_confidence,
+        }
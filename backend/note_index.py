@@ -0,0 +1,457 @@
+"""Local semantic retrieval over interaction notes, used to ground suggestions.
+
+Every stored interaction (raw notes plus AI summary) becomes one row of a
+float32 matrix kept in a memory-mapped file, so millions of notes are
+searched with one vectorised dot product and no separate vector database.
+Vectors are hashed: unigrams and bigrams are hashed into NOTE_INDEX_DIM
+signed buckets with sublinear term frequency and the row is L2-normalised.
+Document frequencies are counted per hash bucket and IDF is applied on the
+query side only (squared, as it would otherwise weight both sides), so
+rows never need re-weighting as the corpus grows.
+
+The index is append-only and catches up from hcp_interactions by id, so it
+sees rows from every write path. Each catch-up looks back NOTE_INDEX_OVERLAP_IDS
+ids below the highest indexed one and adds any it does not hold: on
+PostgreSQL a row can commit after rows with higher ids, and would otherwise
+be skipped for good. Appends take a file lock, which keeps serve.py's worker
+processes from writing the same rows twice. The row count is the length of
+the ids file, written last, so readers never see a partially appended row.
+HCP names merged by `python hcp_resolver.py dedup` are re-keyed in place.
+Rebuild by deleting NOTE_INDEX_PATH and running: python note_index.py refresh
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from functools import lru_cache
+import numpy as np
+from sqlalchemy import func, select
+from models import HCPInteraction, SessionLocal, AsyncSessionLocal
+from search_service import STOPWORDS
+from llm_client import estimate_tokens
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Outside the source tree by default; empty disables retrieval
+NOTE_INDEX_PATH = os.path.expanduser(os.getenv("NOTE_INDEX_PATH", "~/.cache/crm/note_index"))
+NOTE_INDEX_DIM = int(os.getenv("NOTE_INDEX_DIM", "256"))
+NOTE_INDEX_BATCH_SIZE = int(os.getenv("NOTE_INDEX_BATCH_SIZE", "5000"))
+# Rows a request may index before searching; a larger backlog is left to the startup catch-up
+NOTE_INDEX_REFRESH_ROWS = int(os.getenv("NOTE_INDEX_REFRESH_ROWS", "2000"))
+# How far below the highest indexed id a catch-up looks for rows that committed late
+NOTE_INDEX_OVERLAP_IDS = int(os.getenv("NOTE_INDEX_OVERLAP_IDS", "1000"))
+NOTE_CONTEXT_K = int(os.getenv("NOTE_CONTEXT_K", "5"))
+NOTE_CONTEXT_TOKEN_BUDGET = int(os.getenv("NOTE_CONTEXT_TOKEN_BUDGET", "400"))
+NOTE_CONTEXT_MAX_CHARS = 300
+
+# Document-frequency buckets; far more than the vector's dimensions so IDF is rarely shared by unrelated terms
+HASH_BUCKETS = 1 << 20
+# Rows scored per matrix product when searching the whole index, which bounds temporary memory
+SCAN_CHUNK_ROWS = 1 << 18
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+CONTEXT_COLUMNS = (HCPInteraction.id, HCPInteraction.interaction_date, HCPInteraction.ai_summary,
+                   HCPInteraction.sentiment, HCPInteraction.raw_notes)
+
+
+def lock_file(f):
+    """Block until this process holds an exclusive lock on the open file"""
+    if fcntl is not None:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        return
+    # msvcrt locks a byte range from the current position and gives up after ten seconds
+    f.seek(0)
+    while True:
+        try:
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            return
+        except OSError:
+            pass
+
+
+def unlock_file(f):
+    if fcntl is not None:
+        fcntl.flock(f, fcntl.LOCK_UN)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+@lru_cache(maxsize=1 << 18)
+def feature_hash(feature):
+    return int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), "little")
+
+
+def hcp_key(hcp_name):
+    return feature_hash("hcp:" + " ".join((hcp_name or "").lower().split()))
+
+
+def note_features(text, ignore=()):
+    """Unigrams and bigrams of the note with stopwords removed, with counts"""
+    words = [word for word in TOKEN_RE.findall((text or "").lower()) if word not in STOPWORDS and word not in ignore]
+    return Counter(words + [a + " " + b for a, b in zip(words, words[1:])])
+
+
+def note_text(raw_notes, ai_summary):
+    return " ".join(part for part in (raw_notes, ai_summary) if part)
+
+
+class NoteIndex:
+    """Append-only memory-mapped matrix of note vectors with interaction ids and HCP keys"""
+
+    def __init__(self, path=NOTE_INDEX_PATH, dim=NOTE_INDEX_DIM, overlap_ids=NOTE_INDEX_OVERLAP_IDS):
+        self.path = path
+        self.overlap_ids = overlap_ids
+        os.makedirs(path, exist_ok=True)
+        meta_path = os.path.join(path, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                self.dim = json.load(f)["dim"]
+        else:
+            self.dim = dim
+            with open(meta_path, "w") as f:
+                json.dump({"dim": dim, "hash_buckets": HASH_BUCKETS}, f)
+        self._files = {name: os.path.join(path, name) for name in ("vectors.f32", "ids.i64", "hcps.u64", "df.i32")}
+        if not os.path.exists(self._files["df.i32"]):
+            with open(self._files["df.i32"], "wb") as f:
+                f.truncate(HASH_BUCKETS * 4)
+        self._lock = threading.Lock()
+        self._mapped = -1
+        self._max_id = 0
+        self._vectors = self._ids = self._hcps = None
+        self._df = np.memmap(self._files["df.i32"], dtype=np.int32, mode="r", shape=(HASH_BUCKETS,))
+        self._stopping = threading.Event()
+        self._thread = None
+        self.searches = 0
+        self.rows_added = 0
+
+    def __len__(self):
+        return os.path.getsize(self._files["ids.i64"]) // 8 if os.path.exists(self._files["ids.i64"]) else 0
+
+    def _view(self):
+        """Current (vectors, ids, hcps) maps, remapped when other writers have appended"""
+        with self._lock:
+            count = len(self)
+            if count != self._mapped:
+                if count:
+                    self._vectors = np.memmap(self._files["vectors.f32"], dtype=np.float32, mode="r",
+                                              shape=(count, self.dim))
+                    self._ids = np.memmap(self._files["ids.i64"], dtype=np.int64, mode="r", shape=(count,))
+                    self._hcps = np.memmap(self._files["hcps.u64"], dtype=np.uint64, mode="r", shape=(count,))
+                    # Late rows are appended out of id order, so the highest id is not always the last
+                    if 0 < self._mapped < count:
+                        self._max_id = max(self._max_id, int(self._ids[self._mapped:].max()))
+                    else:
+                        self._max_id = int(self._ids.max())
+                else:
+                    self._vectors = np.zeros((0, self.dim), dtype=np.float32)
+                    self._ids = np.zeros(0, dtype=np.int64)
+                    self._hcps = np.zeros(0, dtype=np.uint64)
+                    self._max_id = 0
+                self._mapped = count
+            return self._vectors, self._ids, self._hcps
+
+    @contextmanager
+    def _append_lock(self):
+        with open(os.path.join(self.path, "append.lock"), "w") as lock:
+            lock_file(lock)
+            try:
+                yield
+            finally:
+                unlock_file(lock)
+
+    def last_id(self):
+        """Highest indexed interaction id"""
+        self._view()
+        return self._max_id
+
+    def indexed_since(self, floor):
+        """Set of indexed interaction ids above `floor`, which must be at most overlap_ids below last_id().
+
+        Every row is appended at most overlap_ids below the highest id at the
+        time, so any row above such a floor is among the last
+        2 * overlap_ids + 1 rows and only those are scanned.
+        """
+        ids = self._view()[1][-(2 * self.overlap_ids + 1):]
+        return set(ids[ids > floor].tolist())
+
+    def _hashed(self, counters):
+        """Row number, vector dimension, signed sublinear tf and DF bucket of every feature"""
+        lengths = [len(counts) for counts in counters]
+        total = sum(lengths)
+        hashes = np.fromiter((feature_hash(feature) for counts in counters for feature in counts),
+                             dtype=np.uint64, count=total)
+        tf = 1.0 + np.log(np.fromiter((n for counts in counters for n in counts.values()),
+                                      dtype=np.float64, count=total))
+        signs = np.where((hashes >> np.uint64(40)) & np.uint64(1), 1.0, -1.0)
+        rows = np.repeat(np.arange(len(counters)), lengths)
+        dims = ((hashes >> np.uint64(20)) % np.uint64(self.dim)).astype(np.int64)
+        buckets = (hashes % np.uint64(HASH_BUCKETS)).astype(np.int64)
+        return rows, dims, tf * signs, buckets
+
+    def embed(self, texts):
+        """Normalised hashed term-frequency vectors, plus the DF bucket of every distinct term per text"""
+        rows, dims, values, buckets = self._hashed([note_features(text) for text in texts])
+        matrix = np.bincount(rows * self.dim + dims, weights=values,
+                             minlength=len(texts) * self.dim).reshape(len(texts), self.dim).astype(np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        np.divide(matrix, norms, out=matrix, where=norms > 0)
+        # A term counts once per document even if two of its features share a bucket
+        return matrix, np.unique(rows * HASH_BUCKETS + buckets) % HASH_BUCKETS
+
+    def embed_query(self, text, ignore=()):
+        """Query vector with IDF squared from the current document frequencies; None if nothing to match"""
+        counts = note_features(text, ignore)
+        if not counts:
+            return None
+        _, dims, values, buckets = self._hashed([counts])
+        documents = max(len(self), 1)
+        df = self._df[buckets]
+        # A term no stored note contains can only match through hash collisions
+        idf = np.where(df > 0, np.log((1.0 + documents) / (1.0 + df)) + 1.0, 0.0)
+        vector = np.bincount(dims, weights=values * idf * idf, minlength=self.dim).astype(np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else None
+
+    def add(self, notes):
+        """Append (interaction_id, hcp_name, text) rows not already indexed; returns rows added"""
+        if not notes:
+            return 0
+        with self._append_lock():
+            count = len(self)
+            # Rows further below the highest id than overlap_ids would break indexed_since's bound
+            floor = max(self.last_id() - self.overlap_ids, 0)
+            indexed = self.indexed_since(floor)
+            notes = [note for note in notes if note[0] > floor and note[0] not in indexed]
+            if not notes:
+                return 0
+            vectors, buckets = self.embed([note[2] for note in notes])
+            # Drop the tail of an append that died before its ids were written
+            for name, width in (("vectors.f32", 4 * self.dim), ("hcps.u64", 8)):
+                if os.path.exists(self._files[name]) and os.path.getsize(self._files[name]) != count * width:
+                    os.truncate(self._files[name], count * width)
+            with open(self._files["vectors.f32"], "ab") as f:
+                f.write(vectors.tobytes())
+            with open(self._files["hcps.u64"], "ab") as f:
+                f.write(np.array([hcp_key(note[1]) for note in notes], dtype=np.uint64).tobytes())
+            df = np.memmap(self._files["df.i32"], dtype=np.int32, mode="r+", shape=(HASH_BUCKETS,))
+            np.add.at(df, buckets, 1)
+            df.flush()
+            del df
+            # The ids file defines the row count, so it goes last
+            with open(self._files["ids.i64"], "ab") as f:
+                f.write(np.array([note[0] for note in notes], dtype=np.int64).tobytes())
+        self.rows_added += len(notes)
+        return len(notes)
+
+    def refresh(self, session_factory=SessionLocal, batch_size=NOTE_INDEX_BATCH_SIZE, max_rows=None):
+        """Index interactions stored since the last indexed id, and late ones below it; returns rows added"""
+        added = self._fill_gaps(session_factory)
+        while not self._stopping.is_set() and (max_rows is None or added < max_rows):
+            limit = batch_size if max_rows is None else min(batch_size, max_rows - added)
+            with session_factory() as session:
+                rows = session.execute(
+                    select(HCPInteraction.id, HCPInteraction.hcp_name, HCPInteraction.raw_notes,
+                           HCPInteraction.ai_summary)
+                    .where(HCPInteraction.id > self.last_id())
+                    .order_by(HCPInteraction.id)
+                    .limit(limit)
+                ).all()
+            if not rows:
+                break
+            added += self.add([(row.id, row.hcp_name, note_text(row.raw_notes, row.ai_summary)) for row in rows])
+            if len(rows) < limit:
+                break
+        return added
+
+    def _fill_gaps(self, session_factory):
+        """Index rows up to overlap_ids below the highest indexed id that committed after it was indexed.
+
+        A count over the window is compared with the ids held first; the
+        window's ids are only listed when the two differ.
+        """
+        last = self.last_id()
+        floor = max(last - self.overlap_ids, 0)
+        indexed = self.indexed_since(floor)
+        window = (HCPInteraction.id > floor, HCPInteraction.id <= last)
+        with session_factory() as session:
+            stored = session.scalar(select(func.count()).select_from(HCPInteraction).where(*window))
+            if stored == len(indexed):
+                return 0
+            missing = [interaction_id for interaction_id in session.scalars(select(HCPInteraction.id).where(*window))
+                       if interaction_id not in indexed]
+            rows = session.execute(
+                select(HCPInteraction.id, HCPInteraction.hcp_name, HCPInteraction.raw_notes,
+                       HCPInteraction.ai_summary)
+                .where(HCPInteraction.id.in_(missing))
+                .order_by(HCPInteraction.id)
+            ).all() if missing else []
+        return self.add([(row.id, row.hcp_name, note_text(row.raw_notes, row.ai_summary)) for row in rows])
+
+    def rekey(self, renames):
+        """Move notes of renamed HCPs ({old name: new name}) to the new name; returns rows changed"""
+        if not renames or not len(self):
+            return 0
+        old = np.array([hcp_key(name) for name in renames], dtype=np.uint64)
+        new = np.array([hcp_key(name) for name in renames.values()], dtype=np.uint64)
+        order = np.argsort(old)
+        old, new = old[order], new[order]
+        with self._append_lock():
+            hcps = np.memmap(self._files["hcps.u64"], dtype=np.uint64, mode="r+", shape=(len(self),))
+            positions = np.minimum(np.searchsorted(old, hcps), len(old) - 1)
+            rows = np.flatnonzero(old[positions] == hcps)
+            hcps[rows] = new[positions[rows]]
+            hcps.flush()
+            del hcps
+        return len(rows)
+
+    def _catch_up(self):
+        try:
+            added = self.refresh()
+            if added:
+                print(f"Note index caught up: {added} interactions indexed")
+        except Exception as e:
+            print(f"Note index refresh error: {e}")
+
+    def start(self):
+        """Index everything stored since the last run in a background thread"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._catch_up, name="note-index", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Make a running refresh return after its current batch"""
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def search(self, query, hcp_name=None, k=NOTE_CONTEXT_K):
+        """Top-k (interaction_id, score) by cosine similarity, optionally within one HCP's notes.
+
+        Within one HCP the name's own words are ignored, since every note mentions them. When nothing
+        in the query matches, the HCP's most recent notes are returned with score 0.
+        """
+        self.searches += 1
+        vectors, ids, hcps = self._view()
+        if hcp_name:
+            rows = np.flatnonzero(hcps == np.uint64(hcp_key(hcp_name)))
+            query_vector = self.embed_query(query, set(TOKEN_RE.findall(hcp_name.lower())))
+            hits = self._top(rows, vectors[rows] @ query_vector, ids, k) if query_vector is not None else []
+            return hits or [(int(ids[row]), 0.0) for row in rows[::-1][:k]]
+
+        query_vector = self.embed_query(query)
+        if query_vector is None:
+            return []
+        best_rows, best_scores = [], []
+        for start in range(0, len(ids), SCAN_CHUNK_ROWS):
+            scores = vectors[start:start + SCAN_CHUNK_ROWS] @ query_vector
+            top = np.argpartition(-scores, k)[:k] if len(scores) > k else np.arange(len(scores))
+            best_rows.append(top + start)
+            best_scores.append(scores[top])
+        if not best_rows:
+            return []
+        return self._top(np.concatenate(best_rows), np.concatenate(best_scores), ids, k)
+
+    @staticmethod
+    def _top(rows, scores, ids, k):
+        if len(scores) > k:
+            top = np.argpartition(-scores, k)[:k]
+            rows, scores = rows[top], scores[top]
+        order = np.argsort(-scores, kind="stable")
+        return [(int(ids[rows[i]]), round(float(scores[i]), 4)) for i in order if scores[i] > 0]
+
+    def stats(self):
+        count = len(self)
+        return {
+            "notes": count,
+            "dim": self.dim,
+            "last_id": self.last_id(),
+            "size_mb": round(count * (4 * self.dim + 16) / 1e6, 1),
+            "rows_added": self.rows_added,
+            "searches": self.searches,
+        }
+
+
+def open_note_index(path=NOTE_INDEX_PATH):
+    """The index at NOTE_INDEX_PATH, or None when retrieval is disabled"""
+    return NoteIndex(path) if path else None
+
+
+def format_context_note(note):
+    """One prompt line for a retrieved interaction"""
+    date = note["date"][:10] if note.get("date") else "unknown date"
+    text = " ".join((note.get("raw_notes") or "").split())
+    if len(text) > NOTE_CONTEXT_MAX_CHARS:
+        text = text[:NOTE_CONTEXT_MAX_CHARS].rsplit(" ", 1)[0] + "…"
+    summary = note.get("summary") or "no summary"
+    return f"- {date} ({note.get('sentiment') or 'neutral'}): {summary}. Notes: {text}"
+
+
+def pack_context(notes, token_budget=NOTE_CONTEXT_TOKEN_BUDGET):
+    """Prompt lines for the notes in relevance order until the token budget is spent"""
+    lines, used = [], 0
+    for note in notes:
+        line = format_context_note(note)
+        tokens = estimate_tokens(line)
+        if used + tokens > token_budget:
+            break
+        lines.append(line)
+        used += tokens
+    return lines
+
+
+async def retrieve_context(index, hcp_name, query, k=NOTE_CONTEXT_K, token_budget=NOTE_CONTEXT_TOKEN_BUDGET):
+    """Prompt lines for the HCP's stored notes most relevant to `query`, within the token budget"""
+    def lookup():
+        index.refresh(max_rows=NOTE_INDEX_REFRESH_ROWS)
+        return index.search(query, hcp_name, k)
+
+    hits = await asyncio.to_thread(lookup)
+    if not hits:
+        return []
+    async with AsyncSessionLocal() as session:
+        rows = (await session.execute(
+            select(*CONTEXT_COLUMNS).where(HCPInteraction.id.in_([interaction_id for interaction_id, _ in hits]))
+        )).all()
+    by_id = {row.id: row for row in rows}
+    notes = []
+    for interaction_id, _ in hits:
+        row = by_id.get(interaction_id)
+        if row is not None:
+            notes.append({
+                "id": row.id,
+                "date": row.interaction_date.isoformat() if row.interaction_date else None,
+                "summary": row.ai_summary,
+                "sentiment": row.sentiment,
+                "raw_notes": row.raw_notes,
+            })
+    return pack_context(notes, token_budget)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("command", choices=["refresh", "stats"])
+    parser.add_argument("--path", default=NOTE_INDEX_PATH)
+    args = parser.parse_args()
+
+    index = NoteIndex(args.path)
+    if args.command == "refresh":
+        start = time.perf_counter()
+        added = index.refresh()
+        elapsed = time.perf_counter() - start
+        print(f"Indexed {added:,} interactions in {elapsed:.1f}s ({added / max(elapsed, 1e-9):,.0f}/s)")
+    print(json.dumps(index.stats(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+"""Incrementally maintained HCPProfile rollups.
+
+Every interaction written through InteractionWriter updates its HCP's
+total_interactions, last_interaction_date and relationship_strength in the
+same transaction. Rollups accumulate the unclamped strength (strength_score)
+and clamp only the relationship_strength written from it, so incremental
+updates, merges and rebuilds agree whatever order rows are folded in.
+Repair with: python profile_aggregator.py rebuild
+"""
+import argparse
+import os
+import time
+from datetime import datetime
+from sqlalchemy import bindparam, select, update, insert
+from models import HCPInteraction, HCPProfile, SessionLocal
+from note_extractor import DEFAULT_SPECIALTY
+
+# Relationship strength: exponentially decayed sum of sentiment weights, 0-10 scale
+STRENGTH_HALF_LIFE_DAYS = float(os.getenv("STRENGTH_HALF_LIFE_DAYS", "90"))
+STRENGTH_MAX = 10.0
+SENTIMENT_WEIGHTS = {"positive": 1.0, "neutral": 0.5, "negative": -0.5}
+
+REBUILD_BATCH_SIZE = 1000
+
+
+def decay_factor(elapsed_seconds):
+    return 0.5 ** (elapsed_seconds / (STRENGTH_HALF_LIFE_DAYS * 86400))
+
+
+def clamp_strength(strength):
+    return min(max(strength, 0.0), STRENGTH_MAX)
+
+
+def stored_strength(profile):
+    """The unclamped strength a profile's rollup continues from; profiles written before strength_score have
+    only the clamped value"""
+    return profile.strength_score if profile.strength_score is not None else profile.relationship_strength or 0.0
+
+
+def strength_values(strength):
+    """Profile column values for an unclamped rollup strength"""
+    return {"strength_score": strength, "relationship_strength": clamp_strength(strength)}
+
+
+def known_specialty(specialty):
+    """An interaction's specialty, or None for the placeholder an analysis falls back to when it cannot tell"""
+    return specialty if specialty and specialty != DEFAULT_SPECIALTY else None
+
+
+def fold_interaction(state, interaction_date, sentiment):
+    """O(1) update of (total, last_date, strength) with one interaction.
+
+    The current strength is decayed from the last interaction date up to the
+    new one before the new sentiment weight is added. Late-arriving
+    (backdated) interactions decay their own weight instead, so the result
+    does not depend on arrival order. The strength is not clamped here;
+    clamping between folds would make it depend on order again.
+    """
+    total, last_date, strength = state
+    weight = SENTIMENT_WEIGHTS.get(sentiment, SENTIMENT_WEIGHTS["neutral"])
+    if last_date is None:
+        strength, last_date = weight, interaction_date
+    elif interaction_date >= last_date:
+        strength = strength * decay_factor((interaction_date - last_date).total_seconds()) + weight
+        last_date = interaction_date
+    else:
+        strength = strength + weight * decay_factor((last_date - interaction_date).total_seconds())
+    return total + 1, last_date, strength
+
+
+def merge_rollups(state, other):
+    """(total, last_date, strength) of two rollups of the same HCP, as if one had folded every interaction.
+
+    The older strength is decayed up to the newer last date, as
+    fold_interaction would have done with the later interactions.
+    """
+    if other[1] is None:
+        return state[0] + other[0], state[1], state[2]
+    if state[1] is None:
+        return state[0] + other[0], other[1], other[2]
+    older, newer = sorted((state, other), key=lambda rollup: rollup[1])
+    strength = newer[2] + older[2] * decay_factor((newer[1] - older[1]).total_seconds())
+    return state[0] + other[0], newer[1], strength
+
+
+def apply_interactions(session, rows):
+    """Fold a batch of new interaction rows into their profiles, inside the caller's transaction.
+
+    Returns {hcp_name: profile id} for every HCP in the batch.
+    """
+    by_hcp = {}
+    for row in rows:
+        by_hcp.setdefault(row["hcp_name"], []).append(row)
+
+    stmt = select(HCPProfile).where(HCPProfile.name.in_(list(by_hcp)))
+    if session.bind.dialect.name != "sqlite":
+        stmt = stmt.with_for_update()
+    profiles = {profile.name: profile for profile in session.scalars(stmt)}
+
+    new_profiles = []
+    for hcp_name, hcp_rows in by_hcp.items():
+        profile = profiles.get(hcp_name)
+        if profile is None:
+            state = (0, None, 0.0)
+        else:
+            state = (profile.total_interactions or 0, profile.last_interaction_date, stored_strength(profile))
+
+        specialty = None
+        for row in sorted(hcp_rows, key=lambda r: r["interaction_date"]):
+            state = fold_interaction(state, row["interaction_date"], row.get("sentiment"))
+            specialty = known_specialty(row.get("hcp_specialty")) or specialty
+
+        total, last_date, strength = state
+        if profile is None:
+            new_profiles.append({
+                "name": hcp_name,
+                "specialty": specialty,
+                "total_interactions": total,
+                "last_interaction_date": last_date,
+                **strength_values(strength),
+            })
+        else:
+            profile.total_interactions = total
+            profile.last_interaction_date = last_date
+            profile.strength_score = strength
+            profile.relationship_strength = clamp_strength(strength)
+            if known_specialty(profile.specialty) is None and specialty:
+                profile.specialty = specialty
+
+    profile_ids = {name: profile.id for name, profile in profiles.items()}
+    if new_profiles:
+        session.execute(insert(HCPProfile), new_profiles)
+        new_names = [profile["name"] for profile in new_profiles]
+        profile_ids.update(session.execute(
+            select(HCPProfile.name, HCPProfile.id).where(HCPProfile.name.in_(new_names))).all())
+    session.flush()
+    return profile_ids
+
+
+def link_new_interactions(session, rows, profile_ids):
+    """Set hcp_profile_id on just-inserted rows that were written without one (an HCP new to the writer).
+
+    Each update is confined to the HCP's rows from the batch's earliest
+    date on, through the (hcp_name, interaction_date) index.
+    """
+    earliest = {}
+    for row in rows:
+        if row.get("hcp_profile_id") is None and row["hcp_name"] in profile_ids:
+            name = row["hcp_name"]
+            earliest[name] = min(earliest.get(name, row["interaction_date"]), row["interaction_date"])
+    if not earliest:
+        return {}
+    link = (update(HCPInteraction)
+            .where(HCPInteraction.hcp_name == bindparam("name"),
+                   HCPInteraction.interaction_date >= bindparam("since"),
+                   HCPInteraction.hcp_profile_id.is_(None))
+            .values(hcp_profile_id=bindparam("profile_id")))
+    session.connection().execute(link, [{"name": name, "since": since, "profile_id": profile_ids[name]}
+                                        for name, since in earliest.items()])
+    return {name: profile_ids[name] for name in earliest}
+
+
+def rebuild_profiles(session_factory=SessionLocal, batch_size=REBUILD_BATCH_SIZE):
+    """Recompute every profile's rollups in one streaming pass over hcp_interactions.
+
+    Rows arrive ordered by (hcp_name, interaction_date), which the
+    ix_hcp_interactions_hcp_date index serves without a sort, so only one
+    small rollup per HCP is held in memory, never the interactions. Rollups
+    are written after the read stream is exhausted, because SQLite cannot
+    write while another connection is still reading the same database.
+    """
+    start = time.perf_counter()
+    updates, inserts = [], []
+    seen = set()
+    interactions = 0
+
+    with session_factory() as session:
+        existing = dict(session.execute(select(HCPProfile.name, HCPProfile.id)).all())
+
+    with session_factory() as session:
+        stream = session.execute(
+            select(HCPInteraction.hcp_name, HCPInteraction.interaction_date,
+                   HCPInteraction.sentiment, HCPInteraction.hcp_specialty)
+            .order_by(HCPInteraction.hcp_name, HCPInteraction.interaction_date)
+            .execution_options(yield_per=10000)
+        )
+
+        def emit(hcp_name, state, specialty):
+            total, last_date, strength = state
+            values = {"total_interactions": total, "last_interaction_date": last_date, **strength_values(strength)}
+            seen.add(hcp_name)
+            if hcp_name in existing:
+                updates.append(dict(values, id=existing[hcp_name]))
+            else:
+                inserts.append(dict(values, name=hcp_name, specialty=specialty))
+
+        current, state, specialty = None, None, None
+        for hcp_name, interaction_date, sentiment, hcp_specialty in stream:
+            interactions += 1
+            if hcp_name != current:
+                if current is not None:
+                    emit(current, state, specialty)
+                current, state, specialty = hcp_name, (0, None, 0.0), None
+            state = fold_interaction(state, interaction_date or datetime.utcnow(), sentiment)
+            specialty = known_specialty(hcp_specialty) or specialty
+        if current is not None:
+            emit(current, state, specialty)
+
+    # Profiles that no longer have any interactions
+    for name, profile_id in existing.items():
+        if name not in seen:
+            updates.append({"id": profile_id, "total_interactions": 0,
+                            "last_interaction_date": None, **strength_values(0.0)})
+
+    with session_factory() as session:
+        for offset in range(0, len(updates), batch_size):
+            session.execute(update(HCPProfile), updates[offset:offset + batch_size])
+        for offset in range(0, len(inserts), batch_size):
+            session.execute(insert(HCPProfile), inserts[offset:offset + batch_size])
+        session.commit()
+
+    elapsed = time.perf_counter() - start
+    print(f"Rebuilt {len(seen):,} profiles from {interactions:,} interactions in {elapsed:.1f}s")
+    return len(seen)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="HCP profile rollup maintenance")
+    parser.add_argument("command", choices=["rebuild"])
+    args = parser.parse_args()
+
+    from models import init_db
+    init_db()
+    rebuild_profiles()
@@ -0,0 +1,168 @@
+"""Versioned prompt templates with whitespace stripped and token budgets.
+
+A template is compiled once, at registration: indentation and blank lines
+are removed (the upstream bills them as tokens) and the static text between
+its {field} slots is tokenized, so a render only has to count its fields.
+A field with a budget is cut to it before sending: long notes keep their
+opening and closing sentences, which name the HCP and the agreed next
+step, and no prompt is sent that leaves less than its answer's max_tokens
+of the model context.
+
+count_tokens is a local approximation of the model's BPE tokenizer (a
+word is one token per six letters, digits go three to a token, other
+symbols two), used for budgeting without the model's vocabulary. The
+upstream's own prompt/completion counts are recorded per template by
+LLMClient under crm_llm_tokens_total.
+"""
+import os
+import re
+import string
+
+PROMPT_CONTEXT_TOKENS = int(os.getenv("PROMPT_CONTEXT_TOKENS", "8192"))
+PROMPT_NOTES_TOKEN_BUDGET = int(os.getenv("PROMPT_NOTES_TOKEN_BUDGET", "1000"))
+
+# One match per approximate token, so counting is a single findall
+TOKEN_RE = re.compile(r"[^\W\d_]{1,6}|\d{1,3}|\s+|[^\w\s]{1,2}|_{1,2}")
+SENTENCE_RE = re.compile(r"(?<=[.!?;])\s+")
+ELISION = " … "
+# Share of a cut field's budget given to its opening sentences; the rest goes to the closing ones
+HEAD_SHARE = 0.6
+
+
+def count_tokens(text):
+    """Approximate token count of `text` for the model's tokenizer"""
+    return len(TOKEN_RE.findall(text))
+
+
+def compact(text):
+    """Template text with indentation, trailing spaces and blank lines removed"""
+    return "\n".join(line.strip() for line in text.strip().splitlines() if line.strip())
+
+
+def cut_tokens(text, budget):
+    """Longest prefix of `text` within `budget` tokens"""
+    for used, match in enumerate(TOKEN_RE.finditer(text)):
+        if used == budget:
+            return text[:match.start()].rstrip()
+    return text
+
+
+def fit_tokens(text, budget):
+    """`text` within about `budget` tokens, and whether it had to be cut.
+
+    Whole sentences are kept from the start up to HEAD_SHARE of the budget,
+    then from the end, with an elision mark between; a first sentence too
+    long to keep whole is cut off mid-way instead.
+    """
+    if count_tokens(text) <= budget:
+        return text, False
+    budget = max(budget - count_tokens(ELISION), 1)
+    sentences = SENTENCE_RE.split(" ".join(text.split()))
+    head, used = [], 0
+    for sentence in sentences:
+        tokens = count_tokens(sentence) + 1
+        if used + tokens > budget * HEAD_SHARE:
+            break
+        head.append(sentence)
+        used += tokens
+    if not head:
+        return cut_tokens(sentences[0], budget) + ELISION.rstrip(), True
+    tail = []
+    for sentence in reversed(sentences[len(head):]):
+        tokens = count_tokens(sentence) + 1
+        if used + tokens > budget:
+            break
+        tail.append(sentence)
+        used += tokens
+    return (" ".join(head) + ELISION + " ".join(reversed(tail))).rstrip(), True
+
+
+class PromptTemplate:
+    """One named, versioned prompt compiled to static text and {field} slots.
+
+    `budgets` maps a field to its token budget; `answer_tokens` is the
+    max_tokens its completions are requested with, kept free in the
+    model context. key ("name:vN") is what response-cache keys use, so
+    bumping the version retires the answers cached for the old text.
+    """
+
+    def __init__(self, name, version, text, budgets=None, answer_tokens=500):
+        self.name = name
+        self.version = version
+        self.key = f"{name}:v{version}"
+        self.text = compact(text)
+        self.budgets = dict(budgets or {})
+        self.answer_tokens = answer_tokens
+        self.parts = [(literal, field) for literal, field, _, _ in string.Formatter().parse(self.text)]
+        self.fields = list(dict.fromkeys(field for _, field in self.parts if field))
+        self.static_tokens = sum(count_tokens(literal) for literal, _ in self.parts)
+        self.renders = 0
+        self.truncated = 0
+        self.prompt_tokens = 0
+
+    def fit(self, field, value):
+        """`value` cut to the field's budget, if it has one"""
+        return self._fit(field, value)[0]
+
+    def _fit(self, field, value):
+        """(value within the field's budget, its token count)"""
+        tokens = count_tokens(value)
+        budget = self.budgets.get(field)
+        if budget is None or tokens <= budget:
+            return value, tokens
+        self.truncated += 1
+        value = fit_tokens(value, budget)[0]
+        return value, count_tokens(value)
+
+    def render(self, **fields):
+        """The prompt text for these field values, with budgeted fields cut to fit"""
+        values, tokens = {}, {}
+        for field in self.fields:
+            values[field], tokens[field] = self._fit(field, str(fields[field]))
+        overflow = self.prompt_size(tokens) + self.answer_tokens - PROMPT_CONTEXT_TOKENS
+        if overflow > 0:
+            # Still too long for the context: the longest field gives up the difference
+            field = max(tokens, key=tokens.get)
+            values[field] = fit_tokens(values[field], max(tokens[field] - overflow, 1))[0]
+            tokens[field] = count_tokens(values[field])
+            self.truncated += 1
+        self.renders += 1
+        self.prompt_tokens += self.prompt_size(tokens)
+        return "".join(literal + (values[field] if field else "") for literal, field in self.parts)
+
+    def prompt_size(self, tokens):
+        """Prompt tokens given each field's token count; a field may fill more than one slot"""
+        return self.static_tokens + sum(tokens[field] for _, field in self.parts if field)
+
+    def stats(self):
+        return {
+            "version": self.version,
+            "static_tokens": self.static_tokens,
+            "budgets": self.budgets,
+            "renders": self.renders,
+            "fields_truncated": self.truncated,
+            "avg_prompt_tokens": round(self.prompt_tokens / self.renders, 1) if self.renders else None,
+        }
+
+
+class PromptRegistry:
+    """Every prompt the application sends, by name"""
+
+    def __init__(self):
+        self.templates = {}
+
+    def register(self, name, version, text, budgets=None, answer_tokens=500):
+        """Compile and add a template; registering a name again (a reloaded module) replaces it"""
+        template = PromptTemplate(name, version, text, budgets, answer_tokens)
+        self.templates[name] = template
+        return template
+
+    def get(self, name):
+        return self.templates[name]
+
+    def stats(self):
+        return {name: template.stats() for name, template in self.templates.items()}
+
+
+# The application's prompt catalogue
+prompts = PromptRegistry()
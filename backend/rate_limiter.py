@@ -0,0 +1,278 @@
+"""Client-side rate limiting for the upstream LLM.
+
+Two token buckets, one for requests and one for tokens, refill
+continuously at the per-minute limits. Callers that cannot be served right
+away queue by priority, so an interactive /chat call goes ahead of any
+waiting batch or backfill analysis. Every caller gives up after its
+priority's maximum wait. Rate-limit headers and Retry-After on the
+provider's responses pull the buckets down to what the provider reports,
+so limits shared with other clients are respected too. Given a SharedStore,
+the buckets and any pause live there, so every worker process on the box
+draws from the same budget; reads and writes of them run in a worker
+thread, so the event loop never waits on another process's lock.
+"""
+import asyncio
+import heapq
+import itertools
+import os
+import re
+import time
+from contextlib import contextmanager
+
+# 0 disables a bucket; 429s and rate-limit headers are still honoured
+LLM_REQUESTS_PER_MINUTE = float(os.getenv("LLM_REQUESTS_PER_MINUTE", "0"))
+LLM_TOKENS_PER_MINUTE = float(os.getenv("LLM_TOKENS_PER_MINUTE", "0"))
+RATE_LIMIT_MAX_WAIT_INTERACTIVE = float(os.getenv("RATE_LIMIT_MAX_WAIT_INTERACTIVE", "5"))
+RATE_LIMIT_MAX_WAIT_BATCH = float(os.getenv("RATE_LIMIT_MAX_WAIT_BATCH", "20"))
+# How many seconds of allowance may be spent in one burst (60 = a full minute's worth)
+RATE_LIMIT_BURST_SECONDS = float(os.getenv("RATE_LIMIT_BURST_SECONDS", "60"))
+
+# Lower value = served first
+INTERACTIVE = 0
+BATCH = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BATCH: "batch"}
+
+DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+def parse_duration(value):
+    """Seconds from a Retry-After or x-ratelimit-reset value ("7.66s", "2m59.56s", "12")"""
+    if value is None:
+        return None
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = DURATION_PART.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * DURATION_UNITS[unit] for amount, unit in parts)
+
+
+class RateLimitTimeout(Exception):
+    """Raised when a caller's maximum wait passes before the limiter can admit it"""
+
+
+class TokenBucket:
+    """Continuously refilling bucket holding at most `burst_seconds` of allowance"""
+
+    def __init__(self, per_minute, burst_seconds=RATE_LIMIT_BURST_SECONDS):
+        self.per_minute = per_minute
+        self.rate = per_minute / 60
+        self.capacity = self.rate * burst_seconds
+        self.level = self.capacity
+        # Wall clock rather than monotonic, so a shared level means the same in every process
+        self.updated = time.time()
+
+    @property
+    def enabled(self):
+        return self.capacity > 0
+
+    def _refill(self):
+        now = time.time()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        if not self.enabled:
+            return 0.0
+        self._refill()
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount):
+        if self.enabled:
+            self._refill()
+            self.level -= min(amount, self.capacity)
+
+    def give_back(self, amount):
+        if self.enabled:
+            self._refill()
+            self.level = min(self.capacity, self.level + amount)
+
+    def cap(self, remaining):
+        """Lower the level to what the provider says is left"""
+        if self.enabled:
+            self._refill()
+            self.level = min(self.level, remaining)
+
+
+class RateLimiter:
+    """Admits upstream calls within the request/token budgets, highest priority first"""
+
+    def __init__(self, requests_per_minute=LLM_REQUESTS_PER_MINUTE, tokens_per_minute=LLM_TOKENS_PER_MINUTE,
+                 max_wait=None, burst_seconds=RATE_LIMIT_BURST_SECONDS, store=None):
+        self.requests = TokenBucket(requests_per_minute, burst_seconds)
+        self.tokens = TokenBucket(tokens_per_minute, burst_seconds)
+        self.max_wait = max_wait or {INTERACTIVE: RATE_LIMIT_MAX_WAIT_INTERACTIVE, BATCH: RATE_LIMIT_MAX_WAIT_BATCH}
+        self.paused_until = 0.0
+        self.store = store
+        self._waiters = []
+        self._seq = itertools.count()
+        self._changed = None
+        self._task = None
+        self.throttled_responses = 0
+        self._metrics = {priority: {"queued": 0, "admitted": 0, "timeouts": 0, "total_wait": 0.0, "max_wait": 0.0}
+                         for priority in PRIORITY_NAMES}
+
+    @contextmanager
+    def _synced(self):
+        """Load the buckets and pause from the shared store, and write them back afterwards"""
+        if self.store is None:
+            yield
+            return
+        with self.store.update("rate_limiter") as state:
+            for name, bucket in (("requests", self.requests), ("tokens", self.tokens)):
+                if name in state:
+                    bucket.level, bucket.updated = state[name]
+            self.paused_until = state.get("paused_until", self.paused_until)
+            yield
+            state["requests"] = [self.requests.level, self.requests.updated]
+            state["tokens"] = [self.tokens.level, self.tokens.updated]
+            state["paused_until"] = self.paused_until
+
+    def _apply(self, change, *args):
+        with self._synced():
+            return change(*args)
+
+    async def _change(self, change, *args):
+        """Run `change` on the buckets; with a store, in a worker thread so the event loop never blocks"""
+        if self.store is None:
+            return self._apply(change, *args)
+        return await self.store.change(self._apply, change, *args)
+
+    def _wait_time(self, tokens):
+        return max(self.paused_until - time.time(), self.requests.wait_time(1), self.tokens.wait_time(tokens))
+
+    def _take(self, tokens):
+        wait = self._wait_time(tokens)
+        if wait <= 0:
+            self.requests.take(1)
+            self.tokens.take(tokens)
+        return wait
+
+    def _give_back(self, tokens):
+        self.requests.give_back(1)
+        self.tokens.give_back(tokens)
+
+    async def _try_admit(self, tokens, priority, start):
+        """Take budget for one call if available; returns 0, or the seconds until it might be"""
+        wait = await self._change(self._take, tokens)
+        if wait <= 0:
+            self._record_admission(priority, time.monotonic() - start)
+        return wait
+
+    def _record_admission(self, priority, waited):
+        metrics = self._metrics[priority]
+        metrics["admitted"] += 1
+        metrics["total_wait"] += waited
+        metrics["max_wait"] = max(metrics["max_wait"], waited)
+
+    async def acquire(self, tokens, priority=INTERACTIVE):
+        """Wait for budget for one call of about `tokens` tokens; raises RateLimitTimeout"""
+        start = time.monotonic()
+        if self._task is None and not self._waiters and await self._try_admit(tokens, priority, start) <= 0:
+            return
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), tokens, start, future))
+        metrics = self._metrics[priority]
+        metrics["queued"] += 1
+        if self._task is None:
+            self._changed = asyncio.Event()
+            self._task = loop.create_task(self._dispatch())
+        else:
+            self._changed.set()
+
+        try:
+            await asyncio.wait_for(future, self.max_wait[priority])
+        except asyncio.TimeoutError:
+            metrics["timeouts"] += 1
+            raise RateLimitTimeout(f"Waited more than {self.max_wait[priority]}s for rate-limit budget")
+        finally:
+            metrics["queued"] -= 1
+
+    async def _dispatch(self):
+        """Release the head of the queue whenever the buckets allow it"""
+        while self._waiters:
+            # Popped while its budget is checked, since callers may queue ahead of it meanwhile
+            waiter = heapq.heappop(self._waiters)
+            priority, _, tokens, start, future = waiter
+            if future.done():
+                continue
+            self._changed.clear()
+            # Budget is taken here, so the next head sees it gone even before this caller resumes
+            wait = await self._try_admit(tokens, priority, start)
+            if wait <= 0:
+                if future.done():
+                    # Gave up while its budget was being taken
+                    await self._change(self._give_back, tokens)
+                else:
+                    future.set_result(None)
+                continue
+            heapq.heappush(self._waiters, waiter)
+            try:
+                await asyncio.wait_for(self._changed.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+        self._task = None
+
+    async def pause(self, seconds):
+        """Admit nothing for `seconds` (Retry-After, or a bucket the provider reports as empty)"""
+        await self._change(self._pause, seconds)
+
+    def _pause(self, seconds):
+        self.paused_until = max(self.paused_until, time.time() + seconds)
+
+    async def observe(self, status_code, headers):
+        """Sync with the provider's view from a response's status and rate-limit headers"""
+        if status_code == 429:
+            self.throttled_responses += 1
+        updates = [(kind, bucket, headers.get(f"x-ratelimit-remaining-{kind}"))
+                   for kind, bucket in (("requests", self.requests), ("tokens", self.tokens))]
+        if status_code != 429 and all(remaining is None for _, _, remaining in updates):
+            return
+        await self._change(self._observe, status_code, headers, updates)
+
+    def _observe(self, status_code, headers, updates):
+        if status_code == 429:
+            self._pause(parse_duration(headers.get("retry-after")) or 1.0)
+        for kind, bucket, remaining in updates:
+            if remaining is None:
+                continue
+            try:
+                remaining = float(remaining)
+            except ValueError:
+                continue
+            bucket.cap(remaining)
+            if remaining < 1:
+                self._pause(parse_duration(headers.get(f"x-ratelimit-reset-{kind}")) or 1.0)
+
+    async def settle(self, reserved, used):
+        """Return the unused part of a call's token reservation once its real usage is known"""
+        if used is not None and used < reserved and self.tokens.enabled:
+            await self._change(self.tokens.give_back, reserved - used)
+
+    def stats(self):
+        priorities = {}
+        for priority, metrics in self._metrics.items():
+            admitted = metrics["admitted"]
+            priorities[PRIORITY_NAMES[priority]] = {
+                "queue_depth": metrics["queued"],
+                "admitted": admitted,
+                "timeouts": metrics["timeouts"],
+                "avg_wait_ms": round(metrics["total_wait"] / admitted * 1000, 1) if admitted else 0.0,
+                "max_wait_ms": round(metrics["max_wait"] * 1000, 1),
+                "max_wait_allowed_seconds": self.max_wait[priority],
+            }
+        return {
+            "priorities": priorities,
+            "requests_per_minute": self.requests.per_minute,
+            "tokens_per_minute": self.tokens.per_minute,
+            "paused_for_seconds": round(max(0.0, self.paused_until - time.time()), 2),
+            "throttled_responses": self.throttled_responses,
+            "shared": self.store is not None,
+        }
@@ -2,13 +2,13 @@ import os
 import sys
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from models import Base, engine
+from models import init_db
 from agent.main import app
 import uvicorn
 
 # Create database tables
 print("Creating database tables...")
-Base.metadata.create_all(bind=engine)
+init_db()
 print("Database setup complete!")
 
 if __name__ == "__main__":
@@ -0,0 +1,294 @@
+"""Full-text search over interaction notes and AI summaries.
+
+SQLite keeps an FTS5 index (porter stemming) as an external-content table
+over hcp_interactions. PostgreSQL keeps a weighted tsvector column with a GIN
+index. Either way the index is maintained by the database in the same
+transaction as the insert, update or delete, so rows written by the
+write-behind queue are searchable as soon as they commit.
+
+Results are ranked by BM25 on SQLite and ts_rank_cd on PostgreSQL. Ties
+are broken by id. Pages continue from an opaque cursor.
+
+Scoring every match of a common term gets slow as the table grows (BM25 over
+400k matches takes over a second), so on SQLite only the SEARCH_RANK_WINDOW
+most recent matches are ranked at a time. The window's bounds travel in the
+cursor so later pages rank the same set; once a window is used up, the next
+cursor starts the window of older matches below it, so every match can be
+reached. Such results are flagged `truncated` (ranked within a window, with
+older matches still to come), and a page that ends a window may be short.
+Snippets are built only for the rows on the page. The HCP name is indexed as a zero-weight FTS column, which lets an HCP
+filter narrow the match inside the index instead of checking every match
+against the table.
+"""
+import base64
+import json
+import os
+import re
+from sqlalchemy import DateTime, Float, Integer, String, Text, bindparam, text
+
+DEFAULT_SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 100
+# Most recent matches ranked per query on SQLite; 0 ranks every match
+SEARCH_RANK_WINDOW = int(os.getenv("SEARCH_RANK_WINDOW", "2000"))
+# Summaries are short and written to the point, so a hit there counts for more than one in the raw notes
+SUMMARY_WEIGHT = 2.0
+NOTES_WEIGHT = 1.0
+SNIPPET_TOKENS = 12
+HIGHLIGHT_START = "<mark>"
+HIGHLIGHT_END = "</mark>"
+# Dropped from SQLite queries as PostgreSQL's english configuration does; their doclists are huge and they
+# barely change the ranking
+STOPWORDS = frozenset("""a about an and are as at be but by for from had has have he her his i in is it its
+of on or our she that the their they this to was we were will with""".split())
+
+SQLITE_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS hcp_interactions_fts USING fts5("
+    "raw_notes, ai_summary, hcp_name, content='hcp_interactions', content_rowid='id', "
+    "tokenize='porter unicode61')",
+    "CREATE TRIGGER IF NOT EXISTS hcp_interactions_fts_insert AFTER INSERT ON hcp_interactions BEGIN "
+    "INSERT INTO hcp_interactions_fts (rowid, raw_notes, ai_summary, hcp_name) "
+    "VALUES (new.id, new.raw_notes, new.ai_summary, new.hcp_name); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS hcp_interactions_fts_delete AFTER DELETE ON hcp_interactions BEGIN "
+    "INSERT INTO hcp_interactions_fts (hcp_interactions_fts, rowid, raw_notes, ai_summary, hcp_name) "
+    "VALUES ('delete', old.id, old.raw_notes, old.ai_summary, old.hcp_name); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS hcp_interactions_fts_update AFTER UPDATE OF raw_notes, ai_summary, hcp_name "
+    "ON hcp_interactions BEGIN "
+    "INSERT INTO hcp_interactions_fts (hcp_interactions_fts, rowid, raw_notes, ai_summary, hcp_name) "
+    "VALUES ('delete', old.id, old.raw_notes, old.ai_summary, old.hcp_name); "
+    "INSERT INTO hcp_interactions_fts (rowid, raw_notes, ai_summary, hcp_name) "
+    "VALUES (new.id, new.raw_notes, new.ai_summary, new.hcp_name); "
+    "END",
+)
+
+POSTGRES_DDL = (
+    "ALTER TABLE hcp_interactions ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS ("
+    "setweight(to_tsvector('english', coalesce(ai_summary, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(raw_notes, '')), 'B')) STORED",
+    "CREATE INDEX IF NOT EXISTS ix_hcp_interactions_search ON hcp_interactions USING GIN (search_vector)",
+)
+
+RESULT_COLUMNS = {
+    "id": Integer,
+    "hcp_name": String,
+    "interaction_date": DateTime,
+    "interaction_type": String,
+    "sentiment": String,
+    "ai_summary": Text,
+    "notes_snippet": Text,
+    "summary_snippet": Text,
+    "rank": Float,
+    "floor_id": Integer,
+    "ceiling_id": Integer,
+    "more_below": Integer,
+}
+
+
+def init_search(bind):
+    """Create the search index and its maintenance triggers; fills the index when it was not being maintained"""
+    dialect = bind.dialect.name
+    with bind.begin() as conn:
+        if dialect == "sqlite":
+            # No trigger means the index is new or the table was recreated under it; either way refill it
+            maintained = conn.execute(text(
+                "SELECT 1 FROM sqlite_master WHERE name = 'hcp_interactions_fts_insert'")).first() is not None
+            for statement in SQLITE_DDL:
+                conn.execute(text(statement))
+            if not maintained:
+                conn.execute(text("INSERT INTO hcp_interactions_fts (hcp_interactions_fts) VALUES ('rebuild')"))
+        elif dialect == "postgresql":
+            for statement in POSTGRES_DDL:
+                conn.execute(text(statement))
+        else:
+            print(f"Full-text search is not available on {dialect}")
+
+
+def match_expression(query, hcp_name=None):
+    """FTS5 query matching every word of free text in the notes or summary; quoting each term keeps
+    operators and punctuation inert. An HCP name adds a phrase match on the name column."""
+    words = re.findall(r"\w+", query.lower())
+    terms = [word for word in words if word not in STOPWORDS] or words
+    if not terms:
+        return ""
+    expression = "{raw_notes ai_summary} : (" + " ".join('"' + term + '"' for term in terms) + ")"
+    name = re.findall(r"\w+", (hcp_name or "").lower())
+    if name:
+        expression += ' AND hcp_name : "' + " ".join(name) + '"'
+    return expression
+
+
+def encode_cursor(rank, interaction_id, floor_id=0, ceiling_id=0, more_below=0):
+    """A rank of None starts the window of matches below ceiling_id"""
+    raw = json.dumps([rank, interaction_id, floor_id, ceiling_id, more_below])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """(rank or None, id, floor_id, ceiling_id, more_below); cursors issued before windows had a ceiling have 3 parts"""
+    try:
+        rank, interaction_id, floor_id, *window = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        ceiling_id, more_below = window or (0, 0)
+        return (None if rank is None else float(rank)), int(interaction_id), int(floor_id), int(ceiling_id), \
+            int(more_below)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+
+
+def clamp_limit(limit):
+    return max(1, min(int(limit or DEFAULT_SEARCH_LIMIT), MAX_SEARCH_LIMIT))
+
+
+def _filters(hcp_name, sentiment, date_from, date_to, params):
+    filters = []
+    if hcp_name:
+        filters.append("i.hcp_name = :hcp_name")
+        params["hcp_name"] = hcp_name
+    if sentiment:
+        filters.append("i.sentiment = :sentiment")
+        params["sentiment"] = sentiment
+    if date_from:
+        filters.append("i.interaction_date >= :date_from")
+        params["date_from"] = date_from
+    if date_to:
+        filters.append("i.interaction_date < :date_to")
+        params["date_to"] = date_to
+    return filters
+
+
+def _sqlite_search_sql(query, hcp_name, filters, cursor, params):
+    """Rank the window of most recent matches below the cursor's ceiling (or the cursor's own window), then join
+    and build snippets for just the page"""
+    expression = match_expression(query, hcp_name)
+    if not expression:
+        raise ValueError("Search query has no words")
+    params["match"] = expression
+    fts = "hcp_interactions_fts"
+    rank = f"bm25({fts}, {NOTES_WEIGHT}, {SUMMARY_WEIGHT}, 0.0)"
+    join = f" JOIN hcp_interactions i ON i.id = {fts}.rowid" if filters else ""
+    where = " AND ".join([f"{fts} MATCH :match"] + filters)
+    cursor_rank, cursor_id, floor_id, ceiling_id, more_below = decode_cursor(cursor) if cursor else (None, 0, 0, 0, 0)
+    params["ceiling_id"] = ceiling_id
+    if ceiling_id:
+        where += f" AND {fts}.rowid < :ceiling_id"
+
+    if cursor_rank is not None:
+        params.update(cursor_rank=cursor_rank, cursor_id=cursor_id, floor_id=floor_id, more_below=more_below)
+        ranked = (f"SELECT {fts}.rowid AS id, {rank} AS rank, :floor_id AS floor_id, :more_below AS more_below "
+                  f"FROM {fts}{join} WHERE {where} AND {fts}.rowid >= :floor_id AND "
+                  f"({rank} > :cursor_rank OR ({rank} = :cursor_rank AND {fts}.rowid > :cursor_id)) "
+                  f"ORDER BY rank, {fts}.rowid LIMIT :limit")
+    elif SEARCH_RANK_WINDOW:
+        # FTS5 walks the matches newest first and stops one past the window, so only those are scored;
+        # the extra match only says whether older ones are left for the next window
+        params["window"] = SEARCH_RANK_WINDOW
+        candidates = (f"SELECT {fts}.rowid AS id, {rank} AS rank FROM {fts}{join} WHERE {where} "
+                      f"ORDER BY {fts}.rowid DESC LIMIT :window + 1")
+        numbered = (f"SELECT id, rank, row_number() OVER (ORDER BY id DESC) AS n, "
+                    f"count(*) OVER () > :window AS more_below FROM ({candidates})")
+        ranked = (f"SELECT id, rank, min(id) OVER () AS floor_id, more_below FROM ({numbered}) "
+                  f"WHERE n <= :window ORDER BY rank, id LIMIT :limit")
+    else:
+        ranked = (f"SELECT {fts}.rowid AS id, {rank} AS rank, 0 AS floor_id, 0 AS more_below FROM {fts}{join} "
+                  f"WHERE {where} ORDER BY rank, {fts}.rowid LIMIT :limit")
+
+    snippet = f"snippet({fts}, {{column}}, :mark_start, :mark_end, '…', :snippet_tokens)"
+    params.update(mark_start=HIGHLIGHT_START, mark_end=HIGHLIGHT_END, snippet_tokens=SNIPPET_TOKENS)
+    return (
+        f"WITH ranked AS ({ranked}) "
+        f"SELECT i.id, i.hcp_name, i.interaction_date, i.interaction_type, i.sentiment, i.ai_summary, "
+        f"{snippet.format(column=0)} AS notes_snippet, {snippet.format(column=1)} AS summary_snippet, "
+        f"ranked.rank AS rank, ranked.floor_id AS floor_id, :ceiling_id AS ceiling_id, "
+        f"ranked.more_below AS more_below "
+        # CROSS JOIN keeps the page driving the lookups
+        f"FROM ranked CROSS JOIN {fts} CROSS JOIN hcp_interactions i "
+        f"WHERE {fts} MATCH :match AND {fts}.rowid = ranked.id AND i.id = ranked.id "
+        f"ORDER BY ranked.rank, ranked.id"
+    )
+
+
+def _postgres_search_sql(query, filters, cursor, params):
+    if not re.search(r"\w", query):
+        raise ValueError("Search query has no words")
+    params["query"] = query
+    rank = "-ts_rank_cd(i.search_vector, q.query)"
+    headline = ("ts_headline('english', coalesce(i.{column}, ''), q.query, "
+                "'StartSel=' || :mark_start || ', StopSel=' || :mark_end || ', MaxWords=' || :snippet_tokens "
+                "|| ', MinWords=' || :snippet_min)")
+    params.update(mark_start=HIGHLIGHT_START, mark_end=HIGHLIGHT_END, snippet_tokens=str(SNIPPET_TOKENS),
+                  snippet_min=str(SNIPPET_TOKENS // 2))
+    filters = ["i.search_vector @@ q.query"] + filters
+    if cursor:
+        cursor_rank, cursor_id, *_ = decode_cursor(cursor)
+        if cursor_rank is None:
+            raise ValueError("Invalid cursor")
+        filters.append(f"({rank} > :cursor_rank OR ({rank} = :cursor_rank AND i.id > :cursor_id))")
+        params.update(cursor_rank=cursor_rank, cursor_id=cursor_id)
+    return (
+        f"SELECT i.id, i.hcp_name, i.interaction_date, i.interaction_type, i.sentiment, i.ai_summary, "
+        f"{headline.format(column='raw_notes')} AS notes_snippet, "
+        f"{headline.format(column='ai_summary')} AS summary_snippet, {rank} AS rank, 0 AS floor_id, 0 AS ceiling_id, 0 AS more_below "
+        f"FROM hcp_interactions i, plainto_tsquery('english', :query) AS q(query) "
+        f"WHERE {' AND '.join(filters)} ORDER BY rank, i.id LIMIT :limit"
+    )
+
+
+def _search_statement(dialect, query, hcp_name, sentiment, date_from, date_to, limit, cursor):
+    """Dialect-specific search SQL; `rank` ascends from the best match on both backends"""
+    params = {"limit": limit + 1}
+    filters = _filters(hcp_name, sentiment, date_from, date_to, params)
+    if dialect == "sqlite":
+        sql = _sqlite_search_sql(query, hcp_name, filters, cursor, params)
+    elif dialect == "postgresql":
+        sql = _postgres_search_sql(query, filters, cursor, params)
+    else:
+        raise ValueError(f"Full-text search is not available on {dialect}")
+    # Typed so datetimes are bound in the column's storage format
+    dates = [bindparam(name, type_=DateTime) for name in ("date_from", "date_to") if name in params]
+    return text(sql).bindparams(*dates).columns(**RESULT_COLUMNS), params
+
+
+def _search_result(rows, limit):
+    """(results, next cursor, truncated)"""
+    next_cursor = None
+    truncated = bool(rows and rows[0].more_below)
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(last.rank, last.id, last.floor_id, last.ceiling_id, last.more_below)
+    elif truncated:
+        # This window is used up; carry on with the older matches below it
+        next_cursor = encode_cursor(None, 0, ceiling_id=rows[0].floor_id)
+
+    results = [{
+        "id": row.id,
+        "hcp_name": row.hcp_name,
+        "date": row.interaction_date.isoformat() if row.interaction_date else None,
+        "type": row.interaction_type,
+        "sentiment": row.sentiment,
+        "summary": row.ai_summary,
+        "notes_snippet": row.notes_snippet,
+        "summary_snippet": row.summary_snippet,
+        "score": round(-row.rank, 4),
+    } for row in rows]
+    return results, next_cursor, truncated
+
+
+def search_interactions(session, query, hcp_name=None, sentiment=None, date_from=None, date_to=None,
+                        limit=DEFAULT_SEARCH_LIMIT, cursor=None):
+    """One page of interactions matching every word of `query`, best match first"""
+    limit = clamp_limit(limit)
+    stmt, params = _search_statement(session.bind.dialect.name, query, hcp_name, sentiment,
+                                     date_from, date_to, limit, cursor)
+    results, next_cursor, truncated = _search_result(session.execute(stmt, params).all(), limit)
+    return {"query": query, "results": results, "next_cursor": next_cursor, "truncated": truncated}
+
+
+async def search_interactions_async(session, query, hcp_name=None, sentiment=None, date_from=None, date_to=None,
+                                    limit=DEFAULT_SEARCH_LIMIT, cursor=None):
+    """search_interactions on an AsyncSession"""
+    limit = clamp_limit(limit)
+    stmt, params = _search_statement(session.bind.dialect.name, query, hcp_name, sentiment,
+                                     date_from, date_to, limit, cursor)
+    results, next_cursor, truncated = _search_result((await session.execute(stmt, params)).all(), limit)
+    return {"query": query, "results": results, "next_cursor": next_cursor, "truncated": truncated}
@@ -0,0 +1,171 @@
+"""Production launcher: several uvicorn worker processes behind one listening socket.
+
+Run: python serve.py --workers 4 --port 8000
+
+With --preload (the default) the app is imported once in the supervisor and
+the workers are forked from it, so imports and database setup happen once
+and their memory is shared copy-on-write. Every worker accepts on the same
+socket. A worker that dies is restarted. On SIGTERM or SIGINT each worker
+stops accepting, finishes its in-flight requests and runs the app's
+shutdown hooks (which flush the interaction write-behind queue); workers
+still running after --graceful-timeout are killed.
+
+The workers act as one service through two local SQLite files: the
+rate-limit budget and circuit breaker (SHARED_STATE_PATH), and the LLM
+response cache's disk tier (LLM_CACHE_PATH). Both default to files next to
+this script when unset.
+"""
+import argparse
+import os
+import signal
+import socket
+import sys
+import time
+from dotenv import load_dotenv
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "0")) or os.cpu_count() or 1
+GRACEFUL_TIMEOUT = float(os.getenv("GRACEFUL_TIMEOUT", "30"))
+# A worker that exits sooner than this after starting is restarted only after a pause
+MIN_WORKER_LIFETIME = 1.0
+
+
+def bind_socket(host, port, backlog=2048):
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    return sock
+
+
+def load_app():
+    from models import init_db, engine
+    from search_service import init_search
+    from final_app import app
+    init_db()
+    init_search(engine)
+    return app
+
+
+def run_worker(app, sock, args):
+    """Body of a forked worker; never returns"""
+    import uvicorn
+    # uvicorn installs its own graceful-shutdown handlers for these
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    code = 0
+    try:
+        if app is not None:
+            from final_app import after_fork
+            after_fork()
+        config = uvicorn.Config(app if app is not None else "final_app:app", log_level=args.log_level,
+                                timeout_graceful_shutdown=args.graceful_timeout,
+                                timeout_keep_alive=args.keep_alive)
+        uvicorn.Server(config).run(sockets=[sock])
+    except BaseException as e:
+        print(f"Worker {os.getpid()} crashed: {e}")
+        code = 1
+    finally:
+        sys.stdout.flush()
+        os._exit(code)
+
+
+class Supervisor:
+    """Forks the workers, replaces any that die and shuts them all down on a signal"""
+
+    def __init__(self, app, sock, args):
+        self.app = app
+        self.sock = sock
+        self.args = args
+        self.workers = {}  # pid -> start time
+        self.stopping = False
+
+    def spawn(self):
+        pid = os.fork()
+        if pid == 0:
+            run_worker(self.app, self.sock, self.args)
+        self.workers[pid] = time.monotonic()
+
+    def handle_signal(self, signum, frame):
+        self.stopping = True
+
+    def reap(self):
+        """Collect exited workers; returns how long each one ran"""
+        lifetimes = []
+        while self.workers:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if pid == 0:
+                break
+            started = self.workers.pop(pid, None)
+            if started is not None:
+                lifetimes.append(time.monotonic() - started)
+                if not self.stopping:
+                    print(f"Worker {pid} exited with status {os.waitstatus_to_exitcode(status)}; restarting")
+        return lifetimes
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.handle_signal)
+        signal.signal(signal.SIGINT, self.handle_signal)
+        for _ in range(self.args.workers):
+            self.spawn()
+        print(f"Serving on http://{self.args.host}:{self.args.port} with {self.args.workers} workers "
+              f"(supervisor pid {os.getpid()})")
+
+        while not self.stopping:
+            for lifetime in self.reap():
+                if self.stopping:
+                    break
+                if lifetime < MIN_WORKER_LIFETIME:
+                    time.sleep(MIN_WORKER_LIFETIME)
+                self.spawn()
+            time.sleep(0.2)
+        self.shutdown()
+
+    def shutdown(self):
+        print(f"Stopping {len(self.workers)} workers")
+        for pid in self.workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        # uvicorn forces connections closed after graceful_timeout; allow a little more for shutdown hooks
+        deadline = time.monotonic() + self.args.graceful_timeout + 5
+        while self.workers and time.monotonic() < deadline:
+            self.reap()
+            time.sleep(0.1)
+        for pid in self.workers:
+            print(f"Worker {pid} did not stop in time; killing it")
+            try:
+                os.kill(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+            except (ProcessLookupError, ChildProcessError):
+                pass
+        self.sock.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=WEB_CONCURRENCY, help="default: WEB_CONCURRENCY or CPU count")
+    parser.add_argument("--graceful-timeout", type=float, default=GRACEFUL_TIMEOUT,
+                        help="seconds a stopping worker may spend finishing in-flight requests")
+    parser.add_argument("--keep-alive", type=int, default=5, help="idle keep-alive connection timeout (seconds)")
+    parser.add_argument("--no-preload", dest="preload", action="store_false",
+                        help="import the app in each worker instead of once before forking")
+    parser.add_argument("--log-level", default="warning")
+    args = parser.parse_args()
+
+    # Read by the app at import time, so set before any worker loads it (.env values still win)
+    load_dotenv()
+    os.environ.setdefault("SHARED_STATE_PATH", os.path.join(BACKEND_DIR, "crm_shared_state.db"))
+    os.environ.setdefault("LLM_CACHE_PATH", os.path.join(BACKEND_DIR, "llm_cache.db"))
+
+    sock = bind_socket(args.host, args.port)
+    app = load_app() if args.preload else None
+    Supervisor(app, sock, args).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""State shared by every worker process on one box.
+
+serve.py runs several worker processes. Left alone, each would keep its
+own rate-limit buckets and circuit breaker, so N workers would send N times
+the allowed request rate and keep calling an upstream another worker
+already knows is down. Components given a SharedStore keep that state in
+one row of a local SQLite file (WAL mode) and read-modify-write it inside
+BEGIN IMMEDIATE, which serialises updates across processes. That write
+can wait up to busy_timeout on another worker's lock, so callers on the
+event loop go through `change`, which runs it in a worker thread. `read`
+uses a separate connection per thread and takes no lock: under WAL a
+reader sees the last committed state without waiting for a writer. Without SHARED_STATE_PATH everything stays
+in process memory, as before.
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+SHARED_STATE_PATH = os.getenv("SHARED_STATE_PATH", "")  # empty keeps state per process
+
+
+class SharedStore:
+    """JSON documents in a SQLite file, updated atomically across threads and processes"""
+
+    def __init__(self, path, busy_timeout=10.0):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self._db = None
+        self._lock = threading.Lock()
+        self._readers = threading.local()
+
+    def after_fork(self):
+        # A SQLite connection must not cross fork(); the child opens its own on first use
+        self._db = None
+        self._lock = threading.Lock()
+        self._readers = threading.local()
+
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=self.busy_timeout, check_same_thread=False, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute("CREATE TABLE IF NOT EXISTS shared_state (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        return db
+
+    def _connection(self):
+        if self._db is None:
+            self._db = self._connect()
+        return self._db
+
+    def _reader(self):
+        db = getattr(self._readers, "db", None)
+        if db is None:
+            db = self._readers.db = self._connect()
+        return db
+
+    @contextmanager
+    def update(self, key):
+        """Yields the document stored under `key` ({} if none) and writes back any changes atomically"""
+        with self._lock:
+            db = self._connection()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                row = db.execute("SELECT value FROM shared_state WHERE key = ?", (key,)).fetchone()
+                state = json.loads(row[0]) if row else {}
+                yield state
+                value = json.dumps(state, sort_keys=True)
+                if row is None or value != row[0]:
+                    db.execute("INSERT OR REPLACE INTO shared_state (key, value) VALUES (?, ?)", (key, value))
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+
+    def read(self, key):
+        """The document stored under `key` ({} if none), without taking the write lock"""
+        row = self._reader().execute("SELECT value FROM shared_state WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else {}
+
+    async def change(self, apply, *args):
+        """Run `apply(*args)`, which calls update(), in a worker thread so the event loop never waits on the lock"""
+        return await asyncio.to_thread(apply, *args)
+
+
+def open_shared_store(path=SHARED_STATE_PATH):
+    """The store named by SHARED_STATE_PATH, or None to keep state in this process"""
+    return SharedStore(path) if path else None
@@ -7,7 +7,7 @@ function ChatInterface() {
   const [input, setInput] = useState('')
   const [connectionStatus, setConnectionStatus] = useState('checking')
   const dispatch = useDispatch()
-  const { messages, loading, error } = useSelector(state => state.chat)
+  const { messages, loading, error, streamingText } = useSelector(state => state.chat)
   const messagesEndRef = useRef(null)
 
   const scrollToBottom = () => {
@@ -16,7 +16,7 @@ function ChatInterface() {
 
   useEffect(() => {
     scrollToBottom()
-  }, [messages])
+  }, [messages, streamingText])
 
   // Check backend connection
   useEffect(() => {
@@ -87,7 +87,11 @@ function ChatInterface() {
         
         {loading && (
           <div className="message ai-message">
-            <div className="loading">🤖 AI is analyzing... Please wait</div>
+            {streamingText ? (
+              <div className="message-content">{streamingText}</div>
+            ) : (
+              <div className="loading">🤖 AI is analyzing... Please wait</div>
+            )}
           </div>
         )}
         
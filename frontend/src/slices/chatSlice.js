@@ -1,13 +1,70 @@
 import { createSlice, createAsyncThunk } from '@reduxjs/toolkit'
-import axios from 'axios'
 
 const API_BASE = 'http://localhost:8000'
 
+// Parse one server-sent event frame ("event: ...\ndata: ...") from /chat/stream
+const parseEvent = (frame) => {
+  let event = 'message'
+  let data = ''
+  for (const line of frame.split('\n')) {
+    if (line.startsWith('event:')) event = line.slice(6).trim()
+    else if (line.startsWith('data:')) data += line.slice(5).trim()
+  }
+  return { event, data: data ? JSON.parse(data) : null }
+}
+
+// Analysis fields from `field` frames, mapped onto the interaction form as soon as they arrive
+const FIELD_TO_FORM = {
+  summary: (value) => ({ voice_note_summary: value }),
+  sentiment: (value) => ({ hcp_sentiment: value }),
+  topics: (value) => ({ topics_discussed: value.join(', ') }),
+  next_action: (value) => ({ follow_up_actions: value })
+}
+
+// Streams the reply: `token` frames are shown as they arrive, the `final` frame has the same shape as /chat.
+// The session id from the previous reply is sent back so the server keeps the conversation's context
 export const sendMessage = createAsyncThunk(
   'chat/sendMessage',
-  async (message) => {
-    const response = await axios.post(`${API_BASE}/chat`, { message })
-    return { message, response: response.data }
+  async (message, { dispatch, getState }) => {
+    const { sessionId } = getState().chat
+    const response = await fetch(`${API_BASE}/chat/stream`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify(sessionId ? { message, session_id: sessionId } : { message })
+    })
+    if (!response.ok || !response.body) {
+      throw new Error(`Request failed with status ${response.status}`)
+    }
+
+    const reader = response.body.getReader()
+    const decoder = new TextDecoder()
+    let buffer = ''
+    let finalResponse = null
+
+    while (true) {
+      const { value, done } = await reader.read()
+      if (done) break
+      buffer += decoder.decode(value, { stream: true })
+
+      let boundary
+      while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+        const { event, data } = parseEvent(buffer.slice(0, boundary))
+        buffer = buffer.slice(boundary + 2)
+        if (event === 'token') {
+          dispatch(streamToken(data.text))
+        } else if (event === 'field') {
+          const toForm = FIELD_TO_FORM[data.name]
+          if (toForm) dispatch(updateFormData(toForm(data.value)))
+        } else if (event === 'final') {
+          finalResponse = data
+        }
+      }
+    }
+
+    if (!finalResponse) {
+      throw new Error('Stream ended before the final response')
+    }
+    return { message, response: finalResponse }
   }
 )
 
@@ -17,6 +74,9 @@ const chatSlice = createSlice({
     messages: [],
     loading: false,
     error: null,
+    streamingText: '',
+    // Issued by the server in each reply; a new one is issued if it has expired
+    sessionId: null,
     mode: 'both',
     // Form data that AI will fill
     formData: {
@@ -41,6 +101,10 @@ const chatSlice = createSlice({
     },
     clearMessages: (state) => {
       state.messages = []
+      state.sessionId = null
+    },
+    streamToken: (state, action) => {
+      state.streamingText += action.payload
     },
     updateFormData: (state, action) => {
       state.formData = { ...state.formData, ...action.payload }
@@ -65,19 +129,22 @@ const chatSlice = createSlice({
   },
   extraReducers: (builder) => {
     builder
-      .addCase(sendMessage.pending, (state) => {
+      .addCase(sendMessage.pending, (state, action) => {
         state.loading = true
         state.error = null
-      })
-      .addCase(sendMessage.fulfilled, (state, action) => {
-        state.loading = false
+        state.streamingText = ''
         
-        // Add user message
+        // Add user message right away; the AI reply streams in below it
         state.messages.push({
           type: 'user',
-          content: action.payload.message,
+          content: action.meta.arg,
           timestamp: new Date().toISOString()
         })
+      })
+      .addCase(sendMessage.fulfilled, (state, action) => {
+        state.loading = false
+        state.streamingText = ''
+        state.sessionId = action.payload.response.session_id || state.sessionId
         
         // Add AI response
         state.messages.push({
@@ -212,10 +279,11 @@ const chatSlice = createSlice({
       })
       .addCase(sendMessage.rejected, (state, action) => {
         state.loading = false
+        state.streamingText = ''
         state.error = action.error.message
       })
   }
 })
 
-export const { setMode, clearMessages, updateFormData, clearFormData } = chatSlice.actions
+export const { setMode, clearMessages, streamToken, updateFormData, clearFormData } = chatSlice.actions
 export default chatSlice.reducer
\ No newline at end of file
@@ -6,7 +6,7 @@ echo.
 
 echo [1/3] Installing Backend Dependencies...
 cd backend
-pip install fastapi uvicorn langgraph langchain langchain-groq python-dotenv sqlalchemy python-multipart
+pip install -r requirements.txt
 
 echo.
 echo [2/3] Starting Backend Server...